@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AuthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'auth'
+    # 'auth' is the label of django.contrib.auth
+    label = 'api_auth'
+
+    def ready(self):
+        from auth import signals  # noqa: F401
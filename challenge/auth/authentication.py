@@ -1,9 +1,15 @@
-from rest_framework.authentication import TokenAuthentication
+from asgiref.sync import sync_to_async
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
 from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import AuthenticationFailed
 from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from auth import signing
+from auth.cache import token_cache
+
+User = get_user_model()
 
 
 class TokenHandler:
@@ -11,10 +17,20 @@ class TokenHandler:
     If token is expired then it will be removed
     """
 
+    @classmethod
+    def expires_at(cls, token):
+        return token.created + timedelta(days = settings.TOKEN_EXPIRATION)
+
+    @classmethod
+    def expired_before(cls, now):
+        """
+        Tokens created before the returned time are expired at now
+        """
+        return now - timedelta(days = settings.TOKEN_EXPIRATION)
+
     @classmethod
     def expiration_handle(cls, token, is_login=False):
-        time_elapsed = timezone.now() - token.created
-        left_time = timedelta(days = settings.TOKEN_EXPIRATION) - time_elapsed
+        left_time = cls.expires_at(token) - timezone.now()
         is_expired = left_time < timedelta(seconds = 0)
 
         if is_expired and is_login:
@@ -31,16 +47,175 @@ class TokenAuthenticationV2(TokenAuthentication):
     """
 
     def authenticate_credentials(self, key):
-        try:
-            token = Token.objects.get(key = key)
-        except Token.DoesNotExist:
+        """
+        A cached token is checked the same way as a fetched one, without any query
+        """
+        cached = token_cache.get(key)
+
+        if cached is None:
+            try:
+                token = Token.objects.select_related('user').get(key = key)
+            except Token.DoesNotExist:
+                raise AuthenticationFailed("Invalid token")
+            user = token.user
+        else:
+            user, token = cached
+
+        if user is None:
+            # Only the shared cache had the token, it does not keep users
+            user = User.objects.filter(pk = token.user_id).first()
+            if user is None:
+                raise AuthenticationFailed("Invalid token")
+            token.user = user
+
+        self.check(user, token)
+
+        if cached is None:
+            token_cache.set(key, user, token, TokenHandler.expires_at(token).timestamp())
+        elif cached[0] is None:
+            token_cache.remember(key, user, token, TokenHandler.expires_at(token).timestamp())
+
+        return (user, token)
+
+    def check(self, user, token):
+        if not user.is_active:
+            raise AuthenticationFailed("User inactive or deleted")
+
+        is_expired, token = TokenHandler.expiration_handle(token)
+        if is_expired:
+            raise AuthenticationFailed("Expired Token")
+
+
+class SignedTokenAuthentication(TokenAuthentication):
+    """
+    Stateless alternative to TokenAuthenticationV2: the HMAC of the token proves it, the
+    database only keeps the revoked ones. Other keys are left to the next authentication class
+    """
+
+    def authenticate_credentials(self, key):
+        if not signing.is_signed(key):
+            return None
+
+        token = signing.verify(key)
+        if token is None or token.jti in signing.deny_list:
             raise AuthenticationFailed("Invalid token")
-        
-        if not token.user.is_active:
+
+        self.check(token)
+        user = self.get_user(token)
+        if user is None or not user.is_active:
             raise AuthenticationFailed("User inactive or deleted")
 
+        return (user, token)
+
+    def check(self, token):
         is_expired, token = TokenHandler.expiration_handle(token)
         if is_expired:
             raise AuthenticationFailed("Expired Token")
-        
-        return (token.user, token)
+
+    def get_user(self, token):
+        """
+        Users are cached by id in the local entries of the token cache (never in the shared
+        one), invalidated the same way as tokens
+        """
+        cache_key = signing.user_cache_key(token.user_id)
+        cached = token_cache.get_local(cache_key)
+        if cached is not None:
+            return cached[0]
+
+        user = User.objects.filter(pk=token.user_id).first()
+        if user is not None and user.is_active:
+            token_cache.remember(cache_key, user, None, TokenHandler.expires_at(token).timestamp())
+        return user
+
+
+class AsyncTokenAuthenticationMixin:
+    """
+    aauthenticate() for the async views: the header is read like TokenAuthentication does
+    and the credentials are checked by aauthenticate_credentials()
+    """
+
+    def get_key(self, request):
+        auth = get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) == 1:
+            raise AuthenticationFailed("Invalid token header. No credentials provided.")
+        elif len(auth) > 2:
+            raise AuthenticationFailed("Invalid token header. Token string should not contain spaces.")
+
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed("Invalid token header. Token string should not contain invalid characters.")
+
+    async def aauthenticate(self, request):
+        key = self.get_key(request)
+        if key is None:
+            return None
+        return await self.aauthenticate_credentials(key)
+
+
+class AsyncTokenAuthenticationV2(AsyncTokenAuthenticationMixin, TokenAuthenticationV2):
+
+    async def aauthenticate_credentials(self, key):
+        cached = await token_cache.aget(key)
+
+        if cached is None:
+            try:
+                token = await Token.objects.select_related('user').aget(key = key)
+            except Token.DoesNotExist:
+                raise AuthenticationFailed("Invalid token")
+            user = token.user
+        else:
+            user, token = cached
+
+        if user is None:
+            user = await User.objects.filter(pk = token.user_id).afirst()
+            if user is None:
+                raise AuthenticationFailed("Invalid token")
+            token.user = user
+
+        self.check(user, token)
+
+        if cached is None:
+            await token_cache.aset(key, user, token, TokenHandler.expires_at(token).timestamp())
+        elif cached[0] is None:
+            token_cache.remember(key, user, token, TokenHandler.expires_at(token).timestamp())
+
+        return (user, token)
+
+
+class AsyncSignedTokenAuthentication(AsyncTokenAuthenticationMixin, SignedTokenAuthentication):
+
+    async def aauthenticate_credentials(self, key):
+        if not signing.is_signed(key):
+            return None
+
+        token = signing.verify(key)
+        if token is None:
+            raise AuthenticationFailed("Invalid token")
+
+        # Only queries once every AUTH_DENY_LIST_REFRESH seconds
+        await sync_to_async(signing.deny_list.refresh)()
+        if token.jti in signing.deny_list.ids:
+            raise AuthenticationFailed("Invalid token")
+
+        self.check(token)
+        user = await self.aget_user(token)
+        if user is None or not user.is_active:
+            raise AuthenticationFailed("User inactive or deleted")
+
+        return (user, token)
+
+    async def aget_user(self, token):
+        cache_key = signing.user_cache_key(token.user_id)
+        cached = token_cache.get_local(cache_key)
+        if cached is not None:
+            return cached[0]
+
+        user = await User.objects.filter(pk=token.user_id).afirst()
+        if user is not None and user.is_active:
+            token_cache.remember(cache_key, user, None, TokenHandler.expires_at(token).timestamp())
+        return user
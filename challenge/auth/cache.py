@@ -0,0 +1,117 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authtoken.models import Token
+
+
+class TokenCache:
+    """
+    Token key -> (user, token) of the authenticated tokens: a per-process LRU in front of
+    the shared cache. The shared cache only keeps the user id and the token creation time,
+    the users (and their password hashes) stay in the process, loaded by id on a local miss.
+    No entry outlives its token. The local entries are not invalidated across processes, so
+    another process may accept a revoked token for up to AUTH_TOKEN_CACHE_LOCAL_TIMEOUT seconds
+    """
+    prefix = 'auth:token:'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    @property
+    def cache(self):
+        return caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+
+    def key(self, key):
+        # Token keys are credentials, they are not written in clear to the shared cache
+        return self.prefix + sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Returns (user, token), (None, token) when only the shared cache knows the token,
+        or None. The user is a copy, requests do not share instances
+        """
+        cached = self.get_local(key)
+        if cached is not None or settings.AUTH_TOKEN_CACHE_TIMEOUT <= 0:
+            return cached
+        return self.token(key, self.cache.get(self.key(key)))
+
+    async def aget(self, key):
+        cached = self.get_local(key)
+        if cached is not None or settings.AUTH_TOKEN_CACHE_TIMEOUT <= 0:
+            return cached
+        return self.token(key, await self.cache.aget(self.key(key)))
+
+    def token(self, key, value):
+        if value is None:
+            return None
+        user_id, created = value
+        return None, Token(key=key, user_id=user_id, created=created)
+
+    def get_local(self, key):
+        if settings.AUTH_TOKEN_CACHE_TIMEOUT <= 0:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                del self.entries[key]
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+        if entry is None:
+            return None
+        _, user, token = entry
+        return copy.copy(user), token
+
+    def set(self, key, user, token, expires_at):
+        """
+        expires_at is the unix time at which the token expires
+        """
+        timeout = min(settings.AUTH_TOKEN_CACHE_TIMEOUT, expires_at - time.time())
+        if timeout <= 0:
+            return
+
+        self.cache.set(self.key(key), (token.user_id, token.created), timeout)
+        self.remember(key, user, token, expires_at)
+
+    async def aset(self, key, user, token, expires_at):
+        timeout = min(settings.AUTH_TOKEN_CACHE_TIMEOUT, expires_at - time.time())
+        if timeout <= 0:
+            return
+
+        await self.cache.aset(self.key(key), (token.user_id, token.created), timeout)
+        self.remember(key, user, token, expires_at)
+
+    def remember(self, key, user, token, expires_at):
+        """
+        Keeps the entry in this process only
+        """
+        now = time.time()
+        expires_at = min(now + settings.AUTH_TOKEN_CACHE_LOCAL_TIMEOUT, expires_at)
+        if settings.AUTH_TOKEN_CACHE_TIMEOUT <= 0 or expires_at <= now:
+            return
+
+        with self.lock:
+            self.entries[key] = (expires_at, user, token)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_TOKEN_CACHE_LOCAL_SIZE:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        self.cache.delete_many([self.key(key) for key in keys])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
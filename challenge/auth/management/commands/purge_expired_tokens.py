@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from auth.purge import purge_expired
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes the tokens older than TOKEN_EXPIRATION, and the revocations of expired signed tokens, '
+        'in bounded batches with a pause between them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.AUTH_TOKEN_PURGE_BATCH_SIZE)
+        parser.add_argument('--sleep', type=float, default=settings.AUTH_TOKEN_PURGE_SLEEP, help='Seconds between batches')
+
+    def handle(self, *args, **options):
+        totals = {}
+
+        for model, rows, seconds in purge_expired(options['batch_size'], options['sleep']):
+            name = model._meta.db_table
+            totals[name] = totals.get(name, 0) + rows
+            self.stdout.write('%s: %d rows purged in %.1f ms' % (name, rows, seconds * 1000))
+
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join('%s: %d' % (name, rows) for name, rows in totals.items())
+        ))
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('api_auth', '0001_initial'),
+        ('authtoken', '0003_tokenproxy'),
+    ]
+
+    operations = [
+        # authtoken_token belongs to rest_framework.authtoken, the index is only created in the database
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS authtoken_token_created_idx ON authtoken_token (created)',
+            'DROP INDEX CONCURRENTLY IF EXISTS authtoken_token_created_idx',
+        ),
+    ]
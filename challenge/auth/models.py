@@ -1,3 +1,12 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class RevokedToken(models.Model):
+    """
+    Deny-list of the logged out signed tokens, kept until they would have expired anyway
+    """
+    jti = models.CharField(max_length=32, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+    # Watermark of the incremental deny-list refresh
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
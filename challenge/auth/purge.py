@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from auth.authentication import TokenHandler
+from auth.models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+# The oldest expired rows first, the index on the column serves both the filter and the order
+PURGE_BATCH = '''
+    DELETE FROM {table} WHERE {pk} IN (
+        SELECT {pk} FROM {table} WHERE {column} < %s ORDER BY {column} LIMIT %s
+    )
+'''
+
+
+def purge_batches(model, column, cutoff, batch_size, sleep):
+    """
+    Deletes the rows of model whose column is before cutoff, one short transaction per batch
+    so no lock is held for long, sleeping between batches. Yields (rows, seconds) per batch
+    """
+    sql = PURGE_BATCH.format(
+        table=connection.ops.quote_name(model._meta.db_table),
+        pk=connection.ops.quote_name(model._meta.pk.column),
+        column=connection.ops.quote_name(column),
+    )
+
+    while True:
+        started = time.monotonic()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [cutoff, batch_size])
+            rows = cursor.rowcount
+        yield rows, time.monotonic() - started
+
+        if rows < batch_size:
+            return
+        time.sleep(sleep)
+
+
+def purge_expired(batch_size, sleep):
+    """
+    Purges the expired tokens, then the revocations of signed tokens that expired too.
+    Cached tokens never outlive their expiry, so there is nothing to invalidate.
+    Yields (model, rows, seconds) per batch
+    """
+    now = timezone.now()
+    targets = [
+        (Token, 'created', TokenHandler.expired_before(now)),
+        (RevokedToken, 'expires_at', now),
+    ]
+
+    for model, column, cutoff in targets:
+        for rows, seconds in purge_batches(model, column, cutoff, batch_size, sleep):
+            yield model, rows, seconds
+
+
+class PurgeThread(threading.Thread):
+    """
+    In-process alternative to a scheduled purge_expired_tokens, see AUTH_TOKEN_PURGE_INTERVAL
+    """
+
+    def __init__(self, interval, batch_size, sleep):
+        super().__init__(name='purge-expired-tokens', daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.sleep = sleep
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                purged = sum(rows for _, rows, _ in purge_expired(self.batch_size, self.sleep))
+                logger.info('Purged %d expired tokens and revocations', purged)
+            except Exception:
+                logger.exception('Purging the expired tokens failed')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_purge_thread():
+    """
+    Starts a PurgeThread when AUTH_TOKEN_PURGE_INTERVAL is positive. Only the WSGI and ASGI
+    entry points call it, management commands, shells and tests never purge in the background
+    """
+    if settings.AUTH_TOKEN_PURGE_INTERVAL <= 0:
+        return None
+
+    thread = PurgeThread(
+        settings.AUTH_TOKEN_PURGE_INTERVAL, settings.AUTH_TOKEN_PURGE_BATCH_SIZE, settings.AUTH_TOKEN_PURGE_SLEEP
+    )
+    thread.start()
+    return thread
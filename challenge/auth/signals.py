@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from auth import signing
+from auth.cache import token_cache
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_inactive_user_tokens(sender, instance, created, **kwargs):
+    if not created and not instance.is_active:
+        keys = Token.objects.filter(user=instance).values_list('key', flat=True)
+        token_cache.invalidate(signing.user_cache_key(instance.pk), *keys)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_deleted_user_tokens(sender, instance, **kwargs):
+    # The tokens are already gone by post_delete, deleted in cascade
+    keys = Token.objects.filter(user=instance).values_list('key', flat=True)
+    token_cache.invalidate(signing.user_cache_key(instance.pk), *keys)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
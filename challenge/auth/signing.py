@@ -0,0 +1,126 @@
+import base64
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from auth.models import RevokedToken
+
+SALT = 'auth.signing.SignedToken'
+
+
+class SignedToken:
+    """
+    Stateless token: 'version.user_id.issued_at.jti.signature'. It has the key and created
+    attributes of a Token, so TokenHandler computes its expiry the same way
+    """
+
+    def __init__(self, key, version, user_id, issued_at, jti):
+        self.key = key
+        self.version = version
+        self.user_id = user_id
+        self.created = datetime.fromtimestamp(issued_at, dt_timezone.utc)
+        self.jti = jti
+
+    def __str__(self):
+        return self.key
+
+
+def is_signed(key):
+    # Database tokens are hex digests
+    return '.' in key
+
+
+def user_cache_key(user_id):
+    return 'signed-user:%s' % user_id
+
+
+def signature(version, payload):
+    digest = salted_hmac(SALT, payload, secret=settings.AUTH_SIGNING_KEYS[version], algorithm='sha256').digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+def issue(user):
+    version = settings.AUTH_SIGNING_KEY_ID
+    issued_at = int(time.time())
+    jti = secrets.token_hex(8)
+
+    payload = '%s.%s.%d.%s' % (version, user.pk, issued_at, jti)
+    key = '%s.%s' % (payload, signature(version, payload))
+    return SignedToken(key, version, user.pk, issued_at, jti)
+
+
+def verify(key):
+    """
+    Returns the SignedToken of a well formed and correctly signed key, None otherwise
+    """
+    payload, _, sent = key.rpartition('.')
+    parts = payload.split('.')
+    if len(parts) != 4 or parts[0] not in settings.AUTH_SIGNING_KEYS:
+        return None
+
+    if not constant_time_compare(signature(parts[0], payload), sent):
+        return None
+
+    version, user_id, issued_at, jti = parts
+    try:
+        return SignedToken(key, version, int(user_id), int(issued_at), jti)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+class DenyList:
+    """
+    In-memory copy of the revoked token ids, refreshed every AUTH_DENY_LIST_REFRESH seconds.
+    A refresh only reads the revocations created since the previous one (less
+    AUTH_DENY_LIST_LAG seconds, for clock skew and late commits) and drops the expired ids
+    locally. A logout is seen at once by its own process and within that interval by the others
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.expiries = {}
+        self.ids = frozenset()
+        self.loaded_at = None
+        self.watermark = None
+
+    def __contains__(self, jti):
+        self.refresh()
+        return jti in self.ids
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self.loaded_at is not None and now - self.loaded_at < settings.AUTH_DENY_LIST_REFRESH:
+            return
+
+        started = timezone.now()
+        revoked = RevokedToken.objects.filter(expires_at__gt=started)
+        if self.watermark is not None:
+            revoked = revoked.filter(created_at__gte=self.watermark - timedelta(seconds=settings.AUTH_DENY_LIST_LAG))
+        rows = list(revoked.values_list('jti', 'expires_at'))
+
+        with self.lock:
+            expiries = {jti: expires_at for jti, expires_at in self.expiries.items() if expires_at > started}
+            expiries.update(rows)
+            self.expiries = expiries
+            self.ids = frozenset(expiries)
+            self.loaded_at = now
+            self.watermark = started
+
+    def clear(self):
+        with self.lock:
+            self.expiries = {}
+            self.ids = frozenset()
+            self.loaded_at = None
+            self.watermark = None
+
+    def revoke(self, token, expires_at):
+        RevokedToken.objects.bulk_create([RevokedToken(jti=token.jti, expires_at=expires_at)], ignore_conflicts=True)
+        with self.lock:
+            self.expiries = dict(self.expiries, **{token.jti: expires_at})
+            self.ids = self.ids | {token.jti}
+
+
+deny_list = DenyList()
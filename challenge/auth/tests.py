@@ -1,14 +1,26 @@
-from django.test import TestCase
+import io
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from rest_framework import status
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
 from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
-from auth.authentication import TokenHandler, TokenAuthenticationV2
+from auth import signing
+from auth.authentication import SignedTokenAuthentication, TokenHandler, TokenAuthenticationV2
+from auth.models import RevokedToken
+from auth.cache import token_cache
+from auth.purge import start_purge_thread
 
 
+@override_settings(QUERY_BUDGET_ENFORCE=True, QUERY_INSPECTOR_RAISE=True)
 class AuthViewsTestCase(TestCase):
     def setUp(self):
         self.user_data = {
@@ -226,6 +238,8 @@ class AuthViewsTestCase(TestCase):
 
 class AuthenticationTestCase(TestCase):
     def setUp(self):
+        cache.clear()
+        token_cache.clear()
         self.user = User.objects.create_user(username='testuser', password='testpassword', email='test@example.com')
         self.token = Token.objects.create(user=self.user)
 
@@ -249,3 +263,234 @@ class AuthenticationTestCase(TestCase):
         
         self.assertIsNotNone(token)
         self.assertNotEqual(token, self.token)
+
+    def test_cached_token_authenticates_without_queries(self):
+        authentication = TokenAuthenticationV2()
+        authentication.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(0):
+            user, token = authentication.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(token, self.token)
+
+    def test_shared_cache_keeps_no_user(self):
+        authentication = TokenAuthenticationV2()
+        authentication.authenticate_credentials(self.token.key)
+
+        self.assertEqual(token_cache.cache.get(token_cache.key(self.token.key)), (self.user.pk, self.token.created))
+
+        # Another process: the user is loaded by id
+        token_cache.clear()
+        with self.assertNumQueries(1):
+            user, token = authentication.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(token, self.token)
+        self.assertEqual(token.user, self.user)
+
+        with self.assertNumQueries(0):
+            authentication.authenticate_credentials(self.token.key)
+
+    def test_cached_token_invalidated_when_deleted(self):
+        authentication = TokenAuthenticationV2()
+        authentication.authenticate_credentials(self.token.key)
+
+        Token.objects.filter(pk=self.token.pk).delete()
+
+        self.assertIsNone(token_cache.get(self.token.key))
+        with self.assertRaisesMessage(AuthenticationFailed, 'Invalid token'):
+            authentication.authenticate_credentials(self.token.key)
+
+    def test_cached_token_still_expires(self):
+        authentication = TokenAuthenticationV2()
+        authentication.authenticate_credentials(self.token.key)
+
+        later = timezone.now() + timedelta(days=settings.TOKEN_EXPIRATION, seconds=1)
+        with mock.patch('auth.authentication.timezone.now', return_value=later), self.assertNumQueries(0):
+            with self.assertRaisesMessage(AuthenticationFailed, 'Expired Token'):
+                authentication.authenticate_credentials(self.token.key)
+
+    def test_cached_token_invalidated_when_user_deactivated(self):
+        authentication = TokenAuthenticationV2()
+        authentication.authenticate_credentials(self.token.key)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaisesMessage(AuthenticationFailed, 'User inactive or deleted'):
+            authentication.authenticate_credentials(self.token.key)
+
+    def test_cached_token_invalidated_on_logout_and_rotation(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.assertEqual(client.post('/api/v1/auth/logout/').status_code, status.HTTP_200_OK)
+
+        response = client.post('/api/v1/auth/logout/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data, {'detail': 'Invalid token'})
+
+        token = Token.objects.create(user=self.user)
+        TokenAuthenticationV2().authenticate_credentials(token.key)
+        key = token.key
+        token.created = timezone.now() - timedelta(days=settings.TOKEN_EXPIRATION + 1)
+
+        TokenHandler.expiration_handle(token, is_login=True)
+        self.assertIsNone(token_cache.get(key))
+
+
+class SignedTokenAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        signing.deny_list.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword', email='test@example.com')
+        self.client = APIClient()
+
+    @override_settings(AUTH_TOKEN_TYPE='signed')
+    def test_login_issues_signed_token_revoked_on_logout(self):
+        response = self.client.post('/api/v1/auth/login/', {'username': 'testuser', 'password': 'testpassword'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Token.objects.exists())
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + response.data['token'])
+        self.assertEqual(self.client.post('/api/v1/auth/logout/').status_code, status.HTTP_200_OK)
+
+        response = self.client.post('/api/v1/auth/logout/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data, {'detail': 'Invalid token'})
+
+    def test_signed_token_verified_without_queries(self):
+        token = signing.issue(self.user)
+        authentication = SignedTokenAuthentication()
+        authentication.authenticate_credentials(token.key)
+
+        with self.assertNumQueries(0):
+            user, auth = authentication.authenticate_credentials(token.key)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(auth.jti, token.jti)
+
+    def test_tampered_token_rejected_and_database_tokens_left_to_next_class(self):
+        key = signing.issue(self.user).key
+        version, user_id, rest = key.split('.', 2)
+        tampered = '.'.join([version, str(int(user_id) + 1), rest])
+
+        with self.assertRaisesMessage(AuthenticationFailed, 'Invalid token'):
+            SignedTokenAuthentication().authenticate_credentials(tampered)
+
+        token = Token.objects.create(user=self.user)
+        self.assertIsNone(SignedTokenAuthentication().authenticate_credentials(token.key))
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.assertEqual(self.client.post('/api/v1/auth/logout/').status_code, status.HTTP_200_OK)
+
+    def test_signed_token_expiry_matches_token_handler(self):
+        signed = signing.issue(self.user)
+        token = Token.objects.create(user=self.user)
+        token.created = signed.created
+        expires_at = TokenHandler.expires_at(token)
+
+        for offset in (timedelta(days=-1), timedelta(seconds=-1), timedelta(seconds=1), timedelta(days=1)):
+            with mock.patch('auth.authentication.timezone.now', return_value=expires_at + offset):
+                self.assertEqual(TokenHandler.expiration_handle(signed)[0], TokenHandler.expiration_handle(token)[0])
+
+                if TokenHandler.expiration_handle(token)[0]:
+                    with self.assertRaisesMessage(AuthenticationFailed, 'Expired Token'):
+                        SignedTokenAuthentication().authenticate_credentials(signed.key)
+                else:
+                    SignedTokenAuthentication().authenticate_credentials(signed.key)
+
+    @override_settings(AUTH_DENY_LIST_REFRESH=0)
+    def test_revocation_from_another_process_seen_after_refresh(self):
+        token = signing.issue(self.user)
+        SignedTokenAuthentication().authenticate_credentials(token.key)
+
+        RevokedToken.objects.create(jti=token.jti, expires_at=TokenHandler.expires_at(token))
+
+        with self.assertRaisesMessage(AuthenticationFailed, 'Invalid token'):
+            SignedTokenAuthentication().authenticate_credentials(token.key)
+
+    @override_settings(AUTH_DENY_LIST_REFRESH=0)
+    def test_deny_list_refresh_reads_new_revocations_only(self):
+        now = timezone.now()
+        RevokedToken.objects.create(jti='old', expires_at=now + timedelta(days=1), created_at=now - timedelta(days=1))
+        RevokedToken.objects.create(jti='expiring', expires_at=now + timedelta(hours=1), created_at=now - timedelta(days=1))
+        signing.deny_list.refresh()
+        self.assertEqual(signing.deny_list.ids, {'old', 'expiring'})
+
+        RevokedToken.objects.create(jti='new', expires_at=now + timedelta(days=1))
+        with mock.patch('auth.signing.timezone.now', return_value=now + timedelta(hours=2)):
+            with CaptureQueriesContext(connection) as queries:
+                signing.deny_list.refresh()
+
+        self.assertEqual(signing.deny_list.ids, {'old', 'new'})
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"created_at" >=', queries[0]['sql'])
+
+    def test_signing_key_rotation(self):
+        with override_settings(AUTH_SIGNING_KEYS={'1': 'old-secret'}, AUTH_SIGNING_KEY_ID='1'):
+            old = signing.issue(self.user)
+
+        with override_settings(AUTH_SIGNING_KEYS={'2': 'new-secret', '1': 'old-secret'}, AUTH_SIGNING_KEY_ID='2'):
+            self.assertTrue(signing.issue(self.user).key.startswith('2.'))
+            SignedTokenAuthentication().authenticate_credentials(old.key)
+
+        with override_settings(AUTH_SIGNING_KEYS={'2': 'new-secret'}, AUTH_SIGNING_KEY_ID='2'):
+            with self.assertRaisesMessage(AuthenticationFailed, 'Invalid token'):
+                SignedTokenAuthentication().authenticate_credentials(old.key)
+
+    def test_deactivated_user_rejected(self):
+        token = signing.issue(self.user)
+        SignedTokenAuthentication().authenticate_credentials(token.key)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaisesMessage(AuthenticationFailed, 'User inactive or deleted'):
+            SignedTokenAuthentication().authenticate_credentials(token.key)
+
+
+class PurgeExpiredTokensTestCase(TestCase):
+    def setUp(self):
+        expired = timezone.now() - timedelta(days=settings.TOKEN_EXPIRATION, seconds=1)
+        self.users = [User.objects.create_user(username='testuser%d' % index, password='testpassword') for index in range(6)]
+
+        for index, user in enumerate(self.users):
+            token = Token.objects.create(user=user)
+            if index < 5:
+                Token.objects.filter(pk=token.pk).update(created=expired)
+
+        RevokedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(seconds=1))
+        RevokedToken.objects.create(jti='active', expires_at=timezone.now() + timedelta(days=1))
+
+    def test_purge_expired_tokens_in_batches(self):
+        stdout = io.StringIO()
+        call_command('purge_expired_tokens', batch_size=2, sleep=0, stdout=stdout)
+
+        self.assertEqual(list(Token.objects.values_list('user', flat=True)), [self.users[5].pk])
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['active'])
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual([line.split(' rows')[0] for line in lines[:-1]], [
+            'authtoken_token: 2', 'authtoken_token: 2', 'authtoken_token: 1', 'api_auth_revokedtoken: 1',
+        ])
+        self.assertIn('authtoken_token: 5, api_auth_revokedtoken: 1', lines[-1])
+
+    def test_purge_uses_created_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN SELECT key FROM authtoken_token WHERE created < now() ORDER BY created LIMIT 1000')
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('authtoken_token_created_idx', plan)
+
+    def test_purge_thread_only_with_an_interval(self):
+        with mock.patch('auth.purge.PurgeThread.start') as start:
+            self.assertIsNone(start_purge_thread())
+
+            with override_settings(AUTH_TOKEN_PURGE_INTERVAL=60):
+                thread = start_purge_thread()
+
+        start.assert_called_once_with()
+        self.assertEqual(thread.interval, 60)
+        self.assertEqual(thread.batch_size, settings.AUTH_TOKEN_PURGE_BATCH_SIZE)
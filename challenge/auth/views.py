@@ -1,13 +1,17 @@
+from django.conf import settings
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.views import APIView
+from auth import signing
 from auth.authentication import TokenHandler
 from auth.serializers import UserSerializer, RegisterSerializer
+from challenge.query_budget import query_budget
 
 
+@query_budget(post=5)
 class Login(ObtainAuthToken):
 
     def post(self, request, *args, **kwargs):
@@ -15,8 +19,11 @@ class Login(ObtainAuthToken):
         login_serializer.is_valid(raise_exception=True)
 
         user = login_serializer.validated_data['user']
-        token, created = Token.objects.get_or_create(user=user)
-        _, token = TokenHandler.expiration_handle(token, is_login=True)
+        if settings.AUTH_TOKEN_TYPE == 'signed':
+            token = signing.issue(user)
+        else:
+            token, created = Token.objects.get_or_create(user=user)
+            _, token = TokenHandler.expiration_handle(token, is_login=True)
         user_serializer = UserSerializer(user)
         
         return Response(
@@ -25,6 +32,7 @@ class Login(ObtainAuthToken):
         )
 
 
+@query_budget(post=3)
 class Register(APIView):
     serializer_class = RegisterSerializer
 
@@ -36,10 +44,14 @@ class Register(APIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+@query_budget(post=3)
 class Logout(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        request.user.auth_token.delete()
+        if isinstance(request.auth, signing.SignedToken):
+            signing.deny_list.revoke(request.auth, TokenHandler.expires_at(request.auth))
+        else:
+            request.user.auth_token.delete()
 
         return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
@@ -0,0 +1,14 @@
+"""
+Standalone benchmarks. Run them from the 'challenge' folder, e.g.:
+    python -m benchmarks.wallet_id_inserts
+
+They use the database configured through the DB_* environment variables.
+"""
+import os
+
+
+def setup():
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'challenge.settings')
+    django.setup()
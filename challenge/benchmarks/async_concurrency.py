@@ -0,0 +1,109 @@
+"""
+Requests per second and latency of the customer endpoints under many concurrent slow clients,
+for servers started beforehand, e.g. the WSGI and the ASGI stacks side by side:
+
+    gunicorn challenge.wsgi --workers 4 --threads 8 --bind :8001
+    CUSTOMER_ASYNC_VIEWS=1 gunicorn challenge.asgi --workers 4 -k uvicorn.workers.UvicornWorker --bind :8002
+    python -m benchmarks.async_concurrency --url wsgi=http://localhost:8001 --url asgi=http://localhost:8002
+
+Every client sends its request in two halves --client-delay seconds apart, as a slow network
+would, and reads the response. A token and a customer are created in the database configured
+through the DB_* variables, which the servers have to share.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+from benchmarks import setup
+
+
+async def fetch(host, port, path, token, delay):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        head = 'GET %s HTTP/1.1\r\nHost: %s\r\n' % (path, host)
+        writer.write(head.encode())
+        await writer.drain()
+        await asyncio.sleep(delay)
+        writer.write(('Authorization: Token %s\r\nConnection: close\r\n\r\n' % token).encode())
+        await writer.drain()
+
+        response = await reader.read()
+        return int(response.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+
+async def client(url, paths, token, delay, deadline, latencies, errors):
+    parts = urlsplit(url)
+    index = 0
+    while time.monotonic() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+
+        start = time.perf_counter()
+        try:
+            status = await fetch(parts.hostname, parts.port or 80, path, token, delay)
+        except (OSError, IndexError, ValueError):
+            status = None
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(status)
+
+
+async def bench(name, url, paths, token, args):
+    latencies = []
+    errors = []
+    start = time.monotonic()
+    deadline = start + args.duration
+    await asyncio.gather(*(
+        client(url, paths, token, args.client_delay, deadline, latencies, errors) for _ in range(args.clients)
+    ))
+    elapsed = time.monotonic() - start
+
+    if len(latencies) < 2:
+        print('%-6s no successful requests, %d errors' % (name, len(errors)))
+        return
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print('%-6s %8.1f req/s %8.1f ms p50 %8.1f ms p99 %6d errors' % (
+        name, len(latencies) / elapsed, quantiles[49] * 1000, quantiles[98] * 1000, len(errors)
+    ))
+
+
+def create_fixtures():
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+    from customer.models import Customer, CustomerUser
+
+    user, _ = User.objects.get_or_create(username='benchmark-async')
+    token, _ = Token.objects.get_or_create(user=user)
+    customer_user, _ = CustomerUser.objects.get_or_create(
+        email='benchmark-async@example.com', defaults={'name': 'bench', 'last_name': 'mark'}
+    )
+    customer, _ = Customer.objects.get_or_create(
+        user=customer_user, defaults={'sex_tape': 'Male', 'dni': 999999001, 'birth_date': '2000-01-01T00:00:00Z'}
+    )
+    return token.key, customer.pk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', action='append', required=True, metavar='NAME=URL')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--client-delay', type=float, default=0.05)
+    args = parser.parse_args()
+
+    setup()
+    token, customer_id = create_fixtures()
+    paths = ['/api/v1/customer/?limit=10', '/api/v1/customer/%d' % customer_id]
+
+    for item in args.url:
+        name, _, url = item.partition('=')
+        asyncio.run(bench(name, url, paths, token, args))
+
+
+if __name__ == '__main__':
+    main()
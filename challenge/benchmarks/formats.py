@@ -0,0 +1,82 @@
+"""
+Payload size and encode/decode time of a customer list page per format: DRF's JSON
+renderer and parser, orjson and MessagePack, also gzipped.
+
+    python -m benchmarks.formats --pages 30 1000 10000
+
+The pages are built in memory, no database is needed.
+"""
+import argparse
+import gzip
+import io
+import time
+from datetime import datetime, timedelta, timezone
+from benchmarks import setup
+
+
+def page(size):
+    from customer.models import uuid7
+    from customer.serializers import CustomerReadSerializer
+
+    created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        {
+            'id': index, 'wallet_id': uuid7(), 'sex_tape': 'Female' if index % 2 else 'Male', 'dni': 30000000 + index,
+            'birth_date': created_at - timedelta(days=10000 + index), 'created_at': created_at + timedelta(seconds=index),
+            'user__email': 'customer%d@example.com' % index, 'user__name': 'Name%d' % index, 'user__last_name': 'Last name',
+        }
+        for index in range(size)
+    ]
+    results = CustomerReadSerializer(rows, many=True).data
+    return {'count': size, 'next': None, 'previous': None, 'results': results}
+
+
+def timed(function, min_seconds):
+    """
+    Seconds per call, calling it for at least min_seconds
+    """
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_seconds or not calls:
+        function()
+        calls += 1
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, nargs='+', default=[30, 1000, 10000])
+    parser.add_argument('--seconds', type=float, default=1, help='Minimum run time of every measure')
+    args = parser.parse_args()
+
+    setup()
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from challenge.parsers import MessagePackParser, ORJSONParser
+    from challenge.renderers import MessagePackRenderer, ORJSONRenderer
+
+    formats = [
+        ('json', JSONRenderer(), JSONParser()),
+        ('orjson', ORJSONRenderer(), ORJSONParser()),
+        ('msgpack', MessagePackRenderer(), MessagePackParser()),
+    ]
+
+    print('%8s %-13s %12s %12s %12s' % ('page', 'format', 'bytes', 'encode (ms)', 'decode (ms)'))
+    for size in args.pages:
+        data = page(size)
+        for name, renderer, format_parser in formats:
+            content = renderer.render(data)
+            encode = timed(lambda: renderer.render(data), args.seconds)
+            decode = timed(lambda: format_parser.parse(io.BytesIO(content)), args.seconds)
+            print('%8d %-13s %12d %12.3f %12.3f' % (size, name, len(content), encode * 1000, decode * 1000))
+
+            compressed = gzip.compress(content)
+            encode_gzip = timed(lambda: gzip.compress(renderer.render(data)), args.seconds)
+            decode_gzip = timed(lambda: format_parser.parse(io.BytesIO(gzip.decompress(compressed))), args.seconds)
+            print('%8d %-13s %12d %12.3f %12.3f' % (
+                size, name + '+gzip', len(compressed), encode_gzip * 1000, decode_gzip * 1000
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Rows per second of a customer list page through CustomerSerializer (select_related
+instances) and CustomerReadSerializer (values() rows), query and JSON rendering included.
+
+    python -m benchmarks.serializer_throughput --pages 30 1000 10000
+
+The customers are inserted in a transaction that is rolled back at the end.
+"""
+import argparse
+import time
+from benchmarks import setup
+
+
+def seed(rows):
+    from customer.models import Customer, CustomerUser
+
+    users = CustomerUser.objects.bulk_create(
+        CustomerUser(email='bench%d@example.com' % index, name='name%d' % index, last_name='last_name')
+        for index in range(rows)
+    )
+    Customer.objects.bulk_create(
+        Customer(user=user, sex_tape='Male', dni=90000000 + index, birth_date='2000-01-01T00:00:00Z')
+        for index, user in enumerate(users)
+    )
+
+
+def bench(render, page_size, min_seconds):
+    """
+    Pages rendered back to back for at least min_seconds, in rows per second
+    """
+    rows = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_seconds or not rows:
+        render(page_size)
+        rows += page_size
+    return rows / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, nargs='+', default=[30, 1000, 10000])
+    parser.add_argument('--seconds', type=float, default=2, help='Minimum run time of every measure')
+    args = parser.parse_args()
+
+    setup()
+    from django.db import transaction
+    from rest_framework.renderers import JSONRenderer
+    from customer.models import Customer
+    from customer.serializers import CustomerReadSerializer, CustomerSerializer
+
+    queryset = Customer.objects.select_related('user').order_by('created_at', 'id')
+    renderer = JSONRenderer()
+
+    def model_serializer(page_size):
+        return renderer.render(CustomerSerializer(queryset[:page_size], many=True).data)
+
+    def read_serializer(page_size):
+        return renderer.render(CustomerReadSerializer(CustomerReadSerializer.read_queryset(queryset)[:page_size], many=True).data)
+
+    with transaction.atomic():
+        seed(max(args.pages))
+        print('%8s %22s %22s %8s' % ('page', 'CustomerSerializer', 'CustomerReadSerializer', 'speedup'))
+        for page_size in args.pages:
+            model_rate = bench(model_serializer, page_size, args.seconds)
+            read_rate = bench(read_serializer, page_size, args.seconds)
+            print('%8d %15.0f rows/s %15.0f rows/s %7.2fx' % (page_size, model_rate, read_rate, read_rate / model_rate))
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
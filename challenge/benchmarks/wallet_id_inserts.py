@@ -0,0 +1,53 @@
+"""
+Insert throughput and unique index size for random (v4) vs time-ordered (v7) wallet ids.
+
+    python -m benchmarks.wallet_id_inserts --rows 500000 --batch 1000
+
+Each generator fills its own temporary table with a unique uuid column, like
+customer_customer.wallet_id. Bloat is the index size over its size right after a REINDEX.
+"""
+import argparse
+import time
+import uuid
+from benchmarks import setup
+
+
+def bench(cursor, name, generator, rows, batch):
+    cursor.execute('DROP TABLE IF EXISTS bench_wallet')
+    cursor.execute('CREATE TEMPORARY TABLE bench_wallet (id bigserial PRIMARY KEY, wallet_id uuid NOT NULL UNIQUE)')
+
+    start = time.perf_counter()
+    for offset in range(0, rows, batch):
+        wallet_ids = [str(generator()) for _ in range(min(batch, rows - offset))]
+        cursor.execute('INSERT INTO bench_wallet (wallet_id) SELECT unnest(%s::uuid[])', [wallet_ids])
+    elapsed = time.perf_counter() - start
+
+    cursor.execute("SELECT pg_relation_size('bench_wallet_wallet_id_key')")
+    size = cursor.fetchone()[0]
+    cursor.execute('REINDEX TABLE bench_wallet')
+    cursor.execute("SELECT pg_relation_size('bench_wallet_wallet_id_key')")
+    compact_size = cursor.fetchone()[0]
+
+    print('%-6s %12.0f rows/s %10.1f MiB index %10.1f MiB reindexed %8.2fx bloat' % (
+        name, rows / elapsed, size / 2 ** 20, compact_size / 2 ** 20, size / compact_size
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection, transaction
+    from customer.models import uuid7
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        bench(cursor, 'uuid4', uuid.uuid4, args.rows, args.batch)
+        bench(cursor, 'uuid7', uuid7, args.rows, args.batch)
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
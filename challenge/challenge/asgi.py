@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'challenge.settings')
 
 application = get_asgi_application()
+
+from auth.purge import start_purge_thread  # noqa: E402
+
+start_purge_thread()
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+
+SUFFIX = '+gzip"'
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware for the responses of RESPONSE_COMPRESSION_MIN_BYTES or more (200 at
+    least), streamed ones included. Not installed when the setting is 0.
+
+    Instead of weakening the strong ETags of the compressed responses, which would fail
+    every If-Match, it appends +gzip to them and strips it from the request validators
+    """
+
+    def __init__(self, get_response):
+        if not settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        for header in ('HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH'):
+            if SUFFIX in request.META.get(header, ''):
+                request.META[header] = request.META[header].replace(SUFFIX, '"')
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return response
+
+        etag = response.get('ETag')
+        response = super().process_response(request, response)
+        if etag and etag.startswith('"') and response.get('Content-Encoding') == 'gzip':
+            response.headers['ETag'] = etag[:-1] + SUFFIX
+        return response
@@ -0,0 +1,33 @@
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from challenge.db.pool import pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep the database from being dropped
+        pools.close(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend that takes its connections from an in-process pool, configured by
+    the POOL entry of the database settings. Closing the connection gives it back
+    """
+    creation_class = DatabaseCreation
+    connection_pool = None
+
+    def get_new_connection(self, conn_params):
+        # Set by the parent on new connections only, pooled ones come from the same OPTIONS
+        self.isolation_level = IsolationLevel(
+            self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED)
+        )
+        connect = super().get_new_connection
+        self.connection_pool = pools.get(self.alias, conn_params, self.settings_dict['POOL'])
+        return self.connection_pool.acquire(lambda: connect(conn_params))
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.connection_pool.release(self.connection, check=self.errors_occurred)
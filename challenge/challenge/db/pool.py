@@ -0,0 +1,270 @@
+import os
+import threading
+import time
+from collections import deque
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+
+class Entry:
+    __slots__ = ('connection', 'created_at', 'released_at')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = self.released_at = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections. At most max_size connections are open,
+    acquire() waits up to timeout seconds for one of them. Idle connections beyond min_size
+    are closed after max_idle seconds and any of them after max_lifetime seconds
+    """
+
+    def __init__(self, min_size=1, max_size=10, timeout=10, max_idle=600, max_lifetime=3600, health_checks=False):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_checks = health_checks
+        # The connections belong to this process, a forked child must not use or close them
+        self.pid = os.getpid()
+
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.entries = {}
+        self.size = 0
+        self.waiting = 0
+        self.closed = False
+
+        self.acquired = 0
+        self.timeouts = 0
+        self.acquire_seconds = 0.0
+        self.acquire_seconds_max = 0.0
+
+    def stats(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.size - len(self.idle),
+                'waiting': self.waiting,
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'acquire_seconds_total': self.acquire_seconds,
+                'acquire_seconds_max': self.acquire_seconds_max,
+            }
+
+    def acquire(self, connect):
+        """
+        Returns an idle connection, or a new one from connect() while the pool is not full
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        while True:
+            entry, expired = self.take(deadline)
+            for stale in expired:
+                self.discard(stale)
+
+            if entry is None:
+                try:
+                    entry = Entry(connect())
+                except BaseException:
+                    self.forget(None)
+                    raise
+            elif not self.usable(entry):
+                self.discard(entry)
+                self.forget(entry)
+                continue
+
+            with self.condition:
+                self.entries[id(entry.connection)] = entry
+                elapsed = time.monotonic() - start
+                self.acquired += 1
+                self.acquire_seconds += elapsed
+                self.acquire_seconds_max = max(self.acquire_seconds_max, elapsed)
+            return entry.connection
+
+    def take(self, deadline):
+        """
+        Pops an idle entry, or reserves the slot of a new connection (None).
+        Also returns the idle entries that expired, closed by the caller outside the lock
+        """
+        with self.condition:
+            while True:
+                expired = self.expire()
+                if self.idle:
+                    return self.idle.pop(), expired
+                if self.size < self.max_size:
+                    self.size += 1
+                    return None, expired
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout('No database connection available after %ss (%d in use)' % (self.timeout, self.size))
+
+                self.waiting += 1
+                try:
+                    self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+    def expire(self):
+        """
+        Removes the idle entries past max_idle (keeping min_size open) or max_lifetime.
+        The least recently used are on the left
+        """
+        now = time.monotonic()
+        expired = []
+        for entry in list(self.idle):
+            too_old = now - entry.created_at > self.max_lifetime
+            too_idle = now - entry.released_at > self.max_idle and self.size - len(expired) > self.min_size
+            if too_old or too_idle:
+                self.idle.remove(entry)
+                expired.append(entry)
+        self.size -= len(expired)
+        if expired:
+            self.condition.notify(len(expired))
+        return expired
+
+    def usable(self, entry):
+        if entry.connection.closed:
+            return False
+        if not self.health_checks:
+            return True
+        try:
+            with entry.connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except psycopg2.Error:
+            return False
+        return True
+
+    def release(self, connection, check=False):
+        """
+        Gives a connection back, rolled back if left in a transaction. Broken connections,
+        or any after close(), are closed instead. check=True pings it first. In a forked child
+        the connections of the parent are left alone
+        """
+        if self.pid != os.getpid():
+            return
+
+        with self.condition:
+            entry = self.entries.pop(id(connection), None)
+        if entry is None:
+            connection.close()
+            return
+
+        reusable = not self.closed and self.reset(connection) and not (check and not self.usable(entry))
+        if not reusable:
+            self.discard(entry)
+            self.forget(entry)
+            return
+
+        entry.released_at = time.monotonic()
+        with self.condition:
+            self.idle.append(entry)
+            self.condition.notify()
+
+    def reset(self, connection):
+        if connection.closed:
+            return False
+        try:
+            if connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            return connection.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+        except psycopg2.Error:
+            return False
+
+    def forget(self, entry):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def discard(self, entry):
+        try:
+            entry.connection.close()
+        except psycopg2.Error:
+            pass
+
+    def close(self):
+        """
+        Closes the idle connections, the ones in use are closed when released
+        """
+        with self.condition:
+            self.closed = True
+            idle = list(self.idle)
+            self.idle.clear()
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for entry in idle:
+            self.discard(entry)
+
+
+class Pools:
+    """
+    The pools of the process by database alias and connection parameters
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+        self.inherited = []
+
+    def get(self, alias, conn_params, options):
+        key = (alias, tuple(sorted((name, str(value)) for name, value in conn_params.items())))
+        with self.lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                pool = self.pools[key] = ConnectionPool(**options)
+            return pool
+
+    def stats(self):
+        """
+        The stats of every pool, summed by alias
+        """
+        with self.lock:
+            pools = list(self.pools.items())
+
+        stats = {}
+        for (alias, _), pool in pools:
+            pool_stats = pool.stats()
+            total = stats.setdefault(alias, dict.fromkeys(pool_stats, 0))
+            for name, value in pool_stats.items():
+                total[name] = max(total[name], value) if name == 'acquire_seconds_max' else total[name] + value
+        return stats
+
+    def close(self, database_name=None):
+        """
+        Closes the pools, of one database only when a name is given
+        """
+        with self.lock:
+            closing = [
+                key for key in self.pools
+                if database_name is None or dict(key[1]).get('dbname') == database_name
+            ]
+            pools = [self.pools.pop(key) for key in closing]
+        for pool in pools:
+            pool.close()
+
+    def after_fork(self):
+        """
+        In a forked child: the inherited pools hold the sessions of the parent, closing them
+        would end those sessions. They are dropped without closing and kept referenced, so
+        the garbage collector does not close their connections either
+        """
+        self.lock = threading.Lock()
+        self.inherited.extend(self.pools.values())
+        self.pools = {}
+
+
+pools = Pools()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=pools.after_fork)
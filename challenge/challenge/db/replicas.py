@@ -0,0 +1,134 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import sha256
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import get_authorization_header
+from rest_framework.permissions import SAFE_METHODS
+
+# Alias the reads of the current request go to, None for the primary
+read_database = ContextVar('read_database', default=None)
+
+PRIMARY_APPS = frozenset(['auth', 'authtoken', 'api_auth', 'sessions', 'contenttypes'])
+
+
+@contextmanager
+def primary():
+    """
+    Sends the reads of the block to the primary
+    """
+    token = read_database.set(None)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Reads go to the replica chosen by ReplicaMiddleware for the request, the rest to the
+    primary. Users and tokens are always read from the primary, a replica may not have
+    a token created or revoked a moment ago yet
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return 'default'
+        return read_database.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaMiddleware:
+    """
+    Serves the GETs of the views in REPLICA_READ_VIEWS from a replica. A client that writes
+    reads from the primary for the following DB_REPLICA_PIN_SECONDS, so it sees its own
+    writes despite the replication lag. Clients are told apart by their token
+    """
+    prefix = 'replica:pin:'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Picked up by load_middleware, an async handler then awaits it without a thread
+            self.process_view = self.aprocess_view
+
+    @property
+    def cache(self):
+        return caches[settings.REPLICA_PIN_CACHE_ALIAS]
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        response = self.get_response(request)
+        self.reset(request)
+
+        key = self.pin_key(request)
+        if key is not None:
+            self.cache.set(key, 1, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.reset(request)
+
+        key = self.pin_key(request)
+        if key is not None:
+            await self.cache.aset(key, 1, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def reset(self, request):
+        context_token = getattr(request, 'read_database_token', None)
+        if context_token is not None:
+            read_database.reset(context_token)
+
+    def pin_key(self, request):
+        """
+        The key that pins the client of a write to the primary, None for reads
+        """
+        if not settings.REPLICA_DATABASES or request.method in SAFE_METHODS:
+            return None
+        return self.key(request)
+
+    def replica_view(self, request):
+        if not settings.REPLICA_DATABASES or request.method not in ('GET', 'HEAD'):
+            return False
+        return request.resolver_match.url_name in settings.REPLICA_READ_VIEWS
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.replica_view(request):
+            return None
+
+        key = self.key(request)
+        if key is not None and self.cache.get(key):
+            return None
+
+        request.read_database_token = read_database.set(random.choice(settings.REPLICA_DATABASES))
+        return None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if not self.replica_view(request):
+            return None
+
+        key = self.key(request)
+        if key is not None and await self.cache.aget(key):
+            return None
+
+        request.read_database_token = read_database.set(random.choice(settings.REPLICA_DATABASES))
+        return None
+
+    def key(self, request):
+        auth = get_authorization_header(request).split()
+        if len(auth) != 2:
+            return None
+        return self.prefix + sha256(auth[1]).hexdigest()
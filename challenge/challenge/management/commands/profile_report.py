@@ -0,0 +1,35 @@
+import pstats
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from challenge.profiling import profile_paths, profile_view
+
+SORT_KEYS = {'tottime': 2, 'cumtime': 3, 'calls': 1}
+
+
+class Command(BaseCommand):
+    help = 'Adds up the profiles in PROFILING_DIR and prints the functions that took the most time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.PROFILING_DIR)
+        parser.add_argument('--view', help='Only the profiles of this URL name')
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--sort', choices=list(SORT_KEYS), default='tottime')
+
+    def handle(self, *args, **options):
+        if not options['dir']:
+            raise CommandError('Set PROFILING_DIR or pass --dir')
+
+        paths = profile_paths(options['dir'])
+        if options['view']:
+            paths = [path for path in paths if profile_view(path) == options['view']]
+        if not paths:
+            raise CommandError('No profiles found')
+
+        stats = pstats.Stats(*paths).stats
+        index = SORT_KEYS[options['sort']]
+        rows = sorted(stats.items(), key=lambda item: item[1][index], reverse=True)[:options['top']]
+
+        self.stdout.write('%d profiles' % len(paths))
+        self.stdout.write('%10s %12s %12s  %s' % ('calls', 'tottime (s)', 'cumtime (s)', 'function'))
+        for function, (_, calls, tottime, cumtime, _) in rows:
+            self.stdout.write('%10d %12.4f %12.4f  %s' % (calls, tottime, cumtime, pstats.func_std_string(function)))
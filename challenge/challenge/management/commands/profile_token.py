@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from challenge.profiling import HEADER, make_token
+
+
+class Command(BaseCommand):
+    help = 'Prints a signed header that has a request profiled, valid for PROFILING_TOKEN_MAX_AGE seconds'
+
+    def handle(self, *args, **options):
+        self.stdout.write('%s: %s' % (HEADER, make_token()))
+        self.stderr.write('Valid for %d seconds' % settings.PROFILING_TOKEN_MAX_AGE)
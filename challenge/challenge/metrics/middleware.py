@@ -0,0 +1,127 @@
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+from challenge.metrics.registry import registry
+
+
+class QueryTimer:
+    """
+    connection.execute_wrapper that counts the queries of a request and their time
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Records latency, database queries and time, rendering time and response bytes of every
+    request by URL name, and sums them up in a Server-Timing header
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        timer = QueryTimer()
+        request.render_seconds = 0.0
+
+        with ExitStack() as stack:
+            wrap_connections(stack, timer)
+            response = self.get_response(request)
+
+        return self.record(request, response, start, timer)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        timer = QueryTimer()
+        request.render_seconds = 0.0
+
+        # The queries of an async request run in the thread of its sync_to_async calls,
+        # the wrapper goes on the connections of that thread
+        stack = ExitStack()
+        await sync_to_async(wrap_connections)(stack, timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+
+        return self.record(request, response, start, timer)
+
+    def record(self, request, response, start, timer):
+        total = time.perf_counter() - start
+        view = request.resolver_match.url_name if request.resolver_match else None
+        view = view or 'unmatched'
+        method = request.method
+
+        registry.inc('http_requests_total', view=view, method=method, status=str(response.status_code))
+        registry.observe('http_request_duration_seconds', total, view=view, method=method)
+        registry.inc('db_queries_total', timer.count, view=view)
+        registry.inc('db_query_duration_seconds_total', timer.seconds, view=view)
+        registry.inc('serialization_duration_seconds_total', request.render_seconds, view=view)
+        if response.streaming:
+            count_bytes = self.acount_bytes if response.is_async else self.count_bytes
+            response.streaming_content = count_bytes(response.streaming_content, view, method)
+        else:
+            registry.inc('http_response_bytes_total', len(response.content), view=view, method=method)
+
+        response['Server-Timing'] = 'db;dur=%.2f;desc="%d queries", render;dur=%.2f, total;dur=%.2f' % (
+            timer.seconds * 1000, timer.count, request.render_seconds * 1000, total * 1000
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Runs last, right before the response renders (serializes) its data
+        """
+        return self.time_render(request, response)
+
+    async def aprocess_template_response(self, request, response):
+        return self.time_render(request, response)
+
+    def time_render(self, request, response):
+        start = time.perf_counter()
+
+        def rendered(response):
+            request.render_seconds += time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def count_bytes(self, content, view, method):
+        size = 0
+        for chunk in content:
+            size += len(chunk)
+            yield chunk
+        registry.inc('http_response_bytes_total', size, view=view, method=method)
+
+    async def acount_bytes(self, content, view, method):
+        size = 0
+        async for chunk in content:
+            size += len(chunk)
+            yield chunk
+        registry.inc('http_response_bytes_total', size, view=view, method=method)
+
+
+def wrap_connections(stack, wrapper):
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(wrapper))
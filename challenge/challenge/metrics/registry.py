@@ -0,0 +1,106 @@
+import json
+import math
+from collections import defaultdict
+from django.conf import settings
+from challenge.metrics.store import FileStore, MemoryStore
+
+PREFIX = 'nubi_'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name: (type, help)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests by view, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by view and method.'),
+    'http_response_bytes_total': ('counter', 'Response body bytes by view and method.'),
+    'db_queries_total': ('counter', 'Database queries run by the requests, by view.'),
+    'db_query_duration_seconds_total': ('counter', 'Time spent in database queries by the requests, by view.'),
+    'serialization_duration_seconds_total': ('counter', 'Time spent rendering response bodies, by view.'),
+    'customer_cache_requests_total': ('counter', 'Customer detail cache lookups by result.'),
+}
+
+
+class Registry:
+    """
+    Counters and histograms kept in a store shared by the worker processes (METRICS_DIR),
+    or in memory for a single process
+    """
+
+    def __init__(self):
+        self.store = None
+
+    def get_store(self):
+        if self.store is None:
+            self.store = FileStore(settings.METRICS_DIR) if settings.METRICS_DIR else MemoryStore()
+        return self.store
+
+    def inc(self, name, amount=1, **labels):
+        self.get_store().inc(json.dumps([name, sorted(labels.items())]), amount)
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        """
+        Histogram observation, the buckets are stored cumulative and all of them are written
+        """
+        for bound in buckets:
+            self.inc(name + '_bucket', int(value <= bound), le=repr(float(bound)), **labels)
+        self.inc(name + '_bucket', le='+Inf', **labels)
+        self.inc(name + '_sum', value, **labels)
+        self.inc(name + '_count', **labels)
+
+    def collect(self):
+        """
+        {metric name: [(sample name, labels, value)]}
+        """
+        families = defaultdict(list)
+        for key, value in self.get_store().read().items():
+            sample, labels = json.loads(key)
+            name = sample
+            for suffix in ('_bucket', '_sum', '_count'):
+                if sample.endswith(suffix) and METRICS.get(sample[:-len(suffix)], ('',))[0] == 'histogram':
+                    name = sample[:-len(suffix)]
+            families[name].append((sample, labels, value))
+        return families
+
+    def render(self):
+        """
+        Prometheus text exposition format
+        """
+        lines = []
+        families = self.collect()
+        for name in sorted(families):
+            metric_type, description = METRICS.get(name, ('untyped', ''))
+            lines.append('# HELP %s%s %s' % (PREFIX, name, description))
+            lines.append('# TYPE %s%s %s' % (PREFIX, name, metric_type))
+            for sample, labels, value in sorted(families[name], key=sample_order):
+                lines.append('%s%s%s %s' % (PREFIX, sample, format_labels(labels), format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        self.get_store().clear()
+
+
+def sample_order(sample):
+    name, labels, _ = sample
+    labels = dict(labels)
+    le = labels.pop('le', None)
+    bound = math.inf if le == '+Inf' else float(le) if le else 0
+    return sorted(labels.items()), name, bound
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(value)) for name, value in labels)
+
+
+def format_value(value):
+    if value == int(value):
+        return '%d' % value
+    return repr(value)
+
+
+registry = Registry()
@@ -0,0 +1,126 @@
+import glob
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+
+HEADER = struct.Struct('<I4x')
+LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+INITIAL_SIZE = 1 << 16
+
+
+class MemoryStore:
+    """
+    Values of the current process only
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+
+    def inc(self, key, amount):
+        with self.lock:
+            self.values[key] += amount
+
+    def read(self):
+        with self.lock:
+            return dict(self.values)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+def padded(length):
+    return length + (-length % 8)
+
+
+def read_entries(data):
+    """
+    Yields (key, value, value offset) of a store file: a header with the used size, then
+    entries of a key length, the key padded to 8 bytes and a double
+    """
+    used = HEADER.unpack_from(data)[0] if len(data) >= HEADER.size else 0
+    position = HEADER.size
+    while position < used:
+        length = LENGTH.unpack_from(data, position)[0]
+        key_start = position + LENGTH.size
+        value_position = key_start + padded(length + LENGTH.size) - LENGTH.size
+        key = data[key_start:key_start + length].decode('utf-8')
+        yield key, VALUE.unpack_from(data, value_position)[0], value_position
+        position = value_position + VALUE.size
+
+
+class FileStore:
+    """
+    One memory mapped file per process in a shared directory: a process only writes its
+    own file, so an increment takes a thread lock and no cross-process one. Readers add up
+    the files of every process, including the exited ones, which suits counters
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def open(self):
+        """
+        (Re)opens the file of the current process, also after a fork
+        """
+        self.pid = os.getpid()
+        self.path = os.path.join(self.directory, 'metrics_%d.db' % self.pid)
+        self.file = open(self.path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size < INITIAL_SIZE:
+            self.file.truncate(INITIAL_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        if HEADER.unpack_from(self.map)[0] == 0:
+            HEADER.pack_into(self.map, 0, HEADER.size)
+        self.positions = {key: position for key, _, position in read_entries(self.map)}
+
+    def inc(self, key, amount):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.open()
+            position = self.positions.get(key)
+            if position is None:
+                position = self.add(key)
+            VALUE.pack_into(self.map, position, VALUE.unpack_from(self.map, position)[0] + amount)
+
+    def add(self, key):
+        encoded = key.encode('utf-8')
+        used = HEADER.unpack_from(self.map)[0]
+        entry_size = padded(LENGTH.size + len(encoded)) + VALUE.size
+        size = len(self.map)
+        if used + entry_size > size:
+            self.map.close()
+            self.file.truncate(max(size * 2, used + entry_size))
+            self.map = mmap.mmap(self.file.fileno(), 0)
+
+        LENGTH.pack_into(self.map, used, len(encoded))
+        self.map[used + LENGTH.size:used + LENGTH.size + len(encoded)] = encoded
+        position = used + entry_size - VALUE.size
+        VALUE.pack_into(self.map, position, 0.0)
+        # Readers only go up to the used size, the entry is complete before it moves
+        HEADER.pack_into(self.map, 0, used + entry_size)
+        self.positions[key] = position
+        return position
+
+    def read(self):
+        values = defaultdict(float)
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.db')):
+            with open(path, 'rb') as file:
+                data = file.read()
+            for key, value, _ in read_entries(data):
+                values[key] += value
+        return dict(values)
+
+    def clear(self):
+        with self.lock:
+            if self.pid is not None:
+                self.map.close()
+                self.file.close()
+                self.pid = None
+            for path in glob.glob(os.path.join(self.directory, 'metrics_*.db')):
+                os.remove(path)
@@ -0,0 +1,32 @@
+import io
+import re
+import msgpack
+import orjson
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+
+# orjson turns integers beyond 64 bits into floats. A body with a run of 19 digits, maybe in a
+# string or a fraction, is parsed by the stdlib instead
+LONG_NUMBER = re.compile(rb'\d{19}')
+
+
+class ORJSONParser(parsers.JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        content = stream.read()
+        if LONG_NUMBER.search(content):
+            return super().parse(io.BytesIO(content), media_type, parser_context)
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError as error:
+            raise ParseError('JSON parse error - %s' % error)
+
+
+class MessagePackParser(parsers.BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), timestamp=3)
+        except (ValueError, TypeError, msgpack.UnpackException) as error:
+            raise ParseError('MessagePack parse error - %s' % error)
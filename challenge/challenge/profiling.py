@@ -0,0 +1,129 @@
+import cProfile
+import os
+import random
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+HEADER = 'X-Profile'
+SALT = 'challenge.profiling'
+
+
+def make_token():
+    """
+    A value for the X-Profile header, valid for PROFILING_TOKEN_MAX_AGE seconds
+    """
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def valid_token(token):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def profile_paths(directory):
+    """
+    The profiles of a directory, oldest first: the names start with the time
+    """
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.prof'))
+
+
+def profile_view(path):
+    """
+    The URL name in a profile file name
+    """
+    return '-'.join(os.path.basename(path).split('-')[1:-2])
+
+
+def rotate(directory, max_files):
+    for path in profile_paths(directory)[:-max_files or None]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests with a valid signed X-Profile header and a PROFILING_SAMPLE_RATE
+    share of the others with cProfile, and dumps them to PROFILING_DIR in the pstats format
+    (snakeviz, gprof2dot, pstats), keeping the last PROFILING_MAX_FILES. Not installed
+    without a PROFILING_DIR.
+
+    cProfile follows one thread: under ASGI that is the event loop, so a profile has the
+    async views and middleware but not the sync_to_async calls, and may have whatever
+    other requests ran on the loop meanwhile
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_DIR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        requested = self.requested(request)
+        if not requested and random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active in this thread
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+
+        name = self.dump(profiler, request, time.perf_counter() - start)
+        if requested:
+            response['X-Profile-File'] = name
+        return response
+
+    async def __acall__(self, request):
+        requested = self.requested(request)
+        if not requested and random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another request is profiled on the event loop
+            return await self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+
+        name = await sync_to_async(self.dump, thread_sensitive=False)(profiler, request, time.perf_counter() - start)
+        if requested:
+            response['X-Profile-File'] = name
+        return response
+
+    def requested(self, request):
+        token = request.headers.get(HEADER)
+        return token is not None and valid_token(token)
+
+    def dump(self, profiler, request, seconds):
+        view = request.resolver_match.url_name if request.resolver_match else None
+        name = '%d-%s-%s-%dms.prof' % (time.time_ns(), view or 'unmatched', request.method, seconds * 1000)
+        profiler.dump_stats(os.path.join(settings.PROFILING_DIR, name))
+        rotate(settings.PROFILING_DIR, settings.PROFILING_MAX_FILES)
+        return name
@@ -0,0 +1,60 @@
+from functools import wraps
+from django.conf import settings
+from django.db import connection
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """
+    Execute wrapper that counts the queries sent through the connection.
+    Savepoint statements are skipped: outside of tests an atomic block is a
+    BEGIN/COMMIT that never goes through the cursor, so they are not counted either
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def query_budget(**budgets):
+    """
+    Declares the maximum number of queries a view may run per HTTP method,
+    e.g. @query_budget(get=3, post=5).
+    It is only enforced when settings.QUERY_BUDGET_ENFORCE is enabled (the test suites do it)
+    """
+
+    def decorator(view_class):
+        view_class.query_budget = {method.upper(): budget for method, budget in budgets.items()}
+        dispatch = view_class.dispatch
+
+        @wraps(dispatch)
+        def budgeted_dispatch(self, request, *args, **kwargs):
+            budget = self.query_budget.get(request.method)
+
+            if budget is None or not settings.QUERY_BUDGET_ENFORCE:
+                return dispatch(self, request, *args, **kwargs)
+
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                response = dispatch(self, request, *args, **kwargs)
+
+            if counter.count > budget:
+                raise QueryBudgetExceeded(
+                    '%s %s ran %d queries, its budget is %d' % (
+                        request.method, view_class.__name__, counter.count, budget
+                    )
+                )
+
+            return response
+
+        view_class.dispatch = budgeted_dispatch
+        return view_class
+
+    return decorator
@@ -0,0 +1,142 @@
+import logging
+import random
+import re
+import sys
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from challenge.metrics.middleware import wrap_connections
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+SPACE = re.compile(r'\s+')
+
+# Frames of these paths are skipped when looking for the line that ran a query
+LIBRARY_PATHS = ('/django/', '/rest_framework/', '/django_filters/', '/asgiref/', '/site-packages/', __file__)
+
+
+class RepeatedQueries(AssertionError):
+    pass
+
+
+def normalize(sql):
+    """
+    The SQL with its literals and the length of IN lists left out, same for every row of an N+1
+    """
+    sql = IN_LIST.sub('IN (...)', sql)
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    return SPACE.sub(' ', sql).strip()
+
+
+def call_site():
+    """
+    'path:line in function' of the innermost frame outside of the libraries
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        path = frame.f_code.co_filename
+        if not any(part in path for part in LIBRARY_PATHS) and not path.startswith('<'):
+            return '%s:%d in %s' % (path, frame.f_lineno, frame.f_code.co_name)
+        frame = frame.f_back
+    return 'unknown'
+
+
+class QueryInspector:
+    """
+    Execute wrapper that groups the queries of a request by normalized SQL, with the call
+    site of the first one, and logs the ones slower than QUERY_SLOW_MS
+    """
+
+    def __init__(self):
+        self.queries = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            milliseconds = (time.perf_counter() - start) * 1000
+            normalized = normalize(sql)
+            entry = self.queries.get(normalized)
+            if entry is None:
+                entry = self.queries[normalized] = {'count': 0, 'site': call_site()}
+            entry['count'] += 1
+            if milliseconds > settings.QUERY_SLOW_MS:
+                logger.warning('Slow query (%.1f ms) at %s: %s', milliseconds, call_site(), normalized)
+
+    def repeated(self):
+        """
+        [(normalized SQL, count, call site)] run QUERY_REPEAT_THRESHOLD times or more
+        """
+        return [
+            (sql, entry['count'], entry['site'])
+            for sql, entry in self.queries.items() if entry['count'] >= settings.QUERY_REPEAT_THRESHOLD
+        ]
+
+
+class QueryInspectorMiddleware:
+    """
+    Looks for N+1 queries and slow queries in every request when QUERY_INSPECTOR_RAISE is
+    enabled (the test suites do it, repeated queries raise RepeatedQueries), and in a
+    QUERY_INSPECTOR_SAMPLE_RATE share of them otherwise, as warnings
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.inspected():
+            return self.get_response(request)
+
+        inspector = QueryInspector()
+        with ExitStack() as stack:
+            wrap_connections(stack, inspector)
+            response = self.get_response(request)
+
+        self.report(request, inspector)
+        return response
+
+    async def __acall__(self, request):
+        if not self.inspected():
+            return await self.get_response(request)
+
+        # Wrapped in the thread that runs the queries of the request, see MetricsMiddleware
+        inspector = QueryInspector()
+        stack = ExitStack()
+        await sync_to_async(wrap_connections)(stack, inspector)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+
+        self.report(request, inspector)
+        return response
+
+    def inspected(self):
+        return settings.QUERY_INSPECTOR_RAISE or random.random() < settings.QUERY_INSPECTOR_SAMPLE_RATE
+
+    def report(self, request, inspector):
+        repeated = inspector.repeated()
+        if not repeated:
+            return
+
+        message = '%s %s repeated queries: %s' % (request.method, request.path, '; '.join(
+            '%d x %s (first at %s)' % (count, sql, site) for sql, count, site in repeated
+        ))
+        if settings.QUERY_INSPECTOR_RAISE:
+            raise RepeatedQueries(message)
+        logger.warning(message)
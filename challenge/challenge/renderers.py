@@ -0,0 +1,42 @@
+import msgpack
+import orjson
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+# Lazy strings, Decimals, timedeltas, querysets... the way DRF's JSON renderer encodes them
+encode_default = JSONEncoder().default
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer on orjson: UUIDs and datetimes are encoded natively (ISO 8601, UTC as Z).
+    The output is the compact UTF-8 of the default JSONRenderer settings, with U+2028 and
+    U+2029 escaped the same way. An indent and integers beyond 64 bits go through
+    JSONRenderer. Left different: datetimes keep their microseconds (JSONRenderer cuts them
+    to milliseconds), NaN and infinities become null instead of an error, and UNICODE_JSON
+    and COMPACT_JSON are not read
+    """
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, default=encode_default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default)
@@ -42,9 +42,15 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'customer',
+    'auth.apps.AuthConfig',
+    'challenge',
 ]
 
 MIDDLEWARE = [
+    'challenge.metrics.middleware.MetricsMiddleware',
+    'challenge.profiling.ProfilingMiddleware',
+    'challenge.query_inspector.QueryInspectorMiddleware',
+    'challenge.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'challenge.db.replicas.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'challenge.urls'
@@ -79,22 +86,124 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend', 'rest_framework.filters.OrderingFilter'],
     'ORDERING_PARAM': 'sortBy',
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'auth.authentication.SignedTokenAuthentication',
         'auth.authentication.TokenAuthenticationV2',
-    ]
+    ],
+    # JSON (orjson) unless the Accept or Content-Type header asks for MessagePack
+    'DEFAULT_RENDERER_CLASSES': [
+        'challenge.renderers.ORJSONRenderer',
+        'challenge.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'challenge.parsers.ORJSONParser',
+        'challenge.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 
+# Connections: DB_CONN_MAX_AGE keeps them open between requests (seconds), DB_CONN_HEALTH_CHECKS
+# pings a reused one before its first query. A positive DB_POOL_MAX_SIZE switches to the
+# in-process pool of challenge.db instead, which hands a connection to each request.
+# DB_PGBOUNCER is for a PgBouncer in transaction pooling mode: server-side cursors do not
+# survive between transactions there, so querysets iterated in chunks are fetched whole
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'challenge.db' if DB_POOL_MAX_SIZE > 0 else 'django.db.backends.postgresql',
         'NAME': os.environ.get('DB_NAME', 'database_dev'),
         'USER': os.environ.get('DB_USER', 'postgres'),
         'PASSWORD': os.environ.get('DB_PASSWORD', 'secret'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE > 0 else int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '') in ('1', 'true', 'True'),
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_PGBOUNCER', '') in ('1', 'true', 'True'),
+        'POOL': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'max_idle': int(os.environ.get('DB_POOL_MAX_IDLE', 600)),
+            'max_lifetime': int(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+            'health_checks': os.environ.get('DB_CONN_HEALTH_CHECKS', '') in ('1', 'true', 'True'),
+        },
+    }
+}
+
+# Customer shards: DB_SHARDS databases named '<DB_NAME>_shard<N>' on the primary server unless
+# DB_SHARD<N>_NAME / DB_SHARD<N>_HOST say otherwise. CUSTOMER_SHARDING=1 spreads the customers
+# over them by a hash of the dni, the shard count cannot change once they hold customers
+DB_SHARDS = int(os.environ.get('DB_SHARDS', 2))
+for index in range(DB_SHARDS):
+    DATABASES['shard%d' % index] = dict(
+        DATABASES['default'],
+        NAME=os.environ.get('DB_SHARD%d_NAME' % index, '%s_shard%d' % (DATABASES['default']['NAME'], index)),
+        HOST=os.environ.get('DB_SHARD%d_HOST' % index, DATABASES['default']['HOST']),
+    )
+
+CUSTOMER_SHARDS = ['shard%d' % index for index in range(DB_SHARDS)] if (
+    os.environ.get('CUSTOMER_SHARDING', '') in ('1', 'true', 'True')
+) else []
+
+# Read replicas: DB_REPLICA_HOSTS is a comma separated list of 'host[:port]', the other
+# DB_REPLICA_* default to the primary values. A second database on the same server can
+# stand in for a replica locally (DB_REPLICA_HOSTS=localhost DB_REPLICA_NAME=...)
+REPLICA_DATABASES = []
+for index, replica in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    host, _, port = replica.strip().partition(':')
+    alias = 'replica%d' % index
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        NAME=os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        USER=os.environ.get('DB_REPLICA_USER', DATABASES['default']['USER']),
+        PASSWORD=os.environ.get('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        HOST=host,
+        PORT=port or os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+    )
+    REPLICA_DATABASES.append(alias)
+
+# Stand-in replica for the tests: the test runner points it at the test database of the
+# primary (TEST MIRROR) instead of creating one. Nothing reads from it unless it is listed
+# in REPLICA_DATABASES
+DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['customer.routers.ShardRouter', 'challenge.db.replicas.ReplicaRouter']
+
+# Views whose GETs are served by the replicas (URL names)
+REPLICA_READ_VIEWS = ['customer-list-create', 'customer-retrieve-update-destroy']
+
+# Seconds a client reads from the primary after a write, and the cache that remembers it
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_CACHE_ALIAS = os.environ.get('DB_REPLICA_PIN_CACHE_ALIAS', 'default')
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# Request metrics: with several worker processes METRICS_DIR names a directory they share
+# (emptied before they start), otherwise each process serves its own numbers at /metrics
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+# /metrics answers the addresses or networks of METRICS_ALLOWED_IPS (comma separated, REMOTE_ADDR
+# as Django sees it) and the requests with an 'Authorization: Bearer <METRICS_TOKEN>' header
+METRICS_ALLOWED_IPS = [network for network in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if network]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Gzip the responses of at least RESPONSE_COMPRESSION_MIN_BYTES (0 disables it, 200 is the minimum)
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', 0))
+
+# Profiling: with a PROFILING_DIR, the requests with a header from `manage.py profile_token`
+# and a PROFILING_SAMPLE_RATE share (0 to 1) of the others are profiled into that directory
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', 200))
+PROFILING_TOKEN_MAX_AGE = int(os.environ.get('PROFILING_TOKEN_MAX_AGE', 3600))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -136,7 +245,59 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Raise when a view runs more queries than its @query_budget (enabled by the test suites)
+QUERY_BUDGET_ENFORCE = False
+
+# N+1 detection: a request that runs the same normalized query QUERY_REPEAT_THRESHOLD times
+# raises with QUERY_INSPECTOR_RAISE (enabled by the test suites) and logs a warning in the
+# QUERY_INSPECTOR_SAMPLE_RATE share (0 to 1) of requests that are inspected otherwise.
+# Inspected queries slower than QUERY_SLOW_MS are logged
+QUERY_INSPECTOR_RAISE = False
+QUERY_INSPECTOR_SAMPLE_RATE = float(os.environ.get('QUERY_INSPECTOR_SAMPLE_RATE', 0))
+QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 3))
+QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', 100))
+
+# Maximum number of items accepted by the customer bulk endpoint
+CUSTOMER_BULK_MAX_ITEMS = int(os.environ.get('CUSTOMER_BULK_MAX_ITEMS', 1000))
+
+# Rows fetched per round trip by the customer export
+CUSTOMER_EXPORT_CHUNK_SIZE = int(os.environ.get('CUSTOMER_EXPORT_CHUNK_SIZE', 2000))
+
+# Cache used for the customer detail responses, and their lifetime in seconds (0 disables it)
+CUSTOMER_CACHE_ALIAS = os.environ.get('CUSTOMER_CACHE_ALIAS', 'default')
+CUSTOMER_CACHE_TIMEOUT = int(os.environ.get('CUSTOMER_CACHE_TIMEOUT', 300))
+
+# Serve the customer list and detail endpoints with the async views (run under ASGI)
+CUSTOMER_ASYNC_VIEWS = os.environ.get('CUSTOMER_ASYNC_VIEWS', '') in ('1', 'true', 'True')
+
 # Expiration in days
 TOKEN_EXPIRATION = int(os.environ.get('TOKEN_EXPIRATION', 30))
 
+# Authenticated tokens are cached in the shared cache (user id and creation time only) and,
+# with their users, for a few seconds in every process
+AUTH_TOKEN_CACHE_ALIAS = os.environ.get('AUTH_TOKEN_CACHE_ALIAS', 'default')
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.environ.get('AUTH_TOKEN_CACHE_TIMEOUT', 300))
+AUTH_TOKEN_CACHE_LOCAL_TIMEOUT = int(os.environ.get('AUTH_TOKEN_CACHE_LOCAL_TIMEOUT', 5))
+AUTH_TOKEN_CACHE_LOCAL_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_LOCAL_SIZE', 10000))
+
+# Token issued by the login: 'db' (TokenAuthenticationV2) or 'signed' (SignedTokenAuthentication)
+AUTH_TOKEN_TYPE = os.environ.get('AUTH_TOKEN_TYPE', 'db')
+
+# Signed token keys by version as 'version:secret,...'. AUTH_SIGNING_KEY_ID signs, all of them verify
+AUTH_SIGNING_KEYS = dict(
+    item.split(':', 1) for item in os.environ.get('AUTH_SIGNING_KEYS', '').split(',') if item
+) or {'1': SECRET_KEY}
+AUTH_SIGNING_KEY_ID = os.environ.get('AUTH_SIGNING_KEY_ID', next(iter(AUTH_SIGNING_KEYS)))
+
+# Seconds between refreshes of the revoked signed tokens. A refresh reads the revocations created
+# since the previous one, less AUTH_DENY_LIST_LAG seconds for clock skew and late commits
+AUTH_DENY_LIST_REFRESH = int(os.environ.get('AUTH_DENY_LIST_REFRESH', 30))
+AUTH_DENY_LIST_LAG = int(os.environ.get('AUTH_DENY_LIST_LAG', 60))
+
+# Expired token purge (purge_expired_tokens): rows per batch and seconds between batches.
+# A positive interval also runs it every that many seconds in a thread of each WSGI/ASGI process
+AUTH_TOKEN_PURGE_BATCH_SIZE = int(os.environ.get('AUTH_TOKEN_PURGE_BATCH_SIZE', 1000))
+AUTH_TOKEN_PURGE_SLEEP = float(os.environ.get('AUTH_TOKEN_PURGE_SLEEP', 0.1))
+AUTH_TOKEN_PURGE_INTERVAL = int(os.environ.get('AUTH_TOKEN_PURGE_INTERVAL', 0))
+
 APPEND_SLASH=False
\ No newline at end of file
@@ -0,0 +1,561 @@
+import gzip
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from unittest import mock
+import msgpack
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.base import BaseHandler
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from challenge.db import replicas
+from challenge.db.base import DatabaseWrapper
+from challenge.db.pool import ConnectionPool, Pools, PoolTimeout, pools
+from challenge.metrics.registry import Registry, registry
+from challenge.metrics.store import FileStore
+from challenge.parsers import ORJSONParser
+from challenge.profiling import make_token, profile_paths, profile_view
+from challenge.query_inspector import QueryInspector, normalize
+from challenge.renderers import ORJSONRenderer
+from customer.models import Customer, CustomerUser
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.info = mock.Mock(transaction_status=0)
+
+    def rollback(self):
+        self.info.transaction_status = 0
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTestCase(TestCase):
+    def test_reuses_released_connections(self):
+        pool = ConnectionPool(max_size=2)
+        first = pool.acquire(FakeConnection)
+        pool.release(first)
+
+        self.assertIs(pool.acquire(FakeConnection), first)
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertEqual(pool.stats()['acquired'], 2)
+
+    def test_rolls_back_released_transactions(self):
+        pool = ConnectionPool(max_size=1)
+        first = pool.acquire(FakeConnection)
+        first.info.transaction_status = 2
+        pool.release(first)
+
+        self.assertIs(pool.acquire(FakeConnection), first)
+        self.assertEqual(first.info.transaction_status, 0)
+
+    def test_replaces_closed_connections(self):
+        pool = ConnectionPool(max_size=1)
+        first = pool.acquire(FakeConnection)
+        pool.release(first)
+        first.close()
+
+        self.assertIsNot(pool.acquire(FakeConnection), first)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_acquire_timeout(self):
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        pool.acquire(FakeConnection)
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waiters_get_released_connections(self):
+        pool = ConnectionPool(max_size=1, timeout=5)
+        first = pool.acquire(FakeConnection)
+        acquired = []
+
+        thread = threading.Thread(target=lambda: acquired.append(pool.acquire(FakeConnection)))
+        thread.start()
+        while not pool.stats()['waiting']:
+            thread.join(0.01)
+        pool.release(first)
+        thread.join()
+
+        self.assertEqual(acquired, [first])
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+    def test_closes_idle_connections_over_min_size(self):
+        pool = ConnectionPool(min_size=1, max_size=3, max_idle=0)
+        connections = [pool.acquire(FakeConnection) for _ in range(3)]
+        for pool_connection in connections:
+            pool.release(pool_connection)
+
+        pool.acquire(FakeConnection)
+
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertEqual(sum(pool_connection.closed for pool_connection in connections), 2)
+
+    def test_connect_errors_free_the_slot(self):
+        pool = ConnectionPool(max_size=1)
+
+        with self.assertRaises(OSError):
+            pool.acquire(mock.Mock(side_effect=OSError))
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_forked_child_drops_the_inherited_pools(self):
+        inherited = Pools()
+        pool = inherited.get('default', {'dbname': 'test'}, {'max_size': 1})
+        parent_connection = pool.acquire(FakeConnection)
+
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            inherited.after_fork()
+            pool.release(parent_connection)
+            child_pool = inherited.get('default', {'dbname': 'test'}, {'max_size': 1})
+
+        self.assertIsNot(child_pool, pool)
+        self.assertEqual(inherited.stats(), {'default': child_pool.stats()})
+        self.assertFalse(parent_connection.closed)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+    def test_fork_resets_the_process_pools(self):
+        pools.get('fork_test', {'dbname': 'fork_test'}, {'max_size': 1})
+        try:
+            pid = os.fork()
+            if pid == 0:
+                os._exit(int(bool(pools.pools)))
+            _, exit_status = os.waitpid(pid, 0)
+        finally:
+            pools.close('fork_test')
+
+        self.assertEqual(exit_status, 0)
+
+    def test_database_wrapper_reuses_pooled_connections(self):
+        settings_dict = dict(connection.settings_dict, POOL={'max_size': 2})
+        wrapper = DatabaseWrapper(settings_dict, alias='pool_test')
+        try:
+            wrapper.ensure_connection()
+            raw_connection = wrapper.connection
+            wrapper.close()
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+            self.assertIs(wrapper.connection, raw_connection)
+            self.assertEqual(pools.stats()['pool_test']['acquired'], 2)
+            self.assertEqual(pools.stats()['pool_test']['size'], 1)
+        finally:
+            wrapper.close()
+            pools.close(settings_dict['NAME'])
+
+    def test_stats_view_is_admin_only(self):
+        client = APIClient()
+        user = User.objects.create_user(username='pooluser', password='testpassword')
+        client.force_authenticate(user)
+
+        self.assertEqual(client.get('/api/v1/db/pool/').status_code, status.HTTP_403_FORBIDDEN)
+
+        user.is_staff = True
+        self.assertEqual(client.get('/api/v1/db/pool/').status_code, status.HTTP_200_OK)
+
+
+class ReplicaRoutingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        customer_user = CustomerUser.objects.create(email='replica@example.com', name='name', last_name='last_name')
+        Customer.objects.create(id=1000, user=customer_user, sex_tape='Male', dni=123456789, birth_date='2000-01-01T00:00:00Z')
+
+    def client_for(self, username):
+        user = User.objects.create_user(username=username, password='testpassword')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        return client
+
+    def test_router(self):
+        router = replicas.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Customer), 'default')
+
+        context_token = replicas.read_database.set('replica1')
+        try:
+            self.assertEqual(router.db_for_read(Customer), 'replica1')
+            self.assertEqual(router.db_for_read(Token), 'default')
+            self.assertEqual(router.db_for_write(Customer), 'default')
+            with replicas.primary():
+                self.assertEqual(router.db_for_read(Customer), 'default')
+            self.assertEqual(router.db_for_read(Customer), 'replica1')
+        finally:
+            replicas.read_database.reset(context_token)
+
+    @override_settings(REPLICA_DATABASES=['default'])
+    def test_reads_pin_to_primary_after_a_write(self):
+        writer = self.client_for('writer')
+        reader = self.client_for('reader')
+
+        with mock.patch('challenge.db.replicas.random.choice', return_value='default') as choice:
+            self.assertEqual(writer.get('/api/v1/customer/').status_code, status.HTTP_200_OK)
+            self.assertEqual(choice.call_count, 1)
+            self.assertIsNone(replicas.read_database.get())
+
+            response = writer.patch('/api/v1/customer/1000', {'name': 'other'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(choice.call_count, 1)
+
+            writer.get('/api/v1/customer/')
+            self.assertEqual(choice.call_count, 1)
+
+            reader.get('/api/v1/customer/')
+            self.assertEqual(choice.call_count, 2)
+
+            with override_settings(REPLICA_PIN_SECONDS=0):
+                writer.patch('/api/v1/customer/1000', {'name': 'another'}, format='json')
+            writer.get('/api/v1/customer/')
+            self.assertEqual(choice.call_count, 3)
+
+    @override_settings(REPLICA_DATABASES=['default'])
+    async def test_reads_pin_to_primary_under_asgi(self):
+        writer = await sync_to_async(self.client_for)('writer')
+        headers = {'Authorization': writer._credentials['HTTP_AUTHORIZATION']}
+        factory = AsyncRequestFactory()
+        # The handler of AsyncClient runs the sync code in a thread outside of the test transaction
+        handler = BaseHandler()
+        handler.load_middleware(is_async=True)
+
+        with mock.patch('challenge.db.replicas.random.choice', return_value='default') as choice:
+            response = await handler.get_response_async(factory.get('/api/v1/customer/', headers=headers))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(choice.call_count, 1)
+            self.assertIsNone(replicas.read_database.get())
+
+            response = await handler.get_response_async(
+                factory.patch('/api/v1/customer/1000', '{"name": "other"}', content_type='application/json', headers=headers)
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            await handler.get_response_async(factory.get('/api/v1/customer/', headers=headers))
+            self.assertEqual(choice.call_count, 1)
+
+    def test_middleware_is_not_adapted_under_asgi(self):
+        with self.assertLogs('django.request', 'DEBUG') as logs:
+            logging.getLogger('django.request').debug('Loading the middleware')
+            BaseHandler().load_middleware(is_async=True)
+
+        self.assertFalse([line for line in logs.output if 'ReplicaMiddleware' in line])
+
+    @override_settings(REPLICA_DATABASES=['default'])
+    def test_cache_fills_from_primary(self):
+        client = self.client_for('reader')
+        db_for_read = replicas.ReplicaRouter.db_for_read
+        aliases = []
+
+        def record(router, model, **hints):
+            aliases.append(db_for_read(router, model, **hints))
+            return 'default'
+
+        with mock.patch('challenge.db.replicas.random.choice', return_value='replica1'):
+            with mock.patch.object(replicas.ReplicaRouter, 'db_for_read', record):
+                response = client.get('/api/v1/customer/1000')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('default', aliases)
+        self.assertNotIn('replica1', aliases)
+
+
+@override_settings(REPLICA_DATABASES=['replica'], CUSTOMER_CACHE_TIMEOUT=0)
+class ReplicaMirrorTestCase(TransactionTestCase):
+    """
+    Routing through the 'replica' alias, a test mirror of the primary. The mirror is a
+    connection of its own, it only sees committed rows, hence no TestCase
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        customer_user = CustomerUser.objects.create(email='replica@example.com', name='name', last_name='last_name')
+        Customer.objects.create(id=1000, user=customer_user, sex_tape='Male', dni=123456789, birth_date='2000-01-01T00:00:00Z')
+        user = User.objects.create_user(username='reader', password='testpassword')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+    def captured(self):
+        return CaptureQueriesContext(connections['default']), CaptureQueriesContext(connections['replica'])
+
+    def tables(self, context):
+        return {table for query in context.captured_queries for table in re.findall(r'FROM "(\w+)"', query['sql'])}
+
+    def test_reads_reach_the_replica(self):
+        primary, replica = self.captured()
+        with primary, replica:
+            response = self.client.get('/api/v1/customer/')
+            self.assertEqual(response.data['count'], 1)
+            response = self.client.get('/api/v1/customer/1000')
+            self.assertEqual(response.data['dni'], 123456789)
+
+        self.assertEqual(self.tables(replica), {'customer_customer'})
+        self.assertEqual(self.tables(primary), {'authtoken_token'})
+
+    def test_writes_and_pinned_reads_stay_on_the_primary(self):
+        primary, replica = self.captured()
+        with primary, replica:
+            response = self.client.patch('/api/v1/customer/1000', {'user': {'name': 'other'}}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.get('/api/v1/customer/1000')
+            self.assertEqual(response.data['user']['name'], 'other')
+
+        self.assertEqual(replica.captured_queries, [])
+        self.assertTrue([query for query in primary.captured_queries if query['sql'].startswith('UPDATE')])
+        self.assertIn('customer_customer', self.tables(primary))
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        registry.clear()
+
+    def test_file_store_adds_up_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first, second = FileStore(directory), FileStore(directory)
+            first.inc('requests', 1)
+            with mock.patch('os.getpid', return_value=os.getpid() + 1):
+                second.inc('requests', 2)
+                second.inc('bytes', 10)
+            for index in range(2000):
+                first.inc('key %d' % index, 1)
+            first.inc('requests', 0.5)
+
+            values = first.read()
+            self.assertEqual(values['requests'], 3.5)
+            self.assertEqual(values['bytes'], 10)
+            self.assertEqual(values['key 1999'], 1)
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+            first.clear()
+            self.assertEqual(first.read(), {})
+
+    def test_render(self):
+        metrics = Registry()
+        metrics.inc('http_requests_total', view='customer-list-create', method='GET', status='200')
+        metrics.observe('http_request_duration_seconds', 0.03, view='customer-list-create', method='GET')
+
+        lines = metrics.render().splitlines()
+        self.assertIn('# TYPE nubi_http_requests_total counter', lines)
+        self.assertIn('nubi_http_requests_total{method="GET",status="200",view="customer-list-create"} 1', lines)
+        self.assertIn('# TYPE nubi_http_request_duration_seconds histogram', lines)
+        self.assertIn('nubi_http_request_duration_seconds_bucket{le="0.025",method="GET",view="customer-list-create"} 0', lines)
+        self.assertIn('nubi_http_request_duration_seconds_bucket{le="0.05",method="GET",view="customer-list-create"} 1', lines)
+        self.assertIn('nubi_http_request_duration_seconds_bucket{le="+Inf",method="GET",view="customer-list-create"} 1', lines)
+        self.assertIn('nubi_http_request_duration_seconds_count{method="GET",view="customer-list-create"} 1', lines)
+
+    def test_requests_are_recorded(self):
+        user = User.objects.create_user(username='metrics', password='testpassword')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+        response = client.get('/api/v1/customer/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+, total;dur=[\d.]+$')
+
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.0/8']):
+            response = APIClient().get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = response.content.decode().splitlines()
+        self.assertIn('nubi_http_requests_total{method="GET",status="200",view="customer-list-create"} 1', lines)
+        self.assertIn('nubi_http_request_duration_seconds_count{method="GET",view="customer-list-create"} 1', lines)
+        queries = [line for line in lines if line.startswith('nubi_db_queries_total{view="customer-list-create"}')]
+        self.assertEqual(len(queries), 1)
+        self.assertGreater(float(queries[0].split()[-1]), 0)
+        self.assertTrue(any(line.startswith('nubi_http_response_bytes_total{method="GET",view="customer-list-create"}') for line in lines))
+
+
+    def test_metrics_need_an_allowed_address_or_the_token(self):
+        client = APIClient()
+        self.assertEqual(client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8', '::1']):
+            self.assertEqual(client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, status.HTTP_200_OK)
+            self.assertEqual(client.get('/metrics', REMOTE_ADDR='::1').status_code, status.HTTP_200_OK)
+
+        with override_settings(METRICS_TOKEN='scrape'):
+            self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer other').status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').status_code, status.HTTP_200_OK)
+
+    async def test_middleware_runs_on_the_event_loop(self):
+        user = await User.objects.acreate(username='metrics')
+        token = await Token.objects.acreate(user=user)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        with override_settings(PROFILING_DIR=directory.name, METRICS_ALLOWED_IPS=['127.0.0.0/8']):
+            handler = BaseHandler()
+            with self.assertLogs('django.request', 'DEBUG') as logs:
+                logging.getLogger('django.request').debug('Loading the middleware')
+                handler.load_middleware(is_async=True)
+
+            request = AsyncRequestFactory().get(
+                '/api/v1/customer/', headers={'Authorization': 'Token ' + token.key, 'X-Profile': make_token()}
+            )
+            response = await handler.get_response_async(request)
+
+        self.assertEqual([line for line in logs.output if 'adapted' in line], [])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1)), 0)
+        self.assertEqual([os.path.basename(path) for path in profile_paths(directory.name)], [response['X-Profile-File']])
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        user = User.objects.create_user(username='profiler', password='testpassword')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+    def test_signed_header(self):
+        with override_settings(PROFILING_DIR=self.directory.name):
+            self.assertEqual(self.client.get('/api/v1/customer/').status_code, status.HTTP_200_OK)
+            self.assertEqual(profile_paths(self.directory.name), [])
+
+            response = self.client.get('/api/v1/customer/', HTTP_X_PROFILE='profile:forged')
+            self.assertNotIn('X-Profile-File', response)
+            self.assertEqual(profile_paths(self.directory.name), [])
+
+            response = self.client.get('/api/v1/customer/', HTTP_X_PROFILE=make_token())
+
+        paths = profile_paths(self.directory.name)
+        self.assertEqual([os.path.basename(path) for path in paths], [response['X-Profile-File']])
+        self.assertEqual(profile_view(paths[0]), 'customer-list-create')
+
+        output = io.StringIO()
+        call_command('profile_report', dir=self.directory.name, view='customer-list-create', top=5, stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], '1 profiles')
+        self.assertEqual(len(lines), 7)
+
+    def test_sample_rate_and_rotation(self):
+        with override_settings(PROFILING_DIR=self.directory.name, PROFILING_SAMPLE_RATE=1, PROFILING_MAX_FILES=2):
+            for _ in range(3):
+                self.client.get('/api/v1/customer/')
+
+        self.assertEqual(len(profile_paths(self.directory.name)), 2)
+
+
+class QueryInspectorTestCase(TestCase):
+    def test_normalize(self):
+        self.assertEqual(
+            normalize("SELECT *  FROM \"t\" WHERE \"t\".\"id\" IN (%s, %s, %s) AND name = 'o''k' LIMIT 21"),
+            'SELECT * FROM "t" WHERE "t"."id" IN (...) AND name = ? LIMIT ?'
+        )
+        self.assertEqual(normalize('SELECT 1 WHERE id IN (%s)'), normalize('SELECT 2 WHERE id IN (%s, %s)'))
+
+    def test_groups_queries_and_logs_slow_ones(self):
+        inspector = QueryInspector()
+        with override_settings(QUERY_SLOW_MS=0), self.assertLogs('challenge.query_inspector', 'WARNING') as logs:
+            with connection.execute_wrapper(inspector):
+                for pk in range(3):
+                    list(Customer.objects.filter(pk=pk))
+                list(User.objects.all())
+
+        self.assertEqual(len(logs.records), 4)
+        self.assertIn('challenge/tests.py', logs.output[0])
+        repeated = inspector.repeated()
+        self.assertEqual(len(repeated), 1)
+        sql, count, site = repeated[0]
+        self.assertIn('FROM "customer_customer" WHERE "customer_customer"."id" = %s', sql)
+        self.assertEqual(count, 3)
+        self.assertIn('challenge/tests.py', site)
+
+    @override_settings(QUERY_INSPECTOR_SAMPLE_RATE=1, QUERY_REPEAT_THRESHOLD=1)
+    def test_sampled_requests_warn(self):
+        user = User.objects.create_user(username='inspected', password='testpassword')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+        with self.assertLogs('challenge.query_inspector', 'WARNING') as logs:
+            self.assertEqual(client.get('/api/v1/customer/').status_code, status.HTTP_200_OK)
+        self.assertIn('GET /api/v1/customer/ repeated queries', logs.output[-1])
+
+
+class FormatsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for index in range(5):
+            customer_user = CustomerUser.objects.create(email='format%d@example.com' % index, name='Núñez', last_name='last_name')
+            Customer.objects.create(
+                id=1000 + index, user=customer_user, sex_tape='Male', dni=index + 1, birth_date='2000-01-01T00:00:00Z'
+            )
+        user = User.objects.create_user(username='formats', password='testpassword')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+    def test_orjson_renders_like_json_renderer(self):
+        response = self.client.get('/api/v1/customer/')
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+        self.assertEqual(
+            ORJSONRenderer().render({'id': uuid.UUID(int=1), 'at': datetime(2000, 1, 2, 3, 4, 5, tzinfo=timezone.utc)}),
+            b'{"id":"00000000-0000-0000-0000-000000000001","at":"2000-01-02T03:04:05Z"}'
+        )
+
+    def test_orjson_edge_cases(self):
+        renderer = ORJSONRenderer()
+        data = {'text': 'a\u2028b\u2029c', 'big': 2 ** 70}
+
+        self.assertEqual(renderer.render({'text': 'a\u2028b\u2029c'}), b'{"text":"a\\u2028b\\u2029c"}')
+        self.assertEqual(renderer.render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            renderer.render(data, 'application/json; indent=2'), JSONRenderer().render(data, 'application/json; indent=2')
+        )
+
+        body = b'{"big": 123456789012345678901234567890, "small": 1}'
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), {'big': 123456789012345678901234567890, 'small': 1})
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"big": 12345678901234567890'))
+
+    def test_msgpack(self):
+        response = self.client.get('/api/v1/customer/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), self.client.get('/api/v1/customer/').json())
+
+        body = {
+            'sex_tape': 'Female', 'dni': 99, 'birth_date': '1990-01-01T00:00:00Z',
+            'user': {'email': 'packed@example.com', 'name': 'name', 'last_name': 'last_name'},
+        }
+        response = self.client.post(
+            '/api/v1/customer/', msgpack.packb(body), content_type='application/msgpack', HTTP_ACCEPT='application/msgpack'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(msgpack.unpackb(response.content)['user']['email'], 'packed@example.com')
+
+        response = self.client.post('/api/v1/customer/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_BYTES=500)
+    def test_compression(self):
+        response = self.client.get('/api/v1/customer/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.client.get('/api/v1/customer/').content)
+        etag = response['ETag']
+        self.assertTrue(etag.endswith('+gzip"'))
+
+        not_modified = self.client.get('/api/v1/customer/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        detail = self.client.get('/api/v1/customer/1000', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', detail)
+        self.assertFalse(detail['ETag'].endswith('+gzip"'))
+
+        response = self.client.patch(
+            '/api/v1/customer/1000', {'dni': 7}, format='json', HTTP_IF_MATCH=detail['ETag'][:-1] + '+gzip"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
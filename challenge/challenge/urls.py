@@ -18,10 +18,13 @@ from django.contrib import admin
 from django.conf.urls import include
 from django.urls import path
 from auth import urls as auth_urls
+from challenge.views import DatabasePoolStatsView, metrics
 from customer import urls as customer_urls
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/auth/', include(auth_urls)),
     path('api/v1/', include(customer_urls)),
+    path('api/v1/db/pool/', DatabasePoolStatsView.as_view(), name='db-pool-stats'),
+    path('metrics', metrics, name='metrics'),
 ]
@@ -0,0 +1,43 @@
+import ipaddress
+from hmac import compare_digest
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from challenge.db.pool import pools
+from challenge.metrics.registry import registry
+
+
+class DatabasePoolStatsView(APIView):
+    """
+    Connection pool stats of the process that answers, by database alias
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(pools.stats())
+
+
+def metrics_allowed(request):
+    """
+    A bearer METRICS_TOKEN or a client address in METRICS_ALLOWED_IPS, nobody when both are empty
+    """
+    authorization = request.headers.get('Authorization', '')
+    if settings.METRICS_TOKEN and compare_digest(authorization.encode(), ('Bearer ' + settings.METRICS_TOKEN).encode()):
+        return True
+
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in settings.METRICS_ALLOWED_IPS)
+
+
+def metrics(request):
+    """
+    Request metrics of all the worker processes, in Prometheus text format
+    """
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
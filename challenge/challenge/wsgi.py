@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'challenge.settings')
 
 application = get_wsgi_application()
+
+from auth.purge import start_purge_thread  # noqa: E402
+
+start_purge_thread()
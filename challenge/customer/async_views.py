@@ -0,0 +1,278 @@
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import MethodNotAllowed, NotAuthenticated
+from rest_framework.filters import OrderingFilter
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+from django_filters.rest_framework import DjangoFilterBackend
+from auth.authentication import AsyncSignedTokenAuthentication, AsyncTokenAuthenticationV2
+from customer import sharding
+from customer.cache import customer_cache
+from customer.conditional import (
+    PreconditionFailed, if_match_versions, make_etag, page_validators, precondition_response, set_validators,
+    version_etag
+)
+from customer.models import Customer
+from customer.pagination import AsyncCustomerListPagination, AsyncCustomerKeysetPagination
+from customer.serializers import CustomerReadSerializer, CustomerSerializer, requested_fields
+from customer.views import READ_METHODS, CustomerListCreateView
+
+
+class AsyncAPIView(View):
+    """
+    Minimal async counterpart of APIView: token authentication, content negotiation and the
+    DRF exception handler. Queries go through the async ORM, writes through sync_to_async
+    """
+    authentication_classes = [AsyncSignedTokenAuthentication, AsyncTokenAuthenticationV2]
+    # The browsable API renders through an APIView
+    renderer_classes = [
+        renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES if not issubclass(renderer, BrowsableAPIRenderer)
+    ]
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+    content_negotiation_class = api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS
+    serializer_class = CustomerSerializer
+    read_serializer_class = CustomerReadSerializer
+    queryset = Customer.objects.select_related('user')
+    # ?fields= of a GET, as in the sync views
+    read_fields = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        """
+        Token authentication carries no cookie to forge, so CSRF is not checked, as in APIView
+        """
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.request = Request(
+            request, parsers=[parser() for parser in self.parser_classes], negotiator=self.content_negotiation_class()
+        )
+
+        try:
+            self.perform_content_negotiation(self.request)
+            await self.authenticate(self.request)
+            if sharding.enabled():
+                raise sharding.ShardingNotSupported()
+            if request.method.lower() not in self.http_method_names:
+                raise MethodNotAllowed(request.method)
+            handler = getattr(self, request.method.lower(), None)
+            if handler is None:
+                raise MethodNotAllowed(request.method)
+            response = await handler(self.request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        return self.finalize_response(response)
+
+    def perform_content_negotiation(self, request, force=False):
+        """
+        APIView.perform_content_negotiation: a 406 for an Accept no renderer serves,
+        the first renderer when forced to render the error
+        """
+        renderers = [renderer() for renderer in self.renderer_classes]
+        try:
+            selected = request.negotiator.select_renderer(request, renderers)
+        except Exception:
+            if not force:
+                raise
+            selected = (renderers[0], renderers[0].media_type)
+        request.accepted_renderer, request.accepted_media_type = selected
+
+    async def authenticate(self, request):
+        for authentication_class in self.authentication_classes:
+            result = await authentication_class().aauthenticate(request)
+            if result is not None:
+                request.user, request.auth = result
+                return
+        raise NotAuthenticated()
+
+    def handle_exception(self, exc):
+        response = exception_handler(exc, {'view': self, 'request': self.request})
+        if response is None:
+            raise exc
+        if response.status_code == status.HTTP_401_UNAUTHORIZED:
+            response['WWW-Authenticate'] = 'Token'
+        return response
+
+    def finalize_response(self, response):
+        if isinstance(response, Response):
+            if not getattr(self.request, 'accepted_renderer', None):
+                self.perform_content_negotiation(self.request, force=True)
+            response.accepted_renderer = self.request.accepted_renderer
+            response.accepted_media_type = self.request.accepted_media_type
+            patch_vary_headers(response, ['Accept'])
+            response.renderer_context = {'view': self, 'request': self.request, 'response': response}
+            response.render()
+        return response
+
+    async def options(self, request, *args, **kwargs):
+        return Response(headers={'Allow': ', '.join(self._allowed_methods())})
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', {'request': self.request, 'view': self, 'fields': self.read_fields})
+        return self.get_serializer_class()(*args, **kwargs)
+
+    def get_serializer_class(self):
+        if self.request.method in READ_METHODS:
+            return self.read_serializer_class
+        return self.serializer_class
+
+
+class AsyncCustomerRetrieveUpdateDestroyView(AsyncAPIView):
+    """
+    Async CustomerRetrieveUpdateDestroyView: same cache, validators and If-Match handling
+    """
+    http_method_names = ['get', 'put', 'patch', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        if self.request.method in READ_METHODS:
+            return self.read_serializer_class.read_queryset(
+                self.queryset, 'updated_at', 'version', fields=self.read_fields
+            )
+        return self.queryset
+
+    async def get_object(self):
+        try:
+            return await self.get_queryset().aget(pk=self.kwargs['pk'])
+        except Customer.DoesNotExist:
+            raise Http404
+
+    async def load(self):
+        instance = await self.get_object()
+        return {
+            'data': self.get_serializer(instance).data, 'updated_at': instance['updated_at'], 'version': instance['version']
+        }
+
+    async def get(self, request, pk):
+        """
+        ?fields= as in CustomerRetrieveUpdateDestroyView.retrieve
+        """
+        fields = requested_fields(request.query_params)
+        if fields is not None and customer_cache.timeout <= 0:
+            self.read_fields = fields
+            entry = await self.load()
+        else:
+            entry = await customer_cache.aget(pk, self.load)
+
+        data = entry['data']
+        if fields is not None:
+            data = {name: data[name] for name in fields}
+        etag = version_etag(entry['version'], request.accepted_renderer.format, fields)
+        response = precondition_response(request, etag, entry['updated_at'])
+        return set_validators(response or Response(data), etag, entry['updated_at'])
+
+    head = get
+
+    async def put(self, request, pk):
+        instance = await self.get_object()
+        context = {'request': request, 'view': self, 'if_match': if_match_versions(request)}
+        serializer = self.get_serializer(instance, data=request.data, partial=True, context=context)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        customer = await sync_to_async(serializer.save)()
+
+        response = Response(serializer.data)
+        response['ETag'] = version_etag(customer.version, request.accepted_renderer.format)
+        return response
+
+    patch = put
+
+    async def delete(self, request, pk):
+        instance = await self.get_object()
+        if_match = if_match_versions(request)
+        if if_match is None:
+            await sync_to_async(instance.delete)()
+        elif instance.version not in if_match:
+            raise PreconditionFailed()
+        elif not (await Customer.objects.filter(pk=instance.pk, version=instance.version).adelete())[0]:
+            raise PreconditionFailed()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class AsyncCustomerListCreateView(AsyncAPIView):
+    """
+    Async CustomerListCreateView: same filters, ordering, pagination and validators
+    """
+    http_method_names = ['get', 'post', 'head', 'options']
+    pagination_class = AsyncCustomerListPagination
+    keyset_pagination_class = AsyncCustomerKeysetPagination
+
+    filter_backends = [OrderingFilter, DjangoFilterBackend]
+    ordering_fields = CustomerListCreateView.ordering_fields
+    ordering = CustomerListCreateView.ordering
+    filterset_fields = CustomerListCreateView.filterset_fields
+
+    def keyset(self):
+        return self.request.query_params.get('pagination') == 'keyset'
+
+    def get_queryset(self):
+        """
+        The columns of CustomerListCreateView.get_queryset
+        """
+        if self.request.method not in READ_METHODS:
+            return self.queryset.all()
+        columns = ('updated_at', 'version') if self.keyset() else ()
+        if self.read_fields is None:
+            return self.read_serializer_class.read_queryset(self.queryset, *columns)
+
+        ordering = [field.lstrip('-') for field in OrderingFilter().get_ordering(self.request, self.queryset, self)]
+        return self.read_serializer_class.read_queryset(self.queryset, *ordering, *columns, fields=self.read_fields)
+
+    def filter_queryset(self, queryset):
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(self.request, queryset, self)
+        return queryset
+
+    async def get(self, request):
+        self.read_fields = requested_fields(request.query_params)
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.keyset():
+            return await self.keyset_get(request, queryset)
+
+        validators = await queryset.aaggregate(last_modified=Max('updated_at'), count=Count('*'))
+        last_modified = validators['last_modified']
+        etag = make_etag(
+            'customers', request.get_full_path(), request.accepted_renderer.format,
+            last_modified.isoformat() if last_modified else '', validators['count']
+        )
+
+        response = precondition_response(request, etag, last_modified, use_last_modified=False)
+        if response is None:
+            paginator = self.pagination_class()
+            paginator.count = validators['count']
+            page = await paginator.apaginate_queryset(queryset, request, view=self)
+            response = paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        return set_validators(response, etag, last_modified)
+
+    head = get
+
+    async def keyset_get(self, request, queryset):
+        """
+        Validated by the rows of the page, like CustomerListCreateView.keyset_list
+        """
+        paginator = self.keyset_pagination_class()
+        page = await paginator.apaginate_queryset(queryset, request, view=self)
+        etag, last_modified = page_validators(
+            request, request.accepted_renderer.format, page, paginator.has_next, paginator.has_previous
+        )
+
+        response = precondition_response(request, etag, last_modified, use_last_modified=False)
+        if response is None:
+            response = paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+        return set_validators(response, etag, last_modified)
+
+    async def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await sync_to_async(serializer.save)()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -0,0 +1,275 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework import serializers
+from customer import models
+from customer.cache import customer_cache
+
+DNI_EXISTS = 'customer with this dni already exists.'
+EMAIL_EXISTS = 'customer user with this email already exists.'
+WALLET_ID_EXISTS = 'customer with this wallet id already exists.'
+UNIQUE_SWAP = 'Swapping unique values between items is not supported.'
+
+# Unique fields a bulk item can set: model, column and error
+UNIQUE_FIELDS = {
+    'dni': (models.Customer, 'dni', {'dni': [DNI_EXISTS]}),
+    'wallet_id': (models.Customer, 'wallet_id', {'wallet_id': [WALLET_ID_EXISTS]}),
+    'email': (models.CustomerUser, 'email', {'user': {'email': [EMAIL_EXISTS]}}),
+}
+
+
+def validate_batch_size(items):
+    if not isinstance(items, list):
+        raise serializers.ValidationError({'non_field_errors': ['Expected a list of items.']})
+
+    if len(items) > settings.CUSTOMER_BULK_MAX_ITEMS:
+        raise serializers.ValidationError({
+            'non_field_errors': ['Ensure this list has no more than %d items.' % settings.CUSTOMER_BULK_MAX_ITEMS]
+        })
+
+
+def validate_unique_batch(entries):
+    """
+    Checks dni, wallet_id and email uniqueness for every validated entry with one query
+    each, returns the errors by position. The values of an entry are taken for the later
+    ones only when it passes every check, a rejected entry is not created
+    """
+    values = {
+        name: [value for value in (unique_values(data)[name] for data in entries.values()) if value is not None]
+        for name in UNIQUE_FIELDS
+    }
+    seen = {
+        name: set(model.objects.filter(**{column + '__in': values[name]}).values_list(column, flat=True))
+        for name, (model, column, _) in UNIQUE_FIELDS.items()
+    }
+
+    errors = {}
+
+    for index, data in entries.items():
+        entry_values = unique_values(data)
+
+        for name, value in entry_values.items():
+            if value is not None and value in seen[name]:
+                errors.setdefault(index, {}).update(UNIQUE_FIELDS[name][2])
+
+        if index not in errors:
+            for name, value in entry_values.items():
+                seen[name].add(value)
+
+    return errors
+
+
+def unique_values(data):
+    return {'dni': data.get('dni'), 'wallet_id': data.get('wallet_id'), 'email': data.get('user', {}).get('email')}
+
+
+def create_batch(entries):
+    """
+    Inserts users and customers with one INSERT each inside a single transaction,
+    returns the customers by position
+    """
+    users = [models.CustomerUser(**data['user']) for data in entries.values()]
+    customers = [
+        models.Customer(user=user, **{key: value for key, value in data.items() if key != 'user'})
+        for user, data in zip(users, entries.values())
+    ]
+
+    try:
+        with transaction.atomic():
+            models.CustomerUser.objects.bulk_create(users)
+            models.Customer.objects.bulk_create(customers)
+    except IntegrityError:
+        raise serializers.ValidationError({
+            'non_field_errors': ['The batch conflicts with a concurrent write, nothing was created.']
+        })
+
+    return dict(zip(entries.keys(), customers))
+
+
+def load_targets(entries):
+    """
+    Loads every customer addressed by id or wallet_id with one query,
+    returns the customers by position and the errors for the missing or repeated ones
+    """
+    ids = [data['id'] for data in entries.values() if 'id' in data]
+    wallet_ids = [data['wallet_id'] for data in entries.values() if 'wallet_id' in data]
+
+    customers = models.Customer.objects.select_related('user').filter(Q(id__in=ids) | Q(wallet_id__in=wallet_ids))
+    by_id = {customer.id: customer for customer in customers}
+    by_wallet_id = {customer.wallet_id: customer for customer in by_id.values()}
+
+    targets = {}
+    errors = {}
+    seen = set()
+
+    for index, data in entries.items():
+        customer = by_id.get(data['id']) if 'id' in data else by_wallet_id.get(data['wallet_id'])
+
+        if customer is None:
+            errors[index] = {'detail': 'Not found.'}
+        elif customer.id in seen:
+            errors[index] = {'non_field_errors': ['This customer is already updated by another item.']}
+        else:
+            targets[index] = customer
+            seen.add(customer.id)
+
+    return targets, errors
+
+
+def unique_changes(customer, fields):
+    """
+    {field: (current value, new value)} of the unique values an item changes
+    """
+    current = {'dni': customer.dni, 'wallet_id': customer.wallet_id, 'email': customer.user.email}
+    return {
+        name: (current[name], value) for name, value in unique_values(fields).items()
+        if value is not None and value != current[name]
+    }
+
+
+def owner(customer, name):
+    return customer.user_id if name == 'email' else customer.pk
+
+
+def validate_unique_changes(targets, entries):
+    """
+    Checks the new dni, wallet_id and email values against the database and the rest of
+    the batch, with one query each. A value an item leaves is free for the others, unless
+    that item is rejected: the checks run again without the rejected items until no new
+    error shows up
+    """
+    changes = {index: unique_changes(customer, entries[index]['fields']) for index, customer in targets.items()}
+    changes = {index: change for index, change in changes.items() if change}
+
+    owners = {}
+    for name, (model, column, _) in UNIQUE_FIELDS.items():
+        values = [change[name][1] for change in changes.values() if name in change]
+        owners[name] = dict(model.objects.filter(**{column + '__in': values}).values_list(column, 'pk'))
+
+    errors = {}
+
+    while True:
+        accepted = {index: change for index, change in changes.items() if index not in errors}
+        new_errors = claim_changes(targets, accepted, owners)
+        _, cycles = write_order({index: change for index, change in accepted.items() if index not in new_errors})
+        new_errors.update((index, {'non_field_errors': [UNIQUE_SWAP]}) for index in cycles)
+        if not new_errors:
+            return errors
+        errors.update(new_errors)
+
+
+def claim_changes(targets, changes, owners):
+    """
+    The items release the values they leave, then take their new ones in order unless the
+    database or an earlier item holds them. Returns the errors of the items that cannot
+    """
+    holders = {name: dict(values) for name, values in owners.items()}
+
+    for index, change in changes.items():
+        for name, (current, _) in change.items():
+            if holders[name].get(current) == owner(targets[index], name):
+                del holders[name][current]
+
+    errors = {}
+
+    for index, change in changes.items():
+        entry_errors = {}
+        for name, (_, value) in change.items():
+            if holders[name].get(value, owner(targets[index], name)) != owner(targets[index], name):
+                entry_errors.update(UNIQUE_FIELDS[name][2])
+
+        if entry_errors:
+            errors[index] = entry_errors
+        else:
+            for name, (_, value) in change.items():
+                holders[name][value] = owner(targets[index], name)
+
+    return errors
+
+
+def write_order(changes):
+    """
+    The unique constraints are checked row by row, so an item that takes a value another
+    item leaves is written after it. Returns the indexes in waves, every wave written after
+    the ones it depends on, and the indexes left out by a swap
+    """
+    leaving = {(name, current): index for index, change in changes.items() for name, (current, _) in change.items()}
+    depends = {
+        index: {leaving[name, value] for name, (_, value) in change.items() if (name, value) in leaving} - {index}
+        for index, change in changes.items()
+    }
+
+    waves = []
+    written = set()
+    pending = set(changes)
+
+    while pending:
+        wave = sorted(index for index in pending if depends[index] <= written)
+        if not wave:
+            break
+        waves.append(wave)
+        written.update(wave)
+        pending.difference_update(wave)
+
+    # Items that nothing left out depends on only wait for a swap, they are rejected by the next check
+    while True:
+        free = {index for index in pending if not any(index in depends[other] for other in pending)}
+        if not free:
+            return waves, pending
+        pending -= free
+
+
+def apply_changes(instance, data):
+    changed = []
+    for key, value in data.items():
+        if getattr(instance, key) != value:
+            setattr(instance, key, value)
+            changed.append(key)
+    return tuple(sorted(changed))
+
+
+def update_batch(targets, entries):
+    """
+    Writes the changed values with one bulk_update per model and changed-field set, and per
+    wave of write_order when items take values that others leave
+    """
+    changes = {index: unique_changes(customer, entries[index]['fields']) for index, customer in targets.items()}
+    waves, _ = write_order({index: change for index, change in changes.items() if change})
+    wave_of = {index: number for number, wave in enumerate(waves) for index in wave}
+
+    customer_groups = defaultdict(list)
+    user_groups = defaultdict(list)
+    now = timezone.now()
+
+    for index, customer in targets.items():
+        fields = dict(entries[index]['fields'])
+        user_fields = apply_changes(customer.user, fields.pop('user', {}))
+        customer_fields = apply_changes(customer, fields)
+        wave = wave_of.get(index, 0)
+
+        if user_fields:
+            user_groups[wave, user_fields].append(customer.user)
+        if user_fields or customer_fields:
+            # bulk_update does not apply auto_now
+            customer.updated_at = now
+            customer.version = F('version') + 1
+            customer_groups[wave, customer_fields + ('updated_at', 'version')].append(customer)
+
+    try:
+        with transaction.atomic():
+            for (_, fields), users in sorted(user_groups.items()):
+                models.CustomerUser.objects.bulk_update(users, fields)
+            for (_, fields), customers in sorted(customer_groups.items()):
+                models.Customer.objects.bulk_update(customers, fields)
+    except IntegrityError:
+        raise serializers.ValidationError({
+            'non_field_errors': ['The batch conflicts with a concurrent write, nothing was updated.']
+        })
+
+    # bulk_update sends no post_save signals
+    for customer in targets.values():
+        customer_cache.invalidate(customer.pk)
+
+    return targets
@@ -0,0 +1,197 @@
+import asyncio
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from challenge.db.replicas import primary
+from challenge.metrics.registry import registry
+
+
+class Flight:
+    """
+    One in-progress load, shared by the threads that missed the same key
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CustomerCache:
+    """
+    Read-through cache of the serialized customers by pk, on top of the cache framework.
+    A cold key is loaded once: the threads of a process wait for the same Flight and
+    the other processes for a lock key added to the cache
+    """
+    prefix = 'customer:detail:'
+    lock_timeout = 5
+    poll_interval = 0.02
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.async_flights = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[settings.CUSTOMER_CACHE_ALIAS]
+
+    @property
+    def timeout(self):
+        return settings.CUSTOMER_CACHE_TIMEOUT
+
+    def key(self, pk):
+        return '%s%s' % (self.prefix, pk)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def count(self, hit):
+        registry.inc('customer_cache_requests_total', result='hit' if hit else 'miss')
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, pk, load):
+        """
+        Returns the cached data of the customer, calling load() on a miss
+        """
+        if self.timeout <= 0:
+            return load()
+
+        data = self.cache.get(self.key(pk))
+        self.count(data is not None)
+        if data is not None:
+            return data
+
+        with self.lock:
+            flight = self.flights.get(pk)
+            leader = flight is None
+            if leader:
+                flight = self.flights[pk] = Flight()
+
+        if not leader:
+            if not flight.done.wait(self.lock_timeout):
+                return load()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self.fill(pk, load)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[pk]
+            flight.done.set()
+
+        return flight.result
+
+    def fill(self, pk, load):
+        """
+        Loads the key holding its lock. The result is not stored when the customer was
+        invalidated meanwhile, as it may have been read before that write
+        """
+        key = self.key(pk)
+        lock_key = key + ':lock'
+        deadline = time.monotonic() + self.lock_timeout
+
+        while not self.cache.add(lock_key, 1, self.lock_timeout):
+            time.sleep(self.poll_interval)
+            data = self.cache.get(key)
+            if data is not None:
+                return data
+            if time.monotonic() > deadline:
+                return load()
+
+        try:
+            data = self.cache.get(key)
+            if data is not None:
+                return data
+
+            generation = self.cache.get(key + ':generation', 0)
+            # Entries outlive the replication lag, they are read from the primary
+            with primary():
+                data = load()
+            if self.cache.get(key + ':generation', 0) == generation:
+                self.cache.set(key, data, self.timeout)
+            return data
+        finally:
+            self.cache.delete(lock_key)
+
+    async def aget(self, pk, aload):
+        """
+        get() for async views: the tasks of the event loop that missed the same key
+        await one load
+        """
+        if self.timeout <= 0:
+            return await aload()
+
+        data = await self.cache.aget(self.key(pk))
+        self.count(data is not None)
+        if data is not None:
+            return data
+
+        flight = self.async_flights.get(pk)
+        if flight is None:
+            flight = self.async_flights[pk] = asyncio.ensure_future(self.afill(pk, aload))
+            flight.add_done_callback(lambda _: self.async_flights.pop(pk, None))
+
+        return await asyncio.shield(flight)
+
+    async def afill(self, pk, aload):
+        key = self.key(pk)
+        lock_key = key + ':lock'
+        deadline = time.monotonic() + self.lock_timeout
+
+        while not await self.cache.aadd(lock_key, 1, self.lock_timeout):
+            await asyncio.sleep(self.poll_interval)
+            data = await self.cache.aget(key)
+            if data is not None:
+                return data
+            if time.monotonic() > deadline:
+                return await aload()
+
+        try:
+            data = await self.cache.aget(key)
+            if data is not None:
+                return data
+
+            generation = await self.cache.aget(key + ':generation', 0)
+            with primary():
+                data = await aload()
+            if await self.cache.aget(key + ':generation', 0) == generation:
+                await self.cache.aset(key, data, self.timeout)
+            return data
+        finally:
+            await self.cache.adelete(lock_key)
+
+    def invalidate(self, pk, using=None):
+        """
+        Drops the customer now and again once the transaction of the using database commits,
+        so a load that read the previous row in between does not stay cached
+        """
+        if self.timeout <= 0:
+            return
+
+        self.drop(pk)
+        transaction.on_commit(lambda: self.drop(pk), using=using)
+
+    def drop(self, pk):
+        key = self.key(pk)
+        self.cache.delete(key)
+        try:
+            self.cache.incr(key + ':generation')
+        except ValueError:
+            self.cache.set(key + ':generation', 1, self.timeout)
+
+
+customer_cache = CustomerCache()
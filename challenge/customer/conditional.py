@@ -0,0 +1,87 @@
+import re
+from hashlib import md5
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+VERSION_ETAG = re.compile(r'"(\d+)-[\w.]+"')
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The customer was modified, fetch it again.'
+    default_code = 'precondition_failed'
+
+
+def make_etag(*parts):
+    """
+    Strong ETag from the values that identify a representation
+    """
+    return '"%s"' % md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def version_etag(version, renderer_format, fields=None):
+    """
+    Strong ETag of a versioned representation, the version can be read back from If-Match.
+    A subset of the fields is a representation of its own
+    """
+    if fields is not None:
+        renderer_format += '.' + md5(','.join(fields).encode()).hexdigest()[:8]
+    return '"%d-%s"' % (version, renderer_format)
+
+
+def if_match_versions(request):
+    """
+    The versions accepted by If-Match, None without the header or with '*'.
+    Unknown and weak ETags match no version
+    """
+    header = request.META.get('HTTP_IF_MATCH')
+    if not header:
+        return None
+
+    etags = parse_etags(header)
+    if etags == ['*']:
+        return None
+
+    return {int(match[1]) for match in map(VERSION_ETAG.fullmatch, etags) if match}
+
+
+def page_validators(request, renderer_format, rows, *state):
+    """
+    ETag and Last-Modified of a page from its own values() rows (id, version, updated_at),
+    plus any state that changes the page links
+    """
+    last_modified = max((row['updated_at'] for row in rows), default=None)
+    etag = make_etag(
+        'customers', request.get_full_path(), renderer_format, *state,
+        *('%s.%s' % (row['id'], row['version']) for row in rows)
+    )
+    return etag, last_modified
+
+
+def precondition_response(request, etag, last_modified, use_last_modified=True):
+    """
+    The 304 (or 412) answer of the request validators, None when the view has to respond.
+    use_last_modified=False does not evaluate If-Modified-Since
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified and use_last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response.headers['ETag'] = etag
+        if last_modified:
+            response.headers['Last-Modified'] = http_date(int(last_modified.timestamp()))
+    return response
+
+
+def conditional_response(request, etag, last_modified, get_response, use_last_modified=True):
+    """
+    Answers 304 (or 412) from the validators alone: get_response() only runs, and so only
+    serializes, when the copy of the client is stale.
+    Last-Modified is sent even with use_last_modified=False
+    """
+    response = precondition_response(request, etag, last_modified, use_last_modified)
+    return set_validators(response or get_response(), etag, last_modified)
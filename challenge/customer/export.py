@@ -0,0 +1,124 @@
+import csv
+import json
+from contextlib import contextmanager
+from itertools import chain
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from customer import sharding
+
+EXPORT_FIELDS = (
+    'wallet_id', 'sex_tape', 'dni', 'birth_date', 'created_at', 'user__email', 'user__name', 'user__last_name'
+)
+CSV_HEADER = ('wallet_id', 'sex_tape', 'dni', 'birth_date', 'created_at', 'email', 'name', 'last_name')
+
+
+def format_datetime(value):
+    """
+    Same output as DRF's DateTimeField
+    """
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+@contextmanager
+def snapshot(using):
+    """
+    Read-only REPEATABLE READ transaction, so every chunk sees the same snapshot.
+    Inside an enclosing transaction its isolation level is kept
+    """
+    with transaction.atomic(using=using):
+        connection = connections[using]
+        if len(connection.atomic_blocks) == 1:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        yield
+
+
+def iter_rows(queryset, chunk_size=None):
+    """
+    Streams the export columns through a server-side cursor, chunk_size rows at a time
+    """
+    chunk_size = chunk_size or settings.CUSTOMER_EXPORT_CHUNK_SIZE
+
+    with snapshot(queryset.db):
+        for wallet_id, sex_tape, dni, birth_date, created_at, email, name, last_name in (
+            queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+        ):
+            yield (
+                str(wallet_id), sex_tape, dni, format_datetime(birth_date), format_datetime(created_at),
+                email, name, last_name
+            )
+
+
+def ndjson_lines(rows):
+    for wallet_id, sex_tape, dni, birth_date, created_at, email, name, last_name in rows:
+        yield json.dumps({
+            'wallet_id': wallet_id,
+            'sex_tape': sex_tape,
+            'dni': dni,
+            'birth_date': birth_date,
+            'created_at': created_at,
+            'user': {'email': email, 'name': name, 'last_name': last_name},
+        }, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def buffered(lines, size):
+    """
+    Joins lines into blocks of `size` lines, so the server does not flush one write per row
+    """
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) == size:
+            yield ''.join(block)
+            block = []
+    if block:
+        yield ''.join(block)
+
+
+EXPORT_FORMATS = {
+    'ndjson': ndjson_lines,
+    'csv': csv_lines,
+}
+
+
+def stream(queryset, export_format, chunk_size=None):
+    """
+    Sharded customers are exported one shard after another, each from its own snapshot
+    """
+    chunk_size = chunk_size or settings.CUSTOMER_EXPORT_CHUNK_SIZE
+    rows = chain.from_iterable(iter_rows(shard_queryset, chunk_size) for shard_queryset in sharding.split(queryset))
+    return buffered(EXPORT_FORMATS[export_format](rows), chunk_size)
+
+
+async def aiterate(blocks):
+    """
+    The blocks of stream() for an ASGI server, which would otherwise collect a sync
+    iterator whole. Each block is pulled through thread-sensitive sync_to_async, so the
+    cursor and its snapshot stay on the connection of the request thread
+    """
+    pull = sync_to_async(next)
+    try:
+        while True:
+            block = await pull(blocks, None)
+            if block is None:
+                return
+            yield block
+    finally:
+        await sync_to_async(blocks.close)()
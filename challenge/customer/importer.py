@@ -0,0 +1,187 @@
+import csv
+import io
+import json
+import os
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import serializers
+from customer.models import uuid7
+from customer.serializers import CustomerBulkCreateSerializer
+
+STAGING_COLUMNS = ('row_number', 'wallet_id', 'sex_tape', 'dni', 'birth_date', 'created_at', 'email', 'name', 'last_name')
+
+CREATE_STAGING = '''
+    CREATE TEMPORARY TABLE IF NOT EXISTS customer_import_staging (
+        row_number bigint PRIMARY KEY,
+        wallet_id uuid NOT NULL,
+        sex_tape varchar(6) NOT NULL,
+        dni bigint NOT NULL,
+        birth_date timestamptz NOT NULL,
+        created_at timestamptz NOT NULL,
+        email varchar(254) NOT NULL,
+        name varchar(50) NOT NULL,
+        last_name varchar(50) NOT NULL
+    ) ON COMMIT DELETE ROWS
+'''
+
+FIND_DUPLICATES = '''
+    SELECT s.row_number, 'dni', s.dni::text FROM customer_import_staging s
+    JOIN customer_customer c ON c.dni = s.dni
+    UNION ALL
+    SELECT s.row_number, 'email', s.email FROM customer_import_staging s
+    JOIN customer_customeruser u ON u.email = s.email
+    UNION ALL
+    SELECT s.row_number, 'wallet_id', s.wallet_id::text FROM customer_import_staging s
+    JOIN customer_customer c ON c.wallet_id = s.wallet_id
+'''
+
+MERGE = '''
+    WITH users AS (
+        INSERT INTO customer_customeruser (
+            password, is_superuser, first_name, is_staff, is_active, date_joined, email, name, last_name
+        )
+        SELECT '', false, '', false, true, now(), email, name, last_name
+        FROM customer_import_staging ORDER BY row_number
+        RETURNING id, email
+    )
+    INSERT INTO customer_customer (wallet_id, sex_tape, dni, birth_date, created_at, updated_at, version, user_id)
+    SELECT s.wallet_id, s.sex_tape, s.dni, s.birth_date, s.created_at, now(), 1, users.id
+    FROM customer_import_staging s JOIN users ON users.email = s.email
+    ORDER BY s.row_number
+'''
+
+
+class CustomerImportSerializer(CustomerBulkCreateSerializer):
+    """
+    Same field rules as the API, plus the wallet_id and created_at columns of an export
+    """
+    created_at = serializers.DateTimeField(required=False)
+
+
+def read_records(stream, import_format):
+    """
+    Yields the raw records of the input: NDJSON lines or CSV rows as dicts
+    """
+    if import_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+
+    for line in stream:
+        if line.strip():
+            yield line
+
+
+def to_item(record):
+    if isinstance(record, str):
+        return json.loads(record)
+
+    item = dict(record)
+    item['user'] = {key: item.pop(key) for key in ('email', 'name', 'last_name') if key in item}
+    return {key: value for key, value in item.items() if value != ''}
+
+
+def prepare_chunk(chunk):
+    """
+    Decodes and validates one chunk without touching the database, so it can run in a worker process.
+    Returns the row range, the staging rows and the errors by row number.
+    Within the chunk the first occurrence of a dni or email wins
+    """
+    start, records = chunk
+    rows = []
+    errors = []
+    seen = {'dni': set(), 'email': set(), 'wallet_id': set()}
+    now = timezone.now()
+
+    # One serializer for the whole chunk: building its fields costs more than validating a row
+    serializer = CustomerImportSerializer()
+
+    for row_number, record in enumerate(records, start):
+        try:
+            data = serializer.run_validation(to_item(record))
+        except serializers.ValidationError as error:
+            errors.append((row_number, serializers.as_serializer_error(error)))
+            continue
+        except (ValueError, TypeError, AttributeError):
+            errors.append((row_number, {'non_field_errors': ['Malformed record.']}))
+            continue
+
+        values = {
+            'dni': data['dni'],
+            'email': data['user']['email'],
+            'wallet_id': data.get('wallet_id') or uuid7(),
+        }
+
+        duplicated = [field for field, value in values.items() if value in seen[field]]
+        if duplicated:
+            errors.append((row_number, {field: ['duplicated in the input.'] for field in duplicated}))
+            continue
+
+        for field, value in values.items():
+            seen[field].add(value)
+
+        rows.append((
+            row_number, values['wallet_id'], data['sex_tape'], data['dni'], data['birth_date'].isoformat(),
+            data.get('created_at', now).isoformat(), data['user']['email'], data['user']['name'], data['user']['last_name'],
+        ))
+
+    return start, start + len(records), rows, errors
+
+
+def iter_chunks(records, chunk_size, start=1):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield start, chunk
+            start += len(chunk)
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+
+def load_chunk(rows):
+    """
+    COPYs the rows into the staging table and merges the ones that do not clash with existing
+    customers, in one transaction. Returns the number of imported rows and the duplicates
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(CREATE_STAGING)
+        cursor.copy_expert(
+            'COPY customer_import_staging (%s) FROM STDIN WITH (FORMAT csv)' % ', '.join(STAGING_COLUMNS), buffer
+        )
+
+        cursor.execute(FIND_DUPLICATES)
+        duplicates = sorted(cursor.fetchall())
+        if duplicates:
+            cursor.execute(
+                'DELETE FROM customer_import_staging WHERE row_number = ANY(%s)',
+                [list({row_number for row_number, _, _ in duplicates})]
+            )
+
+        cursor.execute(MERGE)
+        imported = cursor.rowcount
+
+        # ON COMMIT DELETE ROWS only applies to a real commit, not to a savepoint release
+        cursor.execute('TRUNCATE customer_import_staging')
+
+    return imported, duplicates
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as checkpoint:
+        return json.load(checkpoint)['rows']
+
+
+def write_checkpoint(path, rows):
+    """
+    Written atomically, so a crash leaves either the previous or the new checkpoint
+    """
+    with open(path + '.tmp', 'w') as checkpoint:
+        json.dump({'rows': rows}, checkpoint)
+    os.replace(path + '.tmp', path)
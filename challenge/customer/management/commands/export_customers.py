@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from customer import export
+from customer.models import Customer
+from customer.views import CustomerListCreateView
+
+
+class Command(BaseCommand):
+    help = 'Streams every customer, with its user fields, as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(export.EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help='Destination file, stdout by default')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per round trip')
+
+        for field in CustomerListCreateView.filterset_fields:
+            parser.add_argument('--%s' % field, dest=field, help='Only customers whose %s matches' % field)
+
+    def handle(self, *args, **options):
+        filters = {
+            field: options[field] for field in CustomerListCreateView.filterset_fields
+            if options[field] is not None
+        }
+        queryset = Customer.objects.filter(**filters).order_by('id')
+        blocks = export.stream(queryset, options['format'], options['chunk_size'])
+
+        if not options['output']:
+            for block in blocks:
+                self.stdout.write(block, ending='')
+            return
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for block in blocks:
+                output.write(block)
@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import django
+from collections import Counter
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from customer import importer, sharding
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads customers from an NDJSON or CSV file (the export_customers formats) through COPY, '
+        'one transaction per chunk. A checkpoint is written after every chunk, running the command '
+        'again resumes from it'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['ndjson', 'csv'], help='Guessed from the file extension by default')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=1, help='Processes parsing and validating chunks')
+        parser.add_argument('--checkpoint', help='Checkpoint file, <path>.checkpoint by default')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        if sharding.enabled():
+            raise CommandError('The import loads the default database, it does not support sharded customers')
+
+        path = options['path']
+        import_format = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        checkpoint = options['checkpoint'] or path + '.checkpoint'
+        done = 0 if options['restart'] else importer.read_checkpoint(checkpoint)
+        totals = Counter()
+
+        if done:
+            self.stdout.write('Resuming after row %d' % done)
+
+        with open(path, newline='', encoding='utf-8') as stream:
+            records = islice(importer.read_records(stream, import_format), done, None)
+            chunks = importer.iter_chunks(records, options['chunk_size'], start=done + 1)
+
+            for start, end, rows, errors in self.prepare(chunks, options['workers']):
+                imported, duplicates = importer.load_chunk(rows) if rows else (0, [])
+                importer.write_checkpoint(checkpoint, end - 1)
+
+                for row_number, row_errors in errors:
+                    self.stdout.write('row %d: invalid %s' % (row_number, row_errors))
+                for row_number, field, value in duplicates:
+                    self.stdout.write('row %d: duplicate %s %s' % (row_number, field, value))
+
+                totals['imported'] += imported
+                totals['invalid'] += len(errors)
+                totals.update('duplicate %s' % field for _, field, _ in duplicates)
+                self.stdout.write('rows %d-%d: %d imported' % (start, end - 1, imported))
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join('%s: %d' % (key, value) for key, value in sorted(totals.items())) or 'Nothing to import'
+        ))
+
+    def prepare(self, chunks, workers):
+        """
+        Chunks are prepared in order, `workers * 2` at a time so the input is never read far ahead of the COPY.
+        Workers are spawned rather than forked, they must not inherit the open database connection
+        """
+        if workers <= 1:
+            yield from map(importer.prepare_chunk, chunks)
+            return
+
+        with multiprocessing.get_context('spawn').Pool(workers, initializer=django.setup) as pool:
+            while True:
+                window = list(islice(chunks, workers * 2))
+                if not window:
+                    return
+                yield from pool.map(importer.prepare_chunk, window)
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:19
+
+import customer.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='wallet_id',
+            field=models.UUIDField(default=customer.models.uuid7, unique=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:36
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, it does not lock writes on the tables
+    atomic = False
+
+    dependencies = [
+        ('customer', '0002_alter_customer_wallet_id'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='customer',
+            index=models.Index(fields=['created_at', 'id'], name='customer_created_at_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='customeruser',
+            index=models.Index(fields=['email'], include=('id', 'name', 'last_name'), name='customeruser_email_cover_idx'),
+        ),
+    ]
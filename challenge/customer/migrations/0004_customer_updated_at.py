@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:12
+
+import django.utils.timezone
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The index is built concurrently, see 0003
+    atomic = False
+
+    dependencies = [
+        ('customer', '0003_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(
+            'UPDATE customer_customer SET updated_at = created_at',
+            migrations.RunSQL.noop,
+        ),
+        AddIndexConcurrently(
+            model_name='customer',
+            index=models.Index(fields=['updated_at'], name='customer_updated_at_idx'),
+        ),
+    ]
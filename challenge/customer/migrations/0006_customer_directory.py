@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0005_customer_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerDirectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('dni', models.BigIntegerField(unique=True)),
+                ('wallet_id', models.UUIDField(unique=True)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+            ],
+        ),
+    ]
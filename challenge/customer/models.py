@@ -2,14 +2,34 @@ from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.db import models
 from customer import choices
 from django.db.models import OneToOneField
+import os
+import time
 import uuid
 
 
+def uuid7():
+    """
+    Time-ordered UUID (version 7): unix milliseconds, a 12 bit sub-millisecond fraction
+    and 62 random bits. Consecutive ids land on the right edge of the wallet_id index
+    instead of random pages, and the unique constraint is the only collision guard
+    """
+    timestamp, fraction = divmod(time.time_ns(), 1_000_000)
+    rand = int.from_bytes(os.urandom(8), 'big')
+
+    value = (timestamp & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76
+    value |= (fraction * 4096 // 1_000_000) << 64
+    value |= 0b10 << 62
+    value |= rand & 0x3FFFFFFFFFFFFFFF
+
+    return uuid.UUID(int=value)
+
+
 def gen_uuid():
-    uid = uuid.uuid4()
-    if Customer.objects.filter(wallet_id=uid).exists():
-        return gen_uuid()
-    return uid
+    """
+    Former wallet_id default, still referenced by migration 0001
+    """
+    return uuid7()
 
 
 class CustomerUser(AbstractUser):
@@ -23,14 +43,44 @@ class CustomerUser(AbstractUser):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Covers ordering the customer list by user__email, joined through id
+            models.Index(fields=['email'], include=['id', 'name', 'last_name'], name='customeruser_email_cover_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
 
 class Customer(models.Model):
-    wallet_id = models.UUIDField(unique=True, default=gen_uuid)
+    wallet_id = models.UUIDField(unique=True, default=uuid7)
     sex_tape = models.CharField(choices=choices.Gender.CHOICES, max_length=6)
     dni = models.BigIntegerField(unique=True)
     birth_date = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also bumped when the user changes
+    updated_at = models.DateTimeField(auto_now=True)
+    # Incremented by every write, the ETag of the customer and the If-Match precondition
+    version = models.PositiveIntegerField(default=1)
     user = OneToOneField('customer.CustomerUser', on_delete=models.CASCADE, related_name='customer')
+
+    class Meta:
+        indexes = [
+            # Default list ordering, id is the keyset tie-breaker
+            models.Index(fields=['created_at', 'id'], name='customer_created_at_id_idx'),
+            # max(updated_at) of the list validator
+            models.Index(fields=['updated_at'], name='customer_updated_at_idx'),
+        ]
+
+
+class CustomerDirectory(models.Model):
+    """
+    Global index of the sharded customers, in the default database: the shard of a
+    wallet_id or an email, and the cross-shard uniqueness of the three columns.
+    The customer and user ids derive from the directory id, see customer.sharding
+    """
+    shard = models.PositiveSmallIntegerField()
+    dni = models.BigIntegerField(unique=True)
+    wallet_id = models.UUIDField(unique=True)
+    email = models.EmailField(unique=True)
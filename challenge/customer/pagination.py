@@ -1,6 +1,203 @@
+import json
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from datetime import date, datetime
+from uuid import UUID
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+
+Cursor = namedtuple('Cursor', ['ordering', 'reverse', 'position'])
+
+
+def is_unique(model, path):
+    """
+    Whether an ordering path (e.g. 'user__email') is unique: every field along it must be
+    """
+    for name in path.split('__'):
+        field = model._meta.get_field(name)
+        if not (field.unique or field.primary_key):
+            return False
+        model = field.related_model
+    return True
+
+
+def lookup(instance, path):
+    """
+    The value of a field path (e.g. 'user__email') of an instance or of a values() row
+    """
+    if isinstance(instance, dict):
+        return instance[path]
+    for attr in path.split('__'):
+        instance = getattr(instance, attr)
+    return instance
+
 
 class CustomerListPagination(pagination.PageNumberPagination):
     page_size_query_param = 'limit'
     page_query_param = 'page'
     page_size = 30
+    # Preset by views that already counted the filtered rows, so the page costs no COUNT(*)
+    count = None
+
+    def django_paginator_class(self, object_list, per_page):
+        paginator = Paginator(object_list, per_page)
+        if self.count is not None:
+            # A cached_property, set in advance the paginator never runs count()
+            paginator.count = self.count
+        return paginator
+
+
+class CustomerKeysetPagination(pagination.CursorPagination):
+    """
+    Keyset pagination over the view ordering with 'id' as tie-breaker.
+    Every page is a single range scan, so it costs the same at any depth
+    """
+    page_size_query_param = 'limit'
+    page_size = 30
+    ordering = 'created_at'
+    tie_breaker = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        The page query, with one row more than the page size to tell whether another page follows
+        """
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_keyset_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        if self.cursor is not None and self.cursor.reverse:
+            queryset = queryset.order_by(*pagination._reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if self.cursor is not None:
+            try:
+                queryset = queryset.filter(self.get_keyset_filter(self.cursor))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.cursor is not None and self.cursor.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        return self.page
+
+    def get_keyset_ordering(self, request, queryset, view):
+        """
+        Unique orderings need no tie-breaker, so their single column index serves the page
+        """
+        field = self.get_ordering(request, queryset, view)[0]
+        tie_breaker = '-' + self.tie_breaker if field.startswith('-') else self.tie_breaker
+
+        if is_unique(queryset.model, field.lstrip('-')):
+            return (field,)
+        return (field, tie_breaker)
+
+    def get_keyset_filter(self, cursor):
+        """
+        `field >= value` is redundant with the OR below, but it is the part
+        the planner can turn into an index condition
+        """
+        field = self.ordering[0]
+        lookup = 'lt' if field.startswith('-') != cursor.reverse else 'gt'
+        field = field.lstrip('-')
+        value, key = cursor.position
+
+        if len(self.ordering) == 1:
+            return Q(**{'%s__%s' % (field, lookup): value})
+
+        return Q(**{'%s__%se' % (field, lookup): value}) & (
+            Q(**{'%s__%s' % (field, lookup): value}) |
+            Q(**{'%s__%s' % (self.tie_breaker, lookup): key})
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            tokens = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_', validate=True))
+            cursor = Cursor(ordering=tokens['o'], reverse=bool(tokens['r']), position=tuple(tokens['p']))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if cursor.ordering != self.ordering[0] or len(cursor.position) != 2:
+            raise NotFound(self.invalid_cursor_message)
+
+        return cursor
+
+    def encode_cursor(self, cursor):
+        tokens = {'o': cursor.ordering, 'r': int(cursor.reverse), 'p': list(cursor.position)}
+        encoded = b64encode(json.dumps(tokens, separators=(',', ':')).encode(), altchars=b'-_')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor(Cursor(ordering=self.ordering[0], reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering)
+        return self.encode_cursor(Cursor(ordering=self.ordering[0], reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        value = lookup(instance, ordering[0].lstrip('-'))
+
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        elif isinstance(value, UUID):
+            value = str(value)
+
+        return (value, lookup(instance, self.tie_breaker))
+
+
+class AsyncCustomerListPagination(CustomerListPagination):
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset with the count and the page fetched through the async ORM
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        paginator = self.django_paginator_class(queryset, page_size)
+        if self.count is None:
+            paginator.count = await queryset.acount()
+
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        bottom = (number - 1) * page_size
+        objects = [obj async for obj in queryset[bottom:bottom + page_size]]
+        self.page = paginator._get_page(objects, number, paginator)
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        return objects
+
+
+class AsyncCustomerKeysetPagination(CustomerKeysetPagination):
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([obj async for obj in self.get_page_queryset(queryset, request, view)])
@@ -0,0 +1,46 @@
+import csv
+import io
+import json
+from rest_framework import renderers
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Export responses are streamed, only error payloads go through render()
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """
+    Export responses are streamed, error payloads are rendered as field,message rows
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(('field', 'message'))
+        writer.writerows(error_rows(data))
+        return output.getvalue()
+
+
+def error_rows(errors, field=''):
+    """
+    (field, message) of every message, nested fields joined with dots
+    """
+    if isinstance(errors, dict):
+        for key, value in errors.items():
+            yield from error_rows(value, '%s.%s' % (field, key) if field else str(key))
+    elif isinstance(errors, list):
+        for value in errors:
+            yield from error_rows(value, field)
+    else:
+        yield field, str(errors)
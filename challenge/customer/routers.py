@@ -0,0 +1,24 @@
+from customer import sharding
+from customer.models import Customer, CustomerUser
+
+
+class ShardRouter:
+    """
+    With sharding enabled, a customer or user instance is written to the shard it was read
+    from, a new customer to the shard of its dni. Querysets pick their shard with using()
+    """
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_instance(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        db = self.db_for_instance(model, instance)
+        if db is None and sharding.enabled() and isinstance(instance, Customer) and instance.dni is not None:
+            return sharding.shard_for_dni(instance.dni)
+        return db
+
+    def db_for_instance(self, model, instance):
+        if not sharding.enabled() or model not in (Customer, CustomerUser) or instance is None:
+            return None
+        return instance._state.db
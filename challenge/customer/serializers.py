@@ -1,5 +1,68 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import Http404
+from django.utils import timezone
 from rest_framework import serializers
-from customer import models
+from customer import models, sharding
+from customer.bulk import apply_changes
+from customer.cache import customer_cache
+from customer.conditional import PreconditionFailed
+from customer.export import format_datetime
+
+# wallet_id is generated without a uniqueness lookup, a collision just retries the insert
+WALLET_ID_RETRIES = 3
+
+# Attempts of an update without If-Match that keeps losing the race against other writes
+VERSION_RETRIES = 3
+
+
+def violated_constraint(error):
+    diag = getattr(error.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None) or ''
+
+
+def unique_violation(error, errors):
+    """
+    The validation error of the unique column an IntegrityError violated, None for other errors
+    """
+    constraint = violated_constraint(error)
+    for column, detail in errors.items():
+        if column in constraint:
+            return serializers.ValidationError(detail)
+    return None
+
+
+# The error shapes of the former uniqueness lookups, by the column of the violated constraint
+CREATE_ERRORS = {
+    'dni': {'dni': ['customer with this dni already exists.']},
+    'wallet_id': {'wallet_id': ['customer with this wallet id already exists.']},
+    'email': {'user': {'user': {'email': 'user with this dni already exists.'}}},
+}
+UPDATE_ERRORS = dict(CREATE_ERRORS, email={'user': {'email': 'User with this email already exists.'}})
+
+
+def create_violations(error, user_data, customer_data):
+    """
+    The validation error of every unique column of a new customer that is taken, None for
+    other errors. The constraint names only the first one, the others are looked up then,
+    so a successful insert still costs no lookup
+    """
+    constraint = violated_constraint(error)
+    violated = next((column for column in CREATE_ERRORS if column in constraint), None)
+    if violated is None:
+        return None
+
+    values = {'dni': customer_data.get('dni'), 'wallet_id': customer_data.get('wallet_id'), 'email': user_data.get('email')}
+    if sharding.enabled():
+        querysets = dict.fromkeys(values, models.CustomerDirectory.objects.all())
+    else:
+        querysets = {'dni': models.Customer.objects, 'wallet_id': models.Customer.objects, 'email': models.CustomerUser.objects}
+
+    errors = {}
+    for column, value in values.items():
+        if column == violated or (value is not None and querysets[column].filter(**{column: value}).exists()):
+            errors.update(CREATE_ERRORS[column])
+    return serializers.ValidationError(errors)
 
 
 class CustomerUserSerializer(serializers.ModelSerializer):
@@ -27,20 +90,6 @@ class CustomerUserSerializer(serializers.ModelSerializer):
             if errors:
                 raise serializers.ValidationError(errors)
 
-            email = data['email']
-
-            if models.CustomerUser.objects.filter(email=email).exists():
-                raise serializers.ValidationError({'user': {'email': 'user with this dni already exists.'}})
-
-        if request.method == 'PUT':
-            email = data.get('email')
-            current_user = self.context.get('instance')
-
-            if email and current_user:
-                qs = models.CustomerUser.objects.exclude(pk=current_user.pk).filter(email=email)
-                if qs.exists():
-                    raise serializers.ValidationError({'user': {'email': 'User with this email already exists.'}})
-
         return data
 
 
@@ -51,25 +100,210 @@ class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Customer
         fields = ('wallet_id', 'sex_tape', 'dni', 'birth_date', 'created_at', 'user')
+        # Uniqueness is left to the constraints, see CREATE_ERRORS and UPDATE_ERRORS
+        extra_kwargs = {'dni': {'validators': []}, 'wallet_id': {'validators': []}}
 
     def create(self, validated_data):
+        """
+        Two INSERTs in one transaction: a failed customer insert does not leave its user behind
+        """
         user_data = validated_data.pop('user', {})
-        user = models.CustomerUser.objects.create(**user_data)
-        customer = models.Customer.objects.create(user=user, **validated_data)
-        return customer
+        # A generated wallet_id that collides is generated again, a given one is an error
+        retries = 1 if 'wallet_id' in validated_data else WALLET_ID_RETRIES
+
+        for attempt in range(1, retries + 1):
+            try:
+                if sharding.enabled():
+                    return sharding.create(user_data, validated_data)
+                with transaction.atomic():
+                    user = models.CustomerUser.objects.create(**user_data)
+                    customer = models.Customer.objects.create(user=user, **validated_data)
+                return customer
+            except IntegrityError as error:
+                if attempt < retries and 'wallet_id' in violated_constraint(error):
+                    continue
+                raise create_violations(error, user_data, validated_data) or error
 
     def update(self, instance, validated_data):
+        """
+        Writes only the changed columns, nothing when the payload matches the customer.
+        The write is conditional on the version the changes were made on: when a concurrent
+        write got there first, the versions of If-Match fail with 412 and a request without
+        it is applied again on the fresh customer
+        """
+        if_match = self.context.get('if_match')
         user_data = validated_data.pop('user', {})
         user = instance.user
         
         user_serializer = CustomerUserSerializer(instance=user, data=user_data, context={'request': self.context['request'], 'instance': user})
         user_serializer.is_valid(raise_exception=True)
-        user_serializer.save()
+        user_data = user_serializer.validated_data
+
+        for attempt in range(1, VERSION_RETRIES + 1):
+            if if_match is not None and instance.version not in if_match:
+                raise PreconditionFailed()
+
+            user_fields = apply_changes(instance.user, user_data)
+            customer_fields = apply_changes(instance, validated_data)
+            if not user_fields and not customer_fields:
+                return instance
+            if 'dni' in customer_fields and sharding.enabled():
+                raise serializers.ValidationError({'dni': ['The dni of a sharded customer cannot change.']})
+
+            if self.write(instance, customer_fields, user_fields):
+                customer_cache.invalidate(instance.pk)
+                return instance
+
+            instance = models.Customer.objects.using(instance._state.db).select_related('user').filter(pk=instance.pk).first()
+            if instance is None:
+                raise Http404
+
+        raise PreconditionFailed()
+
+    def write(self, instance, customer_fields, user_fields):
+        """
+        UPDATE ... WHERE version = N, then the user. False when the version moved meanwhile.
+        A sharded customer updates the directory last, its unique violations roll the shard back
+        """
+        now = timezone.now()
+        using = instance._state.db
+
+        try:
+            with transaction.atomic(using=using):
+                updated = models.Customer.objects.using(using).filter(pk=instance.pk, version=instance.version).update(
+                    updated_at=now, version=F('version') + 1,
+                    **{field: getattr(instance, field) for field in customer_fields}
+                )
+                if not updated:
+                    return False
+
+                if user_fields:
+                    models.CustomerUser.objects.using(using).filter(pk=instance.user_id).update(
+                        **{field: getattr(instance.user, field) for field in user_fields}
+                    )
+
+                if sharding.enabled():
+                    sharding.update_directory(instance, customer_fields, user_fields)
+        except IntegrityError as error:
+            raise unique_violation(error, UPDATE_ERRORS) or error
+
+        instance.updated_at = now
+        instance.version += 1
+        return True
 
-        for key, value in validated_data.items():
-            setattr(instance, key, value)
-        instance.save(update_fields=validated_data.keys())
 
-        instance.refresh_from_db()
+class CustomerReadSerializer(serializers.BaseSerializer):
+    """
+    Read-only CustomerSerializer for the rows of read_queryset(): the customer and user
+    columns come from one values() query and the output dicts are built directly,
+    without the field machinery. The JSON is the same as CustomerSerializer's.
+    context['fields'] narrows the output, see requested_fields()
+    """
+    # Output field: the columns it is built from
+    field_columns = {
+        'wallet_id': ('wallet_id',),
+        'sex_tape': ('sex_tape',),
+        'dni': ('dni',),
+        'birth_date': ('birth_date',),
+        'created_at': ('created_at',),
+        'user': ('user__email', 'user__name', 'user__last_name'),
+    }
 
-        return instance
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields') or self.field_columns
+        self.representations = [(name, getattr(self, 'represent_' + name)) for name in fields]
+
+    @classmethod
+    def read_queryset(cls, queryset, *columns, fields=None):
+        """
+        The values() queryset of the fields, without the user join when it is not one of them
+        """
+        selected = [column for name in fields or cls.field_columns for column in cls.field_columns[name]]
+        return queryset.values(*dict.fromkeys(['id', *selected, *columns]))
+
+    def to_representation(self, row):
+        return {name: represent(row) for name, represent in self.representations}
+
+    @staticmethod
+    def represent_wallet_id(row):
+        return str(row['wallet_id'])
+
+    @staticmethod
+    def represent_sex_tape(row):
+        return row['sex_tape']
+
+    @staticmethod
+    def represent_dni(row):
+        return row['dni']
+
+    @staticmethod
+    def represent_birth_date(row):
+        return format_datetime(row['birth_date'])
+
+    @staticmethod
+    def represent_created_at(row):
+        return format_datetime(row['created_at'])
+
+    @staticmethod
+    def represent_user(row):
+        return {'email': row['user__email'], 'name': row['user__name'], 'last_name': row['user__last_name']}
+
+
+def requested_fields(query_params):
+    """
+    The output fields picked by ?fields= (comma separated), plus the user with ?expand=user,
+    in serializer order. None, meaning all of them, without ?fields=
+    """
+    names = CustomerReadSerializer.field_columns
+    fields = set(filter(None, query_params.get('fields', '').split(',')))
+    expand = set(filter(None, query_params.get('expand', '').split(',')))
+
+    errors = {}
+    if fields - set(names):
+        errors['fields'] = ['Unknown fields: %s.' % ', '.join(sorted(fields - set(names)))]
+    if expand - {'user'}:
+        errors['expand'] = ['Only user can be expanded.']
+    if errors:
+        raise serializers.ValidationError(errors)
+
+    if not fields:
+        return None
+    return tuple(name for name in names if name in fields or name in expand)
+
+
+class CustomerBulkUserSerializer(CustomerUserSerializer):
+    email = serializers.EmailField()
+    name = serializers.CharField(max_length=50)
+    last_name = serializers.CharField(max_length=50)
+
+    def validate(self, data):
+        return data
+
+
+class CustomerBulkCreateSerializer(CustomerSerializer):
+    """
+    Validates one item of a bulk create without touching the database,
+    dni and email uniqueness are checked for the whole batch at once
+    """
+    user = CustomerBulkUserSerializer()
+
+
+class CustomerBulkUpdateSerializer(serializers.Serializer):
+    """
+    One item of a bulk update: the target customer, by id or wallet_id, and the fields to change
+    """
+    id = serializers.IntegerField(required=False)
+    wallet_id = serializers.UUIDField(required=False)
+    fields = serializers.DictField()
+
+    def validate(self, data):
+        if ('id' in data) == ('wallet_id' in data):
+            raise serializers.ValidationError({'non_field_errors': ['Provide either id or wallet_id.']})
+
+        fields_serializer = CustomerBulkCreateSerializer(data=data['fields'], partial=True)
+        if not fields_serializer.is_valid():
+            raise serializers.ValidationError({'fields': fields_serializer.errors})
+
+        data['fields'] = fields_serializer.validated_data
+        return data
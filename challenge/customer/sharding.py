@@ -0,0 +1,212 @@
+import heapq
+from hashlib import sha256
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from customer.models import Customer, CustomerDirectory, CustomerUser
+from customer.pagination import lookup
+
+# Customer and user ids are directory_id * SHARD_SLOTS + shard index, so an id names its shard
+SHARD_SLOTS = 1024
+
+
+class ShardingNotSupported(APIException):
+    status_code = status.HTTP_501_NOT_IMPLEMENTED
+    default_detail = 'Not available while customers are sharded.'
+    default_code = 'sharding_not_supported'
+
+
+def enabled():
+    return bool(settings.CUSTOMER_SHARDS)
+
+
+def shard_index(dni):
+    """
+    Stable across processes and restarts, unlike hash()
+    """
+    digest = sha256(str(int(dni)).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % len(settings.CUSTOMER_SHARDS)
+
+
+def shard_for_dni(dni):
+    return settings.CUSTOMER_SHARDS[shard_index(dni)]
+
+
+def shard_for_pk(pk):
+    index = int(pk) % SHARD_SLOTS
+    if index >= len(settings.CUSTOMER_SHARDS):
+        return None
+    return settings.CUSTOMER_SHARDS[index]
+
+
+def for_pk(queryset, pk):
+    """
+    The queryset on the shard of a customer id, empty when no shard matches
+    """
+    shard = shard_for_pk(pk)
+    return queryset.using(shard) if shard else queryset.none()
+
+
+def directory_shards(**lookup):
+    shards = CustomerDirectory.objects.filter(**lookup).values_list('shard', flat=True)
+    return [settings.CUSTOMER_SHARDS[index] for index in shards]
+
+
+def shards_for(params):
+    """
+    The shards a list filtered by params can have rows in: the one of the dni, the one of
+    the wallet_id or email in the directory, otherwise all of them
+    """
+    if 'dni' in params:
+        try:
+            return [shard_for_dni(params['dni'])]
+        except (TypeError, ValueError):
+            pass
+    if 'wallet_id' in params:
+        return directory_shards(wallet_id=params['wallet_id'])
+    if 'user__email' in params:
+        return directory_shards(email=params['user__email'])
+    return list(settings.CUSTOMER_SHARDS)
+
+
+def get_by_dni(dni):
+    return Customer.objects.using(shard_for_dni(dni)).select_related('user').filter(dni=dni).first()
+
+
+def get_by_wallet_id(wallet_id):
+    entry = CustomerDirectory.objects.filter(wallet_id=wallet_id).first()
+    return entry and get_by_pk(entry.pk * SHARD_SLOTS + entry.shard)
+
+
+def get_by_email(email):
+    entry = CustomerDirectory.objects.filter(email=email).first()
+    return entry and get_by_pk(entry.pk * SHARD_SLOTS + entry.shard)
+
+
+def get_by_pk(pk):
+    return for_pk(Customer.objects.select_related('user'), pk).filter(pk=pk).first()
+
+
+def split(queryset):
+    """
+    The queryset once per shard, or itself when customers are not sharded
+    """
+    if not enabled():
+        return [queryset]
+    return [queryset.using(shard) for shard in settings.CUSTOMER_SHARDS]
+
+
+def create(user_data, customer_data):
+    """
+    Claims dni, wallet_id and email in the directory, then inserts the user and the
+    customer in the shard of the dni. A failed shard insert releases the claim
+    """
+    customer = Customer(**customer_data)
+    user = CustomerUser(**user_data)
+    index = shard_index(customer.dni)
+    shard = settings.CUSTOMER_SHARDS[index]
+
+    with transaction.atomic():
+        entry = CustomerDirectory.objects.create(shard=index, dni=customer.dni, wallet_id=customer.wallet_id, email=user.email)
+    user.pk = customer.pk = entry.pk * SHARD_SLOTS + index
+
+    try:
+        with transaction.atomic(using=shard):
+            user.save(using=shard, force_insert=True)
+            customer.user = user
+            customer.save(using=shard, force_insert=True)
+    except BaseException:
+        entry.delete()
+        raise
+
+    return customer
+
+
+def update_directory(customer, customer_fields, user_fields):
+    changes = {field: getattr(customer, field) for field in customer_fields if field == 'wallet_id'}
+    if 'email' in user_fields:
+        changes['email'] = customer.user.email
+    if changes:
+        with transaction.atomic():
+            CustomerDirectory.objects.filter(pk=customer.pk // SHARD_SLOTS).update(**changes)
+
+
+def forget(customer):
+    CustomerDirectory.objects.filter(pk=customer.pk // SHARD_SLOTS).delete()
+
+
+def merge(lists, ordering, limit=None):
+    """
+    Merges lists sorted by ordering (a same direction list of field paths) in one sorted list
+    """
+    paths = [field.lstrip('-') for field in ordering]
+
+    def key(instance):
+        return [lookup(instance, path) for path in paths]
+
+    merged = heapq.merge(*lists, key=key, reverse=ordering[0].startswith('-'))
+    return list(islice(merged, limit))
+
+
+class ShardedQuerySet:
+    """
+    The part of the QuerySet API the list view uses, over the same queryset on several
+    shards: filters and orderings apply to every shard, counts and aggregates are combined
+    and a slice merges the shard slices. Shards are read one after another
+    """
+    ordered = True
+    tie_breaker = 'id'
+    combine = {Count: sum, Sum: sum, Max: max, Min: min}
+
+    def __init__(self, queryset, shards):
+        self.queryset = queryset
+        self.shards = shards
+        self.model = queryset.model
+
+    def __iter__(self):
+        return iter(self[:None])
+
+    def __len__(self):
+        return len(self[:None])
+
+    def get_ordering(self):
+        ordering = list(self.queryset.query.order_by or self.model._meta.ordering or [self.tie_breaker])
+        fields = {field.lstrip('-') for field in ordering}
+        if self.tie_breaker not in fields and 'pk' not in fields:
+            ordering.append('-' + self.tie_breaker if ordering[0].startswith('-') else self.tie_breaker)
+        return ordering
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None:
+            raise TypeError('ShardedQuerySet only supports slices')
+
+        start = item.start or 0
+        ordering = self.get_ordering()
+        queryset = self.queryset.order_by(*ordering)
+        lists = [list(queryset.using(shard)[:item.stop]) for shard in self.shards]
+        return merge(lists, ordering, item.stop)[start:]
+
+    def chain(self, queryset):
+        return ShardedQuerySet(queryset, self.shards)
+
+    def filter(self, *args, **kwargs):
+        return self.chain(self.queryset.filter(*args, **kwargs))
+
+    def order_by(self, *fields):
+        return self.chain(self.queryset.order_by(*fields))
+
+    def count(self):
+        return sum(self.queryset.using(shard).count() for shard in self.shards)
+
+    def aggregate(self, **aggregates):
+        results = [self.queryset.using(shard).aggregate(**aggregates) for shard in self.shards]
+        combined = {}
+        for name, aggregate in aggregates.items():
+            values = [result[name] for result in results if result[name] is not None]
+            combined[name] = self.combine[type(aggregate)](values) if values else None
+        if not self.shards:
+            combined.update({name: 0 for name, aggregate in aggregates.items() if isinstance(aggregate, Count)})
+        return combined
@@ -0,0 +1,43 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from customer import sharding
+from customer.cache import customer_cache
+from customer.models import Customer, CustomerUser
+from customer.serializers import CustomerUserSerializer
+
+USER_FIELDS = frozenset(CustomerUserSerializer.Meta.fields)
+
+
+@receiver([post_save, post_delete], sender=Customer)
+def invalidate_customer(sender, instance, **kwargs):
+    customer_cache.invalidate(instance.pk, using=instance._state.db)
+
+
+@receiver(post_delete, sender=Customer)
+def forget_sharded_customer(sender, instance, **kwargs):
+    if sharding.enabled():
+        sharding.forget(instance)
+
+
+@receiver([post_save, post_delete], sender=CustomerUser)
+def invalidate_customer_user(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    Writes of fields the customer does not expose, like last_login on every login, are skipped
+    """
+    if created or (update_fields is not None and not USER_FIELDS & set(update_fields)):
+        return
+
+    if CustomerUser.customer.is_cached(instance):
+        customer = CustomerUser.customer.related.get_cached_value(instance)
+        customer_ids = [customer.pk] if customer else []
+    else:
+        customer_ids = list(Customer.objects.using(instance._state.db).filter(user_id=instance.pk).values_list('pk', flat=True))
+
+    # The user is part of the customer representation, its validators have to move too
+    if customer_ids and kwargs['signal'] is post_save:
+        Customer.objects.using(instance._state.db).filter(pk__in=customer_ids).update(updated_at=timezone.now(), version=F('version') + 1)
+
+    for customer_id in customer_ids:
+        customer_cache.invalidate(customer_id, using=instance._state.db)
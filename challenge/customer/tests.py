@@ -1,14 +1,44 @@
+import csv
+import io
 import json
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+import msgpack
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.core.handlers.base import BaseHandler
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import AsyncRequestFactory, Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
-from rest_framework.test import APIClient
+from django.urls import include, path
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from customer import models
-
-
+from rest_framework.renderers import JSONRenderer
+from auth import signing
+from challenge.query_budget import QueryBudgetExceeded
+from challenge.query_inspector import RepeatedQueries
+from customer import models, sharding
+from customer.async_views import AsyncCustomerListCreateView, AsyncCustomerRetrieveUpdateDestroyView
+from customer.cache import CustomerCache, customer_cache
+from customer.conditional import PreconditionFailed
+from customer.renderers import NDJSONRenderer
+from customer.serializers import CustomerReadSerializer, CustomerSerializer
+from customer.urls import customer_urlpatterns
+from customer.views import CustomerListCreateView, CustomerRetrieveUpdateDestroyView
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True, QUERY_INSPECTOR_RAISE=True)
 class CustomerViewsTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.customer_data = {
             'sex_tape': 'Male',
@@ -92,6 +122,25 @@ class CustomerViewsTestCase(TestCase):
         self.assertDictEqual(response.data, response_expected)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_retrieve_customer_over_query_budget_raises(self):
+        self.authenticate_api()
+
+        with mock.patch.dict(CustomerRetrieveUpdateDestroyView.query_budget, {'GET': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/api/v1/customer/1000')
+
+    @override_settings(QUERY_BUDGET_ENFORCE=False)
+    def test_list_customers_n_plus_one_raises(self):
+        self.authenticate_api()
+        for index in range(3):
+            user = models.CustomerUser.objects.create(email='n%d@example.com' % index, name='name', last_name='last_name')
+            models.Customer.objects.create(user=user, sex_tape='Male', dni=index + 1, birth_date='2000-01-01T00:00:00Z')
+
+        with mock.patch.object(CustomerListCreateView, 'get_queryset', lambda view: models.Customer.objects.all()), \
+                mock.patch.object(CustomerListCreateView, 'get_serializer_class', lambda view: CustomerSerializer):
+            with self.assertRaisesRegex(RepeatedQueries, r'4 x SELECT .* FROM "customer_customeruser"'):
+                self.client.get('/api/v1/customer/')
+
     def test_retrieve_customer_status_404(self):
         self.authenticate_api()
         response = self.client.get('/api/v1/customer/2')
@@ -103,6 +152,84 @@ class CustomerViewsTestCase(TestCase):
         self.assertDictEqual(response.data, response_expected)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_retrieve_customer_served_from_cache(self):
+        self.authenticate_api()
+        stats = customer_cache.stats()
+
+        with CaptureQueriesContext(connection) as miss:
+            first = self.client.get('/api/v1/customer/1000')
+        with CaptureQueriesContext(connection) as hit:
+            second = self.client.get('/api/v1/customer/1000')
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertDictEqual(second.data, first.data)
+        self.assertNotIn('customer_customer', ' '.join(query['sql'] for query in hit.captured_queries))
+        self.assertLess(len(hit), len(miss))
+        self.assertEqual(customer_cache.stats(), {'hits': stats['hits'] + 1, 'misses': stats['misses'] + 1})
+
+    def test_retrieve_customer_cache_invalidated_by_writes(self):
+        self.create_customers()
+        self.authenticate_api()
+        self.client.get('/api/v1/customer/1000')
+
+        response = self.client.put('/api/v1/customer/1000', {'user': {'name': 'Luciano'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/v1/customer/1000').data['user']['name'], 'Luciano')
+
+        user = models.CustomerUser.objects.get(customer__pk=1000)
+        user.last_name = 'Corradini2'
+        user.save()
+        self.assertEqual(self.client.get('/api/v1/customer/1000').data['user']['last_name'], 'Corradini2')
+
+        self.client.patch('/api/v1/customer/bulk/', [{'id': 1000, 'fields': {'sex_tape': 'Other'}}], format='json')
+        self.assertEqual(self.client.get('/api/v1/customer/1000').data['sex_tape'], 'Other')
+
+        models.Customer.objects.get(pk=1000).delete()
+        self.assertEqual(self.client.get('/api/v1/customer/1000').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_retrieve_customer_status_304_with_validators(self):
+        self.authenticate_api()
+        response = self.client.get('/api/v1/customer/1000')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with mock.patch.object(CustomerReadSerializer, 'to_representation') as to_representation:
+            not_modified = self.client.get('/api/v1/customer/1000', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(self.client.get('/api/v1/customer/1000', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        to_representation.assert_not_called()
+
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], etag)
+
+        user = models.CustomerUser.objects.get(customer__pk=1000)
+        user.name = 'Luciano'
+        user.save()
+
+        response = self.client.get('/api/v1/customer/1000', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['user']['name'], 'Luciano')
+
+    def test_customer_cache_loads_a_cold_key_once(self):
+        customer_cache = CustomerCache()
+        loads = []
+
+        def load():
+            loads.append(1)
+            time.sleep(0.1)
+            return {'dni': 123456789}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(customer_cache.get(1000, load))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(results, [{'dni': 123456789}] * 8)
+        self.assertEqual(customer_cache.stats(), {'hits': 0, 'misses': 8})
+
     def test_retrieve_customer_status_401_authentication_not_provider(self):
         response = self.client.get('/api/v1/customer/1000')
 
@@ -275,6 +402,114 @@ class CustomerViewsTestCase(TestCase):
         self.assertDictEqual(response_data_json, response_expected)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_list_customers_queries_do_not_grow_with_page_size(self):
+        self.authenticate_api()
+
+        for index in range(40):
+            user = models.CustomerUser.objects.create(email='bulk%d@example.com' % index, name='lucho', last_name='Corradini')
+            models.Customer.objects.create(user=user, sex_tape='Male', dni=index + 1, birth_date='2000-01-01T00:00:00Z')
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/v1/customer/', { 'limit': 50 })
+
+        self.assertEqual(len(response.data['results']), 41)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_customers_count_once(self):
+        self.create_customers()
+        self.authenticate_api()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/customer/', {'limit': 1})
+
+        counts = [query['sql'] for query in queries if 'COUNT(' in query['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('MAX(', counts[0])
+        self.assertEqual(response.data['count'], 3)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_read_serializer_matches_customer_serializer(self):
+        self.create_customers()
+        user = models.CustomerUser.objects.create(email='ñandú@example.com', name='José "Pepe"', last_name='Núñez')
+        models.Customer.objects.create(
+            user=user, sex_tape='Female', dni=1, birth_date='1999-12-31T23:59:59.123456-03:00'
+        )
+        queryset = models.Customer.objects.select_related('user').order_by('id')
+
+        for renderer in (JSONRenderer(), NDJSONRenderer()):
+            self.assertEqual(
+                renderer.render(CustomerReadSerializer(CustomerReadSerializer.read_queryset(queryset), many=True).data),
+                renderer.render(CustomerSerializer(queryset, many=True).data)
+            )
+
+    def test_list_customers_sparse_fields(self):
+        self.create_customers()
+        self.authenticate_api()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/customer/', {'fields': 'dni,wallet_id', 'sortBy': 'dni'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0], {
+            'wallet_id': str(models.Customer.objects.get(dni=123456789).wallet_id), 'dni': 123456789
+        })
+        page_query = [query['sql'] for query in context.captured_queries if 'LIMIT' in query['sql']][-1]
+        self.assertNotIn('customer_customeruser', page_query)
+        self.assertNotIn('birth_date', page_query)
+
+        response = self.client.get('/api/v1/customer/', {'fields': 'dni', 'expand': 'user', 'sortBy': 'dni'})
+        self.assertEqual(response.data['results'][0], {
+            'dni': 123456789, 'user': {'email': 'test@example.com', 'name': 'Lucho', 'last_name': 'Corradini'}
+        })
+
+        response = self.client.get('/api/v1/customer/', {'fields': 'dni', 'sortBy': 'user__email', 'pagination': 'keyset', 'limit': 2})
+        self.assertEqual([customer['dni'] for customer in response.data['results']], [123456799, 987654321])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'], [{'dni': 123456789}])
+
+        response = self.client.get('/api/v1/customer/', {'fields': 'dni,password', 'expand': 'wallet'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'fields': ['Unknown fields: password.'], 'expand': ['Only user can be expanded.']})
+
+    def test_retrieve_customer_sparse_fields(self):
+        self.authenticate_api()
+        etag = self.client.get('/api/v1/customer/1000')['ETag']
+
+        response = self.client.get('/api/v1/customer/1000', {'fields': 'sex_tape,dni'})
+        self.assertEqual(response.data, {'sex_tape': 'Male', 'dni': 123456789})
+        self.assertNotEqual(response['ETag'], etag)
+        not_modified = self.client.get('/api/v1/customer/1000', {'fields': 'sex_tape,dni'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get('/api/v1/customer/1000', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+        updated = self.client.patch('/api/v1/customer/1000', {'dni': 1}, format='json', HTTP_IF_MATCH=response['ETag'])
+        self.assertEqual(updated.status_code, status.HTTP_200_OK)
+
+        with override_settings(CUSTOMER_CACHE_TIMEOUT=0), CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/customer/1000', {'fields': 'dni'})
+        self.assertEqual(response.data, {'dni': 1})
+        self.assertNotIn('customer_customeruser', context.captured_queries[-1]['sql'])
+
+    def test_list_customers_status_304_with_validators(self):
+        self.create_customers()
+        self.authenticate_api()
+        response = self.client.get('/api/v1/customer/', {'sortBy': 'dni'})
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with mock.patch.object(CustomerReadSerializer, 'to_representation') as to_representation:
+            with self.assertNumQueries(1):
+                not_modified = self.client.get('/api/v1/customer/', {'sortBy': 'dni'}, HTTP_IF_NONE_MATCH=etag)
+        to_representation.assert_not_called()
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        other_page = self.client.get('/api/v1/customer/', {'sortBy': '-dni'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other_page.status_code, status.HTTP_200_OK)
+
+        models.Customer.objects.filter(dni=987654321).delete()
+        response = self.client.get('/api/v1/customer/', {'sortBy': 'dni'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+
     def test_list_customer_status_401_authentication_not_provider(self):
         response = self.client.get('/api/v1/customer/')
 
@@ -334,6 +569,31 @@ class CustomerViewsTestCase(TestCase):
         self.assertDictEqual(response.data, response_expected)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    @override_settings(QUERY_BUDGET_ENFORCE=False)
+    def test_create_customer_status_201_retries_wallet_id_collision(self):
+        self.authenticate_api()
+
+        body = {
+            "sex_tape": "Male",
+            "dni": 33323773,
+            "birth_date": "1987-10-13T01:14:14Z",
+            "user": {
+                "email": "luciano.j.corradini1@gmail.com",
+                "name": "Luciano",
+                "last_name": "Corradini"
+            }
+        }
+
+        wallet_ids = [self.customer.wallet_id, models.uuid7()]
+        wallet_id_field = models.Customer._meta.get_field('wallet_id')
+
+        with mock.patch.object(wallet_id_field, '_get_default', side_effect=wallet_ids):
+            response = self.client.post('/api/v1/customer/', body, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['wallet_id'], str(wallet_ids[1]))
+        self.assertEqual(models.CustomerUser.objects.filter(email=body['user']['email']).count(), 1)
+
     def test_create_customer_status_400_without_params(self):
         self.authenticate_api()
 
@@ -397,6 +657,84 @@ class CustomerViewsTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+    def test_create_customer_status_400_email_already_exists(self):
+        self.authenticate_api()
+
+        body = {
+            "sex_tape": "Male",
+            "dni": 33323773,
+            "birth_date": "1987-10-13T01:14:14Z",
+            "user": {
+                "email": "test@example.com",
+                "name": "Luciano",
+                "last_name": "Corradini"
+            }
+        }
+
+        response = self.client.post('/api/v1/customer/', body, format='json')
+
+        response_expected = {
+            "user": {
+                "user": {
+                    "email": "user with this dni already exists."
+                }
+            }
+        }
+
+        self.assertDictEqual(response.data, response_expected)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(models.Customer.objects.filter(dni=body['dni']).exists())
+
+    def test_create_customer_status_400_reports_every_unique_violation(self):
+        self.authenticate_api()
+        body = dict(self.customer_data, wallet_id=str(self.customer.wallet_id), user={
+            "email": "test@example.com", "name": "Luciano", "last_name": "Corradini"
+        })
+
+        response = self.client.post('/api/v1/customer/', body, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertDictEqual(response.data, {
+            "dni": ["customer with this dni already exists."],
+            "wallet_id": ["customer with this wallet id already exists."],
+            "user": {"user": {"email": "user with this dni already exists."}},
+        })
+
+        response = self.client.post('/api/v1/customer/', dict(body, dni=33323773, wallet_id=str(uuid.uuid4())), format='json')
+
+        self.assertDictEqual(response.data, {"user": {"user": {"email": "user with this dni already exists."}}})
+
+    def test_create_customer_costs_two_inserts(self):
+        body = {
+            "sex_tape": "Male",
+            "dni": 33323773,
+            "birth_date": "1987-10-13T01:14:14Z",
+            "user": {"email": "luciano.j.corradini1@gmail.com", "name": "Luciano", "last_name": "Corradini"}
+        }
+        request = APIRequestFactory().post('/api/v1/customer/')
+        serializer = CustomerSerializer(data=body, context={'request': request})
+
+        with self.assertNumQueries(0):
+            self.assertTrue(serializer.is_valid())
+
+        with CaptureQueriesContext(connection) as context:
+            serializer.save()
+
+        statements = [query['sql'] for query in context.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual([sql.split(' ')[2] for sql in statements], ['"customer_customeruser"', '"customer_customer"'])
+        self.assertTrue(all(sql.startswith('INSERT') for sql in statements))
+
+    def test_create_customer_status_400_dni_exists_leaves_no_orphan_user(self):
+        self.authenticate_api()
+        users_before = models.CustomerUser.objects.count()
+
+        body = dict(self.customer_data, user={"email": "other@example.com", "name": "Luciano", "last_name": "Corradini"})
+        response = self.client.post('/api/v1/customer/', body, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertDictEqual(response.data, {"dni": ["customer with this dni already exists."]})
+        self.assertEqual(models.CustomerUser.objects.count(), users_before)
+
     def test_create_customer_status_401_authentication_not_provider(self):
         response = self.client.post('/api/v1/customer/')
 
@@ -419,6 +757,428 @@ class CustomerViewsTestCase(TestCase):
         self.assertDictEqual(response.data, response_expected)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_bulk_create_customers_status_201(self):
+        self.authenticate_api()
+
+        body = [
+            {
+                "sex_tape": "Male",
+                "dni": 33323773,
+                "birth_date": "1987-10-13T01:14:14Z",
+                "user": {"email": "bulk1@example.com", "name": "Luciano", "last_name": "Corradini"}
+            },
+            {
+                "sex_tape": "Female",
+                "dni": 33323774,
+                "birth_date": "1990-10-13T01:14:14Z",
+                "user": {"email": "bulk2@example.com", "name": "Lucia", "last_name": "Corradini"}
+            },
+        ]
+
+        response = self.client.post('/api/v1/customer/bulk/', body, format='json')
+        customers = models.Customer.objects.filter(dni__in=[33323773, 33323774]).order_by('dni')
+
+        response_expected = {
+            "results": [
+                {
+                    "wallet_id": str(customer.wallet_id),
+                    "sex_tape": customer.sex_tape,
+                    "dni": customer.dni,
+                    "birth_date": customer.birth_date.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "created_at": customer.created_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                    "user": {
+                        "email": customer.user.email,
+                        "name": customer.user.name,
+                        "last_name": customer.user.last_name
+                    }
+                }
+                for customer in customers
+            ],
+            "errors": {}
+        }
+
+        response_data_json = json.loads(json.dumps(response.data))
+        self.assertDictEqual(response_data_json, response_expected)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_create_customers_status_207_with_errors_by_position(self):
+        self.authenticate_api()
+
+        body = [
+            {
+                "sex_tape": "Male",
+                "dni": 123456789,
+                "birth_date": "1987-10-13T01:14:14Z",
+                "user": {"email": "bulk1@example.com", "name": "Luciano", "last_name": "Corradini"}
+            },
+            {
+                "sex_tape": "Male",
+                "dni": 33323774,
+                "birth_date": "1987-10-13T01:14:14Z",
+                "user": {"email": "bulk2@example.com", "name": "Luciano", "last_name": "Corradini"}
+            },
+            {
+                "sex_tape": "Male",
+                "dni": 33323775,
+                "birth_date": "1987-10-13T01:14:14Z",
+                "user": {"email": "bulk2@example.com", "name": "Luciano", "last_name": "Corradini"}
+            },
+            {
+                "dni": 33323776,
+            },
+        ]
+
+        response = self.client.post('/api/v1/customer/bulk/', body, format='json')
+
+        errors_expected = {
+            "0": {"dni": ["customer with this dni already exists."]},
+            "2": {"user": {"email": ["customer user with this email already exists."]}},
+            "3": {
+                "sex_tape": ["This field is required."],
+                "birth_date": ["This field is required."],
+                "user": ["This field is required."]
+            },
+        }
+
+        response_data_json = json.loads(json.dumps(response.data))
+        self.assertDictEqual(response_data_json['errors'], errors_expected)
+        self.assertEqual([item and item['dni'] for item in response.data['results']], [None, 33323774, None, None])
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+
+        self.assertTrue(models.Customer.objects.filter(dni=33323774).exists())
+        self.assertFalse(models.Customer.objects.filter(dni__in=[33323775, 33323776]).exists())
+        self.assertFalse(models.CustomerUser.objects.filter(email='bulk1@example.com').exists())
+
+    def test_bulk_create_customers_rejected_item_does_not_take_its_values(self):
+        self.authenticate_api()
+
+        body = [
+            {
+                "sex_tape": "Male",
+                "dni": 33323773,
+                "birth_date": "1987-10-13T01:14:14Z",
+                "user": {"email": "test@example.com", "name": "Luciano", "last_name": "Corradini"}
+            },
+            {
+                "sex_tape": "Male",
+                "dni": 33323773,
+                "birth_date": "1987-10-13T01:14:14Z",
+                "user": {"email": "bulk1@example.com", "name": "Luciano", "last_name": "Corradini"}
+            },
+        ]
+
+        response = self.client.post('/api/v1/customer/bulk/', body, format='json')
+
+        response_data_json = json.loads(json.dumps(response.data))
+        self.assertDictEqual(
+            response_data_json['errors'], {"0": {"user": {"email": ["customer user with this email already exists."]}}}
+        )
+        self.assertEqual([item and item['user']['email'] for item in response.data['results']], [None, 'bulk1@example.com'])
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(models.Customer.objects.get(dni=33323773).user.email, 'bulk1@example.com')
+
+    def test_bulk_create_customers_checks_wallet_id(self):
+        self.authenticate_api()
+
+        wallet_id = str(uuid.uuid4())
+        body = [
+            {
+                "wallet_id": wallet_id,
+                "sex_tape": "Male",
+                "dni": 33323773,
+                "birth_date": "1987-10-13T01:14:14Z",
+                "user": {"email": "bulk1@example.com", "name": "Luciano", "last_name": "Corradini"}
+            },
+            {
+                "wallet_id": wallet_id,
+                "sex_tape": "Male",
+                "dni": 33323774,
+                "birth_date": "1987-10-13T01:14:14Z",
+                "user": {"email": "bulk2@example.com", "name": "Luciano", "last_name": "Corradini"}
+            },
+        ]
+
+        response = self.client.post('/api/v1/customer/bulk/', body, format='json')
+
+        response_data_json = json.loads(json.dumps(response.data))
+        self.assertDictEqual(response_data_json['errors'], {"1": {"wallet_id": ["customer with this wallet id already exists."]}})
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(str(models.Customer.objects.get(dni=33323773).wallet_id), wallet_id)
+
+    @override_settings(CUSTOMER_BULK_MAX_ITEMS=1)
+    def test_bulk_create_customers_status_400_over_batch_limit(self):
+        self.authenticate_api()
+
+        response = self.client.post('/api/v1/customer/bulk/', [{}, {}], format='json')
+
+        response_expected = {
+            "non_field_errors": ["Ensure this list has no more than 1 items."]
+        }
+
+        self.assertDictEqual(response.data, response_expected)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update_customers_status_200(self):
+        self.create_customers()
+        self.authenticate_api()
+
+        customer = models.Customer.objects.get(dni=987654321)
+
+        body = [
+            {"id": 1000, "fields": {"sex_tape": "Other", "user": {"name": "Luciano"}}},
+            {"wallet_id": str(customer.wallet_id), "fields": {"dni": 33323773, "user": {"email": "bulk@example.com"}}},
+            {"id": 100, "fields": {"sex_tape": "Male"}},
+        ]
+
+        response = self.client.patch('/api/v1/customer/bulk/', body, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertDictEqual(response.data['errors'], {})
+        self.assertEqual(
+            [(item['dni'], item['sex_tape'], item['user']['email'], item['user']['name']) for item in response.data['results']],
+            [
+                (123456789, 'Other', 'test@example.com', 'Luciano'),
+                (33323773, 'Male', 'bulk@example.com', 'lucho2'),
+                (123456799, 'Male', 'test1@example.com', 'lucho1'),
+            ]
+        )
+
+        customer.refresh_from_db()
+        self.assertEqual(customer.dni, 33323773)
+        self.assertEqual(models.CustomerUser.objects.get(pk=customer.user_id).email, 'bulk@example.com')
+        self.assertEqual(models.Customer.objects.get(pk=1000).sex_tape, 'Other')
+
+    def test_bulk_update_customers_status_207_with_errors_by_position(self):
+        self.create_customers()
+        self.authenticate_api()
+
+        body = [
+            {"id": 1000, "fields": {"dni": 987654321}},
+            {"id": 100, "fields": {"user": {"email": "test2@example.com"}}},
+            {"id": 101, "fields": {"user": {"email": "bulk@example.com"}}},
+            {"id": 100, "fields": {"sex_tape": "Other"}},
+            {"id": 5, "fields": {"sex_tape": "Other"}},
+            {"fields": {"sex_tape": "Other"}},
+        ]
+
+        response = self.client.patch('/api/v1/customer/bulk/', body, format='json')
+
+        errors_expected = {
+            "0": {"dni": ["customer with this dni already exists."]},
+            "3": {"non_field_errors": ["This customer is already updated by another item."]},
+            "4": {"detail": "Not found."},
+            "5": {"non_field_errors": ["Provide either id or wallet_id."]},
+        }
+
+        response_data_json = json.loads(json.dumps(response.data))
+        self.assertDictEqual(response_data_json['errors'], errors_expected)
+        self.assertEqual(response.data['results'][1]['user']['email'], 'test2@example.com')
+        self.assertEqual(response.data['results'][2]['user']['email'], 'bulk@example.com')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+
+        # Item 1 takes the email item 2 leaves, written after it
+        self.assertEqual(models.Customer.objects.get(pk=1000).dni, 123456789)
+        self.assertEqual(models.Customer.objects.get(pk=100).user.email, 'test2@example.com')
+        self.assertEqual(models.Customer.objects.get(pk=101).user.email, 'bulk@example.com')
+
+    def test_bulk_update_customers_rejects_swaps_and_wallet_id_conflicts(self):
+        self.create_customers()
+        self.authenticate_api()
+
+        wallet_id = str(models.Customer.objects.get(pk=101).wallet_id)
+        body = [
+            {"id": 100, "fields": {"user": {"email": "test2@example.com"}}},
+            {"id": 101, "fields": {"user": {"email": "test1@example.com"}}},
+            {"id": 1000, "fields": {"wallet_id": wallet_id}},
+        ]
+
+        response = self.client.patch('/api/v1/customer/bulk/', body, format='json')
+
+        errors_expected = {
+            "0": {"non_field_errors": ["Swapping unique values between items is not supported."]},
+            "1": {"non_field_errors": ["Swapping unique values between items is not supported."]},
+            "2": {"wallet_id": ["customer with this wallet id already exists."]},
+        }
+
+        response_data_json = json.loads(json.dumps(response.data))
+        self.assertDictEqual(response_data_json['errors'], errors_expected)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(models.Customer.objects.get(pk=100).user.email, 'test1@example.com')
+
+    def test_bulk_update_customers_rejected_item_keeps_its_values(self):
+        self.create_customers()
+        self.authenticate_api()
+
+        wallet_id = str(models.Customer.objects.get(pk=1000).wallet_id)
+        body = [
+            {"id": 100, "fields": {"dni": 987654321}},
+            {"id": 101, "fields": {"dni": 33323773, "wallet_id": wallet_id}},
+            {"id": 1000, "fields": {"sex_tape": "Other"}},
+        ]
+
+        response = self.client.patch('/api/v1/customer/bulk/', body, format='json')
+
+        errors_expected = {
+            "0": {"dni": ["customer with this dni already exists."]},
+            "1": {"wallet_id": ["customer with this wallet id already exists."]},
+        }
+
+        response_data_json = json.loads(json.dumps(response.data))
+        self.assertDictEqual(response_data_json['errors'], errors_expected)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(models.Customer.objects.get(pk=101).dni, 987654321)
+        self.assertEqual(models.Customer.objects.get(pk=1000).sex_tape, 'Other')
+
+    def test_export_customers_status_200_ndjson(self):
+        self.create_customers()
+        self.authenticate_api()
+
+        response = self.client.get('/api/v1/customer/export/', { 'format': 'ndjson' })
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        customers = models.Customer.objects.all().order_by('id')
+
+        lines_expected = []
+
+        for customer in customers:
+            lines_expected.append({
+                'wallet_id': str(customer.wallet_id),
+                'sex_tape': customer.sex_tape,
+                'dni': customer.dni,
+                'birth_date': customer.birth_date.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                'created_at': customer.created_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                'user': {
+                    'email': customer.user.email,
+                    'name': customer.user.name,
+                    'last_name': customer.user.last_name
+                }
+            })
+
+        self.assertEqual([json.loads(line) for line in lines], lines_expected)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    async def test_export_customers_streams_asynchronously_under_asgi(self):
+        await sync_to_async(self.create_customers)()
+        await sync_to_async(self.authenticate_api)()
+        expected = await sync_to_async(
+            lambda: b''.join(self.client.get('/api/v1/customer/export/', {'format': 'csv'}).streaming_content)
+        )()
+
+        handler = BaseHandler()
+        handler.load_middleware(is_async=True)
+        request = AsyncRequestFactory().get(
+            '/api/v1/customer/export/', {'format': 'csv'}, headers={'Authorization': 'Token ' + self.token.key}
+        )
+        with override_settings(CUSTOMER_EXPORT_CHUNK_SIZE=1):
+            response = await handler.get_response_async(request)
+            content = b''.join([block async for block in response.streaming_content])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+        self.assertEqual(content, expected)
+        self.assertEqual(len(content.splitlines()), 4)
+
+    def test_export_customers_status_200_csv_with_filter(self):
+        self.create_customers()
+        self.authenticate_api()
+
+        response = self.client.get('/api/v1/customer/export/', { 'dni': 987654321 }, HTTP_ACCEPT='text/csv')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        customer = models.Customer.objects.get(dni=987654321)
+
+        rows_expected = [
+            ['wallet_id', 'sex_tape', 'dni', 'birth_date', 'created_at', 'email', 'name', 'last_name'],
+            [
+                str(customer.wallet_id), 'Male', '987654321', '2000-01-01T00:00:00Z',
+                customer.created_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"), 'test2@example.com', 'lucho2', 'Corradini2'
+            ],
+        ]
+
+        self.assertEqual(rows, rows_expected)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_export_customers_status_401_authentication_not_provider(self):
+        response = self.client.get('/api/v1/customer/export/')
+
+        self.assertEqual(json.loads(response.content), {"detail": "Authentication credentials were not provided."})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export_customers_errors_in_csv(self):
+        response = self.client.get('/api/v1/customer/export/', {'format': 'csv'})
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            list(csv.reader(io.StringIO(response.content.decode()))),
+            [['field', 'message'], ['detail', 'Authentication credentials were not provided.']]
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.authenticate_api()
+        response = self.client.get('/api/v1/customer/export/', {'format': 'csv', 'dni': 'x'})
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(list(csv.reader(io.StringIO(response.content.decode()))), [['field', 'message'], ['dni', 'Enter a number.']])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_customers_command(self):
+        self.create_customers()
+        output = io.StringIO()
+
+        call_command('export_customers', '--format', 'csv', '--user__email', 'test1@example.com', stdout=output)
+        rows = list(csv.reader(io.StringIO(output.getvalue())))
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][2], '123456799')
+
+    def write_import_file(self, suffix, content):
+        descriptor, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(descriptor, 'w') as import_file:
+            import_file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_customers_command_ndjson(self):
+        lines = [
+            {"sex_tape": "Male", "dni": 1, "birth_date": "2000-01-01T00:00:00Z", "user": {"email": "import1@example.com", "name": "a", "last_name": "b"}},
+            {"sex_tape": "Male", "dni": 123456789, "birth_date": "2000-01-01T00:00:00Z", "user": {"email": "import2@example.com", "name": "a", "last_name": "b"}},
+            {"sex_tape": "Male", "dni": 3, "birth_date": "2000-01-01T00:00:00Z", "user": {"email": "test@example.com", "name": "a", "last_name": "b"}},
+            {"sex_tape": "Unknown", "dni": 4, "birth_date": "2000-01-01T00:00:00Z", "user": {"email": "import4@example.com", "name": "a", "last_name": "b"}},
+            {"sex_tape": "Female", "dni": 5, "birth_date": "2000-01-01T00:00:00Z", "user": {"email": "import1@example.com", "name": "a", "last_name": "b"}},
+            {"sex_tape": "Female", "dni": 6, "birth_date": "1990-05-01T10:00:00Z", "user": {"email": "import6@example.com", "name": "c", "last_name": "d"}},
+        ]
+        path = self.write_import_file('.ndjson', ''.join(json.dumps(line) + '\n' for line in lines))
+        output = io.StringIO()
+
+        call_command('import_customers', path, '--chunk-size', '2', stdout=output)
+
+        self.assertEqual(
+            sorted(models.Customer.objects.values_list('dni', 'user__email')),
+            [(1, 'import1@example.com'), (6, 'import6@example.com'), (123456789, 'test@example.com')]
+        )
+        self.assertIn('row 2: duplicate dni 123456789', output.getvalue())
+        self.assertIn('row 3: duplicate email test@example.com', output.getvalue())
+        self.assertIn('row 4: invalid', output.getvalue())
+        self.assertIn('row 5: duplicate email import1@example.com', output.getvalue())
+        self.assertIn('duplicate dni: 1, duplicate email: 2, imported: 2, invalid: 1', output.getvalue())
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_import_customers_command_csv_resumes_from_checkpoint(self):
+        rows = ['wallet_id,sex_tape,dni,birth_date,created_at,email,name,last_name']
+        rows += ['%s,Male,%d,2000-01-01T00:00:00Z,,import%d@example.com,a,b' % (models.uuid7(), dni, dni) for dni in range(1, 6)]
+        path = self.write_import_file('.csv', '\n'.join(rows) + '\n')
+
+        with open(path + '.checkpoint', 'w') as checkpoint:
+            json.dump({'rows': 2}, checkpoint)
+        self.addCleanup(lambda: os.path.exists(path + '.checkpoint') and os.remove(path + '.checkpoint'))
+
+        call_command('import_customers', path, '--chunk-size', '1', '--workers', '2', stdout=io.StringIO())
+
+        self.assertEqual(sorted(models.Customer.objects.exclude(pk=1000).values_list('dni', flat=True)), [3, 4, 5])
+        self.assertEqual(
+            str(models.Customer.objects.get(dni=5).wallet_id),
+            rows[5].split(',')[0]
+        )
+
     def test_update_customer_status_200(self):
         self.maxDiff = None
         self.authenticate_api()
@@ -517,6 +1277,58 @@ class CustomerViewsTestCase(TestCase):
         self.assertDictEqual(response.data, response_expected)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_update_customer_status_412_with_stale_if_match(self):
+        self.authenticate_api()
+        etag = self.client.get('/api/v1/customer/1000')['ETag']
+
+        response = self.client.patch('/api/v1/customer/1000', {'sex_tape': 'Other'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], '"2-json"')
+        self.assertEqual(self.client.get('/api/v1/customer/1000')['ETag'], response['ETag'])
+
+        response = self.client.patch('/api/v1/customer/1000', {'sex_tape': 'Female'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(models.Customer.objects.get(pk=1000).sex_tape, 'Other')
+
+        response = self.client.delete('/api/v1/customer/1000', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertTrue(models.Customer.objects.filter(pk=1000).exists())
+
+        response = self.client.delete('/api/v1/customer/1000', HTTP_IF_MATCH='"2-json"')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_update_customer_skips_no_op_writes(self):
+        self.authenticate_api()
+        body = {'sex_tape': 'Male', 'user': {'email': 'test@example.com', 'name': 'Lucho'}}
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch('/api/v1/customer/1000', body, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], '"1-json"')
+        self.assertEqual(response.data['user']['name'], 'Lucho')
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('UPDATE')])
+
+    def test_update_customer_write_is_conditional_on_version(self):
+        request = APIRequestFactory().patch('/api/v1/customer/1000')
+        customer = models.Customer.objects.select_related('user').get(pk=1000)
+        models.Customer.objects.filter(pk=1000).update(version=2)
+
+        serializer = CustomerSerializer(customer, data={'sex_tape': 'Other'}, partial=True, context={'request': request, 'if_match': {1}})
+        serializer.is_valid(raise_exception=True)
+        with self.assertRaises(PreconditionFailed):
+            serializer.save()
+        self.assertEqual(models.Customer.objects.get(pk=1000).sex_tape, 'Male')
+
+        customer = models.Customer.objects.select_related('user').get(pk=1000)
+        models.Customer.objects.filter(pk=1000).update(version=3)
+
+        serializer = CustomerSerializer(customer, data={'sex_tape': 'Other'}, partial=True, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        customer = serializer.save()
+        self.assertEqual(customer.version, 4)
+        self.assertEqual(models.Customer.objects.values_list('sex_tape', 'version').get(pk=1000), ('Other', 4))
+
     def test_update_customer_status_401_authentication_not_provider(self):
         response = self.client.put('/api/v1/customer/1')
 
@@ -537,4 +1349,534 @@ class CustomerViewsTestCase(TestCase):
         }
 
         self.assertDictEqual(response.data, response_expected)
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_list_customers_status_200_with_keyset_pagination(self):
+        self.create_customers()
+        self.authenticate_api()
+
+        for sort_param in ('created_at', '-dni', 'user__email', 'wallet_id'):
+            customers = models.Customer.objects.all().order_by(sort_param, sort_param[0] == '-' and '-id' or 'id')
+            dnis_expected = [customer.dni for customer in customers]
+
+            dnis = []
+            params = {'pagination': 'keyset', 'limit': 1, 'sortBy': sort_param}
+            response = self.client.get('/api/v1/customer/', params)
+            self.assertNotIn('count', response.data)
+            self.assertIsNone(response.data['previous'])
+
+            while True:
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                dnis.extend(customer['dni'] for customer in response.data['results'])
+                if not response.data['next']:
+                    break
+                response = self.client.get(response.data['next'])
+
+            self.assertEqual(dnis, dnis_expected)
+
+            dnis = []
+            while response.data['previous']:
+                response = self.client.get(response.data['previous'])
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                dnis = [customer['dni'] for customer in response.data['results']] + dnis
+
+            self.assertEqual(dnis, dnis_expected[:-1])
+
+    def test_list_customers_status_304_with_keyset_pagination(self):
+        self.create_customers()
+        self.authenticate_api()
+        params = {'pagination': 'keyset', 'limit': 2, 'sortBy': 'dni'}
+        response = self.client.get('/api/v1/customer/', params)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            not_modified = self.client.get('/api/v1/customer/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A change on another page keeps this one valid, one on the page does not
+        models.Customer.objects.filter(dni=987654321).update(version=5)
+        self.assertEqual(self.client.get('/api/v1/customer/', params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        models.Customer.objects.filter(dni=123456789).update(version=5)
+        self.assertEqual(self.client.get('/api/v1/customer/', params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_customers_status_404_with_invalid_cursor(self):
+        self.authenticate_api()
+        response = self.client.get('/api/v1/customer/', {'pagination': 'keyset', 'cursor': 'invalid'})
+
+        response_expected = {
+            "detail": "Invalid cursor"
+        }
+
+        self.assertDictEqual(response.data, response_expected)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CustomerAsyncViewsTestCase(TestCase):
+    """
+    The async views answer like the sync ones, compared through the same URLs
+    """
+    list_view = staticmethod(AsyncCustomerListCreateView.as_view())
+    detail_view = staticmethod(AsyncCustomerRetrieveUpdateDestroyView.as_view())
+
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+        self.user = User.objects.create_user(username='asyncuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+        for index, (dni, email) in enumerate([(123456789, 'a@example.com'), (987654321, 'b@example.com'), (555555555, 'c@example.com')]):
+            user = models.CustomerUser.objects.create(email=email, name='name%d' % index, last_name='last_name')
+            models.Customer.objects.create(id=1000 + index, user=user, sex_tape='Male', dni=dni, birth_date='2000-01-01T00:00:00Z')
+
+    def request(self, method, path, data=None, token=None, headers=None):
+        headers = dict(headers or {})
+        if token is None:
+            token = self.token.key
+        if token:
+            headers['Authorization'] = 'Token ' + token
+        if method in ('get', 'head'):
+            return getattr(self.factory, method)(path, data, headers=headers)
+        if data is None:
+            return getattr(self.factory, method)(path, headers=headers)
+        return getattr(self.factory, method)(path, json.dumps(data), content_type='application/json', headers=headers)
+
+    async def assertSameResponse(self, path, params, view, **kwargs):
+        expected = await sync_to_async(self.client.get)(path, params)
+        response = await view(self.request('get', path, params), **kwargs)
+
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(json.loads(response.content), expected.json())
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+    async def test_list_customers_match_sync_view(self):
+        for params in ({}, {'page': 2, 'limit': 1}, {'sortBy': '-dni'}, {'dni': 987654321}, {'user__email': 'c@example.com'}):
+            with self.subTest(params=params):
+                await self.assertSameResponse('/api/v1/customer/', params, self.list_view)
+
+    async def test_list_customers_keyset_match_sync_view(self):
+        params = {'pagination': 'keyset', 'limit': 1, 'sortBy': 'dni'}
+        await self.assertSameResponse('/api/v1/customer/', params, self.list_view)
+
+        response = await self.list_view(self.request('get', '/api/v1/customer/', params))
+        cursor = parse_qs(urlparse(json.loads(response.content)['next']).query)['cursor'][0]
+        await self.assertSameResponse('/api/v1/customer/', dict(params, cursor=cursor), self.list_view)
+
+    def test_list_customers_count_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = async_to_sync(self.list_view)(self.request('get', '/api/v1/customer/', {'limit': 2}))
+
+        counts = [query['sql'] for query in queries if 'COUNT(' in query['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('MAX(', counts[0])
+        self.assertEqual(json.loads(response.content)['count'], 3)
+
+    async def test_list_customers_sparse_fields_match_sync_view(self):
+        for params in (
+            {'fields': 'dni,wallet_id', 'sortBy': 'dni'},
+            {'fields': 'dni', 'expand': 'user', 'sortBy': '-user__email'},
+            {'fields': 'dni', 'sortBy': 'user__email', 'pagination': 'keyset', 'limit': 2},
+        ):
+            with self.subTest(params=params):
+                await self.assertSameResponse('/api/v1/customer/', params, self.list_view)
+
+        response = await self.list_view(self.request('get', '/api/v1/customer/', {'fields': 'dni,password', 'expand': 'wallet'}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            json.loads(response.content), {'fields': ['Unknown fields: password.'], 'expand': ['Only user can be expanded.']}
+        )
+
+    async def test_head_and_options(self):
+        for view, path, kwargs in ((self.list_view, '/api/v1/customer/', {}), (self.detail_view, '/api/v1/customer/1000', {'pk': 1000})):
+            with self.subTest(path=path):
+                expected = await sync_to_async(self.client.head)(path)
+                response = await view(self.request('head', path), **kwargs)
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response['ETag'], expected['ETag'])
+
+                response = await view(self.request('head', path, headers={'If-None-Match': expected['ETag']}), **kwargs)
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = await self.list_view(self.request('options', '/api/v1/customer/'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Allow'], 'GET, POST, HEAD, OPTIONS')
+
+        response = await self.detail_view(self.request('options', '/api/v1/customer/1000'), pk=1000)
+        self.assertEqual(response['Allow'], 'GET, PUT, PATCH, DELETE, HEAD, OPTIONS')
+
+    async def test_content_negotiation(self):
+        packed = {'HTTP_ACCEPT': 'application/msgpack'}
+        expected = await sync_to_async(self.client.get)('/api/v1/customer/1000', **packed)
+        response = await self.detail_view(self.request('get', '/api/v1/customer/1000', headers={'Accept': 'application/msgpack'}), pk=1000)
+
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), msgpack.unpackb(expected.content))
+        self.assertEqual(response['ETag'], expected['ETag'])
+        self.assertIn('Accept', response['Vary'])
+
+        body = {
+            'sex_tape': 'Female', 'dni': 111111111, 'birth_date': '2000-01-01T00:00:00Z',
+            'user': {'email': 'packed@example.com', 'name': 'name', 'last_name': 'last_name'}
+        }
+        request = self.factory.post(
+            '/api/v1/customer/', msgpack.packb(body), content_type='application/msgpack',
+            headers={'Authorization': 'Token ' + self.token.key, 'Accept': 'application/msgpack'}
+        )
+        response = await self.list_view(request)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(msgpack.unpackb(response.content)['user']['email'], 'packed@example.com')
+
+        response = await self.list_view(self.request('get', '/api/v1/customer/', headers={'Accept': 'text/csv'}))
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+        request = self.factory.post(
+            '/api/v1/customer/', 'dni=1', content_type='text/plain', headers={'Authorization': 'Token ' + self.token.key}
+        )
+        response = await self.list_view(request)
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    async def test_list_customers_status_404_with_invalid_page(self):
+        response = await self.list_view(self.request('get', '/api/v1/customer/', {'page': 10}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_list_customers_status_304(self):
+        response = await self.list_view(self.request('get', '/api/v1/customer/'))
+        response = await self.list_view(self.request('get', '/api/v1/customer/', headers={'If-None-Match': response['ETag']}))
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_create_customer(self):
+        data = {
+            'sex_tape': 'Female', 'dni': 111111111, 'birth_date': '2000-01-01T00:00:00Z',
+            'user': {'email': 'new@example.com', 'name': 'name', 'last_name': 'last_name'}
+        }
+        response = await self.list_view(self.request('post', '/api/v1/customer/', data))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json.loads(response.content)['dni'], 111111111)
+        self.assertTrue(await models.Customer.objects.filter(dni=111111111).aexists())
+
+        response = await self.list_view(self.request('post', '/api/v1/customer/', dict(data, dni='invalid')))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_retrieve_customer_match_sync_view(self):
+        await self.assertSameResponse('/api/v1/customer/1000', None, self.detail_view, pk=1000)
+
+        response = await self.detail_view(self.request('get', '/api/v1/customer/9999'), pk=9999)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_retrieve_customer_sparse_fields_match_sync_view(self):
+        await self.assertSameResponse('/api/v1/customer/1000', {'fields': 'sex_tape,dni'}, self.detail_view, pk=1000)
+        await self.assertSameResponse('/api/v1/customer/1000', {'fields': 'dni', 'expand': 'user'}, self.detail_view, pk=1000)
+
+        with override_settings(CUSTOMER_CACHE_TIMEOUT=0):
+            await self.assertSameResponse('/api/v1/customer/1000', {'fields': 'dni'}, self.detail_view, pk=1000)
+
+        response = await self.detail_view(self.request('get', '/api/v1/customer/1000', {'expand': 'wallet'}), pk=1000)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_update_customer_with_if_match(self):
+        path = '/api/v1/customer/1000'
+        etag = (await self.detail_view(self.request('get', path), pk=1000))['ETag']
+
+        response = await self.detail_view(self.request('get', path, headers={'If-None-Match': etag}), pk=1000)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = await self.detail_view(self.request('patch', path, {'dni': 222222222}, headers={'If-Match': etag}), pk=1000)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['dni'], 222222222)
+        self.assertNotEqual(response['ETag'], etag)
+
+        response = await self.detail_view(self.request('delete', path, headers={'If-Match': etag}), pk=1000)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        response = await self.detail_view(self.request('delete', path), pk=1000)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(await models.Customer.objects.filter(pk=1000).aexists())
+
+    async def test_authentication(self):
+        response = await self.list_view(self.request('get', '/api/v1/customer/', token=''))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+        response = await self.list_view(self.request('get', '/api/v1/customer/', token='invalid'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        signed = signing.issue(self.user)
+        response = await self.list_view(self.request('get', '/api/v1/customer/', token=signed.key))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_writes_are_csrf_exempt(self):
+        client = Client(enforce_csrf_checks=True, HTTP_AUTHORIZATION='Token ' + self.token.key)
+        # A session must not bring the CSRF check back either
+        client.force_login(self.user)
+        body = {
+            'sex_tape': 'Female', 'dni': 11111111, 'birth_date': '1990-01-01T00:00:00Z',
+            'user': {'email': 'csrf@example.com', 'name': 'name', 'last_name': 'last_name'}
+        }
+
+        with override_settings(ROOT_URLCONF=AsyncCustomerURLConf):
+            response = client.post('/api/v1/customer/', json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            response = client.patch('/api/v1/customer/1000', json.dumps({'dni': 1}), content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = client.delete('/api/v1/customer/1001')
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class AsyncCustomerURLConf:
+    urlpatterns = [path('api/v1/', include(customer_urlpatterns(async_views_enabled=True)))]
+
+
+@override_settings(CUSTOMER_SHARDS=['shard0', 'shard1'])
+class CustomerShardingTestCase(TestCase):
+    """
+    Customers spread over two shard databases, the directory in the default one
+    """
+    databases = {'default', 'shard0', 'shard1'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='sharduser', password='testpassword')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+
+        # Three dnis per shard
+        dnis = {0: [], 1: []}
+        dni = 10000000
+        while min(len(values) for values in dnis.values()) < 3:
+            dni += 1
+            if len(dnis[sharding.shard_index(dni)]) < 3:
+                dnis[sharding.shard_index(dni)].append(dni)
+        self.dnis = dnis
+
+        for index, dni in enumerate(sorted(dnis[0] + dnis[1])):
+            response = self.create_customer(dni, 'shard%d@example.com' % index)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def create_customer(self, dni, email):
+        return self.client.post('/api/v1/customer/', {
+            'sex_tape': 'Male', 'dni': dni, 'birth_date': '2000-01-01T00:00:00Z',
+            'user': {'email': email, 'name': 'name', 'last_name': 'last_name'}
+        }, format='json')
+
+    def test_create_customer_in_the_shard_of_its_dni(self):
+        for index, shard in enumerate(['shard0', 'shard1']):
+            customers = models.Customer.objects.using(shard).select_related('user')
+            self.assertEqual(sorted(customer.dni for customer in customers), self.dnis[index])
+            self.assertTrue(all(customer.pk % sharding.SHARD_SLOTS == index for customer in customers))
+            self.assertTrue(all(customer.user.pk == customer.pk for customer in customers))
+
+        self.assertFalse(models.Customer.objects.using('default').exists())
+        self.assertEqual(models.CustomerDirectory.objects.count(), 6)
+
+    def test_create_customer_unique_across_shards(self):
+        response = self.create_customer(self.dnis[0][0], 'other@example.com')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'dni': ['customer with this dni already exists.']})
+
+        # The email lives in shard0, the new customer would go to shard1
+        email = models.Customer.objects.using('shard0').select_related('user').first().user.email
+        response = self.create_customer(self.dnis[1][0] + 1000000, email)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(models.CustomerDirectory.objects.count(), 6)
+
+        response = self.create_customer(self.dnis[1][0], email)
+        self.assertEqual(response.data, {
+            'dni': ['customer with this dni already exists.'],
+            'user': {'user': {'email': 'user with this dni already exists.'}},
+        })
+
+    def test_lookups(self):
+        customer = models.Customer.objects.using('shard1').select_related('user').first()
+
+        self.assertEqual(sharding.get_by_dni(customer.dni), customer)
+        self.assertEqual(sharding.get_by_wallet_id(customer.wallet_id), customer)
+        self.assertEqual(sharding.get_by_email(customer.user.email), customer)
+        self.assertEqual(sharding.get_by_pk(customer.pk), customer)
+        self.assertIsNone(sharding.get_by_email('missing@example.com'))
+
+    def test_list_customers_merges_the_shards(self):
+        dnis = sorted(self.dnis[0] + self.dnis[1])
+
+        response = self.client.get('/api/v1/customer/', {'sortBy': '-dni', 'limit': 4, 'page': 1})
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual([customer['dni'] for customer in response.data['results']], dnis[::-1][:4])
+
+        response = self.client.get('/api/v1/customer/', {'sortBy': 'dni', 'limit': 4, 'page': 2})
+        self.assertEqual([customer['dni'] for customer in response.data['results']], dnis[4:])
+
+        response = self.client.get('/api/v1/customer/', {'sortBy': '-user__email', 'limit': 2, 'fields': 'sex_tape'})
+        self.assertEqual(response.data['results'], [{'sex_tape': 'Male'}, {'sex_tape': 'Male'}])
+
+        response = self.client.get('/api/v1/customer/', {'sortBy': 'dni', 'limit': 4}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        response = self.client.get('/api/v1/customer/', {'sortBy': 'dni', 'limit': 4}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_customers_keyset_merges_the_shards(self):
+        dnis = []
+        params = {'pagination': 'keyset', 'sortBy': 'dni', 'limit': 4}
+        url = '/api/v1/customer/'
+        while url:
+            response = self.client.get(url, params)
+            dnis.extend(customer['dni'] for customer in response.data['results'])
+            url, params = response.data['next'], None
+
+        self.assertEqual(dnis, sorted(self.dnis[0] + self.dnis[1]))
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([customer['dni'] for customer in response.data['results']], dnis[:4])
+
+    def test_list_customers_filters_read_one_shard(self):
+        customer = models.Customer.objects.using('shard0').select_related('user').first()
+
+        for params in ({'dni': customer.dni}, {'wallet_id': customer.wallet_id}, {'user__email': customer.user.email}):
+            with self.subTest(params=params), CaptureQueriesContext(connections['shard1']) as shard1:
+                response = self.client.get('/api/v1/customer/', params)
+
+                self.assertEqual([item['dni'] for item in response.data['results']], [customer.dni])
+                self.assertEqual(len(shard1.captured_queries), 0)
+
+    def test_retrieve_update_destroy_customer(self):
+        customer = models.Customer.objects.using('shard1').first()
+        url = '/api/v1/customer/%d' % customer.pk
+
+        self.assertEqual(self.client.get(url).data['dni'], customer.dni)
+        self.assertEqual(self.client.get('/api/v1/customer/%d' % (customer.pk + 1)).status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.patch(url, {'user': {'email': 'changed@example.com'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sharding.get_by_email('changed@example.com'), customer)
+
+        # The email of a customer of the other shard
+        email = models.Customer.objects.using('shard0').select_related('user').first().user.email
+        response = self.client.patch(url, {'user': {'email': email}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(models.CustomerUser.objects.using('shard1').get(pk=customer.pk).email, 'changed@example.com')
+
+        response = self.client.patch(url, {'dni': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(models.Customer.objects.using('shard1').filter(pk=customer.pk).exists())
+        self.assertIsNone(sharding.get_by_email('changed@example.com'))
+
+    def test_bulk_not_supported(self):
+        response = self.client.post('/api/v1/customer/bulk/', [], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+    def test_export_reads_every_shard(self):
+        response = self.client.get('/api/v1/customer/export/', {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual(sorted(row['dni'] for row in rows), sorted(self.dnis[0] + self.dnis[1]))
+
+
+class CustomerQueryPlanTestCase(TestCase):
+    """
+    Seeds a realistic table and EXPLAINs the page queries of every filter/ordering
+    combination the list view exposes: none of them may scan a table sequentially
+    or sort explicitly. The page-number COUNT(*) is not a page query and is left out
+    """
+    customers = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        users = models.CustomerUser.objects.bulk_create(
+            models.CustomerUser(email='plan%d@example.com' % index, name='name', last_name='last_name')
+            for index in range(cls.customers)
+        )
+        models.Customer.objects.bulk_create(
+            models.Customer(user=user, sex_tape='Male', dni=30000000 + index, birth_date='2000-01-01T00:00:00Z')
+            for index, user in enumerate(users)
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE customer_customer SET created_at = now() - (id % 5000) * interval '1 hour'")
+            cursor.execute('ANALYZE customer_customer')
+            cursor.execute('ANALYZE customer_customeruser')
+
+        cls.wallet_id = str(models.Customer.objects.order_by('id').values_list('wallet_id', flat=True)[500])
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='planuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def get_page_query(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page_queries = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "customer_customer"' in query['sql'] and 'COUNT(*)' not in query['sql']
+        ]
+        self.assertEqual(len(page_queries), 1)
+        return response, page_queries[0]
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+            plan = cursor.fetchone()[0]
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+
+        nodes = []
+        pending = [plan[0]['Plan']]
+        while pending:
+            node = pending.pop()
+            nodes.append(node)
+            pending.extend(node.get('Plans', []))
+        return nodes
+
+    def assertIndexedPlan(self, params, sql):
+        """
+        Sorting the single row of a unique lookup is free, any other sort is not
+        """
+        nodes = self.explain(sql)
+        node_types = [node['Node Type'] for node in nodes]
+        sorts = [node for node in nodes if node['Node Type'] in ('Sort', 'Incremental Sort') and node['Plan Rows'] > 1]
+
+        message = '%s\n%s' % (params, node_types)
+        self.assertNotIn('Seq Scan', node_types, message)
+        self.assertEqual(sorts, [], message)
+
+    def test_list_query_plans_use_indexes(self):
+        orderings = [None, 'wallet_id', '-wallet_id', 'dni', '-dni', 'user__email', '-user__email']
+        filters = [{}, {'wallet_id': self.wallet_id}, {'dni': 30000500}, {'user__email': 'plan500@example.com'}]
+
+        for ordering in orderings:
+            for filter_params in filters:
+                for pagination in ('page', 'keyset'):
+                    params = dict(filter_params, pagination=pagination)
+                    if ordering:
+                        params['sortBy'] = ordering
+
+                    response, sql = self.get_page_query('/api/v1/customer/', params)
+                    self.assertIndexedPlan(params, sql)
+
+                    if pagination == 'keyset' and response.data['next']:
+                        _, sql = self.get_page_query(response.data['next'])
+                        self.assertIndexedPlan(params, sql)
+
+    def test_keyset_list_runs_only_the_page_query(self):
+        for params in ({}, {'sortBy': '-dni'}, {'dni': 30000500}):
+            params = dict(params, pagination='keyset')
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/api/v1/customer/', params)
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            customer_queries = [query['sql'] for query in context.captured_queries if '"customer_customer"' in query['sql']]
+            self.assertEqual(len(customer_queries), 1, params)
+            self.assertIn('LIMIT', customer_queries[0])
+            self.assertNotIn('MAX(', customer_queries[0])
@@ -1,7 +1,26 @@
+from django.conf import settings
 from django.urls import path
-from customer import views
+from customer import async_views, views
 
-urlpatterns = [
-    path('customer/', views.CustomerListCreateView.as_view(), name='customer-list-create'),
-    path('customer/<int:pk>', views.CustomerRetrieveUpdateDestroyView.as_view(), name='customer-retrieve-update-destroy'),
-]
+
+def customer_urlpatterns(async_views_enabled=False):
+    """
+    The list and detail endpoints are served by the async views when enabled, with the
+    same URLs and names
+    """
+    if async_views_enabled:
+        list_view = async_views.AsyncCustomerListCreateView
+        detail_view = async_views.AsyncCustomerRetrieveUpdateDestroyView
+    else:
+        list_view = views.CustomerListCreateView
+        detail_view = views.CustomerRetrieveUpdateDestroyView
+
+    return [
+        path('customer/', list_view.as_view(), name='customer-list-create'),
+        path('customer/bulk/', views.CustomerBulkView.as_view(), name='customer-bulk'),
+        path('customer/export/', views.CustomerExportView.as_view(), name='customer-export'),
+        path('customer/<int:pk>', detail_view.as_view(), name='customer-retrieve-update-destroy'),
+    ]
+
+
+urlpatterns = customer_urlpatterns(settings.CUSTOMER_ASYNC_VIEWS)
@@ -1,25 +1,114 @@
+from functools import partial
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import status
 from rest_framework.filters import OrderingFilter
-from rest_framework.generics import RetrieveUpdateDestroyAPIView, ListCreateAPIView
+from rest_framework.generics import GenericAPIView, RetrieveUpdateDestroyAPIView, ListCreateAPIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from challenge.query_budget import query_budget
+from customer import bulk, export, sharding
+from customer.cache import customer_cache
+from customer.conditional import (
+    PreconditionFailed, conditional_response, if_match_versions, make_etag, page_validators, version_etag
+)
 from customer.models import Customer
-from customer.serializers import CustomerSerializer
-from customer.pagination import CustomerListPagination
+from customer.serializers import (
+    CustomerSerializer, CustomerBulkCreateSerializer, CustomerBulkUpdateSerializer, CustomerReadSerializer,
+    requested_fields
+)
+from customer.pagination import CustomerListPagination, CustomerKeysetPagination
+from customer.renderers import NDJSONRenderer, CSVRenderer
 
+# Served by CustomerReadSerializer from values() rows
+READ_METHODS = ('GET', 'HEAD')
+
+@query_budget(get=2, put=4, patch=4, delete=4)
 class CustomerRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
-    queryset = Customer.objects.all()
+    queryset = Customer.objects.select_related('user')
     serializer_class = CustomerSerializer
     permission_classes = [IsAuthenticated]
+    # ?fields= of a GET read from the database, the cache holds every field
+    read_fields = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if sharding.enabled():
+            queryset = sharding.for_pk(queryset, self.kwargs['pk'])
+        if self.request.method in READ_METHODS:
+            queryset = CustomerReadSerializer.read_queryset(queryset, 'updated_at', 'version', fields=self.read_fields)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.request.method in READ_METHODS:
+            return CustomerReadSerializer
+        return super().get_serializer_class()
 
     def get_serializer(self, *args, **kwargs):
         kwargs['partial'] = True
         return super().get_serializer(*args, **kwargs)
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['if_match'] = if_match_versions(self.request)
+        context['fields'] = self.read_fields
+        return context
+
+    def load(self):
+        instance = self.get_object()
+        return {
+            'data': self.get_serializer(instance).data, 'updated_at': instance['updated_at'], 'version': instance['version']
+        }
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        ?fields= picks fields of the cached customer, or reads only their columns when
+        the cache is disabled
+        """
+        fields = requested_fields(request.query_params)
+        if fields is not None and customer_cache.timeout <= 0:
+            self.read_fields = fields
+            entry = self.load()
+        else:
+            entry = customer_cache.get(self.kwargs['pk'], self.load)
+
+        data = entry['data']
+        if fields is not None:
+            data = {name: data[name] for name in fields}
+        etag = version_etag(entry['version'], request.accepted_renderer.format, fields)
+        return conditional_response(request, etag, entry['updated_at'], lambda: Response(data))
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = version_etag(self.customer.version, request.accepted_renderer.format)
+        return response
+
+    def perform_update(self, serializer):
+        self.customer = serializer.save()
+
+    def perform_destroy(self, instance):
+        """
+        With If-Match the DELETE is conditional on the version, like the updates
+        """
+        if_match = if_match_versions(self.request)
+        if if_match is None:
+            instance.delete()
+        elif instance.version not in if_match or not (
+            Customer.objects.using(instance._state.db).filter(pk=instance.pk, version=instance.version).delete()[0]
+        ):
+            raise PreconditionFailed()
+
+@query_budget(get=3, post=5)
 class CustomerListCreateView(ListCreateAPIView):
     pagination_class = CustomerListPagination
-    queryset = Customer.objects.all()
+    keyset_pagination_class = CustomerKeysetPagination
+    queryset = Customer.objects.select_related('user')
     serializer_class = CustomerSerializer
     permission_classes = [IsAuthenticated]
+    # ?fields= of a GET, set by list()
+    read_fields = None
 
     filter_backends = [OrderingFilter, DjangoFilterBackend]
     ordering_fields = ['wallet_id', 'dni', 'user__email']
@@ -30,6 +119,189 @@ class CustomerListCreateView(ListCreateAPIView):
         'user__email': ['exact'],
     }
 
+    @property
+    def paginator(self):
+        """
+        '?pagination=keyset' opts into opaque next/previous cursors without a count
+        """
+        if not hasattr(self, '_paginator') and self.keyset():
+            self._paginator = self.keyset_pagination_class()
+        return super().paginator
+
+    def keyset(self):
+        return self.request.query_params.get('pagination') == 'keyset'
+
+    def get_queryset(self):
+        """
+        Reads select the columns of the ?fields= and of the ordering, which the
+        pagination cursors and the shard merge read, and those of the keyset page validators
+        """
+        queryset = super().get_queryset()
+        if self.request.method not in READ_METHODS:
+            return queryset
+        columns = ('updated_at', 'version') if self.keyset() else ()
+        if self.read_fields is None:
+            return CustomerReadSerializer.read_queryset(queryset, *columns)
+
+        ordering = [field.lstrip('-') for field in OrderingFilter().get_ordering(self.request, queryset, self)]
+        return CustomerReadSerializer.read_queryset(queryset, *ordering, *columns, fields=self.read_fields)
+
+    def get_serializer_class(self):
+        if self.request.method in READ_METHODS:
+            return CustomerReadSerializer
+        return super().get_serializer_class()
+
+    def filter_queryset(self, queryset):
+        """
+        Sharded customers are read from the shards the filters can match, and merged
+        """
+        queryset = super().filter_queryset(queryset)
+        if sharding.enabled():
+            return sharding.ShardedQuerySet(queryset, sharding.shards_for(self.request.query_params))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        The validator is max(updated_at) and the count of the filtered rows: one aggregate
+        instead of rendering the page. A delete does not move max(updated_at), so only
+        If-None-Match is evaluated, Last-Modified is informative. The paginator reuses the count
+        """
+        self.read_fields = requested_fields(request.query_params)
+        if self.keyset():
+            return self.keyset_list(request)
+
+        validators = self.filter_queryset(self.get_queryset()).aggregate(
+            last_modified=Max('updated_at'), count=Count('*')
+        )
+        last_modified = validators['last_modified']
+        etag = make_etag(
+            'customers', request.get_full_path(), request.accepted_renderer.format,
+            last_modified.isoformat() if last_modified else '', validators['count']
+        )
+        self.paginator.count = validators['count']
+        return conditional_response(
+            request, etag, last_modified, partial(super().list, request, *args, **kwargs), use_last_modified=False
+        )
+
+    def keyset_list(self, request):
+        """
+        A keyset page is validated by its own rows, read by the page query itself: an
+        aggregate over every filtered row would bring back the cost keyset pagination avoids
+        """
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        etag, last_modified = page_validators(
+            request, request.accepted_renderer.format, page, self.paginator.has_next, self.paginator.has_previous
+        )
+        return conditional_response(
+            request, etag, last_modified,
+            lambda: self.get_paginated_response(self.get_serializer(page, many=True).data), use_last_modified=False
+        )
+
     def get_serializer(self, *args, **kwargs):
         kwargs['partial'] = False
         return super().get_serializer(*args, **kwargs)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.read_fields
+        return context
+
+
+@query_budget(post=6, patch=9)
+class CustomerBulkView(GenericAPIView):
+    """
+    Creates (POST) or partially updates (PATCH) a JSON array of customers.
+    Results keep the request order, errors are indexed by position
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_serializer_class(self):
+        if self.request.method == 'PATCH':
+            return CustomerBulkUpdateSerializer
+        return CustomerBulkCreateSerializer
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if sharding.enabled():
+            raise sharding.ShardingNotSupported()
+
+    def validate_items(self, items):
+        bulk.validate_batch_size(items)
+
+        entries = {}
+        errors = {}
+
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                entries[index] = serializer.validated_data
+            else:
+                errors[index] = serializer.errors
+
+        return entries, errors
+
+    def get_bulk_response(self, items, done, errors, success_status):
+        results = [index in done and CustomerSerializer(done[index]).data or None for index in range(len(items))]
+
+        if not errors:
+            response_status = success_status
+        elif done:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response({'results': results, 'errors': dict(sorted(errors.items()))}, status=response_status)
+
+    def post(self, request):
+        entries, errors = self.validate_items(request.data)
+
+        if entries:
+            errors.update(bulk.validate_unique_batch(entries))
+            entries = {index: data for index, data in entries.items() if index not in errors}
+
+        created = bulk.create_batch(entries) if entries else {}
+
+        return self.get_bulk_response(request.data, created, errors, status.HTTP_201_CREATED)
+
+    def patch(self, request):
+        entries, errors = self.validate_items(request.data)
+        targets = {}
+
+        if entries:
+            targets, not_found = bulk.load_targets(entries)
+            errors.update(not_found)
+            errors.update(bulk.validate_unique_changes(targets, entries))
+            targets = {index: customer for index, customer in targets.items() if index not in errors}
+
+        updated = bulk.update_batch(targets, entries) if targets else {}
+
+        return self.get_bulk_response(request.data, updated, errors, status.HTTP_200_OK)
+
+
+class CustomerExportView(GenericAPIView):
+    """
+    Streams every customer as NDJSON or CSV (Accept header or '?format=ndjson|csv').
+    Rows are read lazily after the view returns, through a server-side cursor, so a query
+    budget could not see them. Under ASGI the blocks are streamed by an async iterator
+    """
+    queryset = Customer.objects.all()
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = CustomerListCreateView.filterset_fields
+
+    def get(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+        renderer = request.accepted_renderer
+
+        blocks = export.stream(queryset, renderer.format)
+        if isinstance(request._request, ASGIRequest):
+            blocks = export.aiterate(blocks)
+
+        response = StreamingHttpResponse(
+            blocks,
+            content_type='%s; charset=%s' % (renderer.media_type, renderer.charset)
+        )
+        response['Content-Disposition'] = 'attachment; filename="customers.%s"' % renderer.format
+        return response